@@ -0,0 +1,33 @@
+from typing import Any, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+class ResilientChatModel(BaseChatModel):
+    """LangChain chat model that sends every call through a ResilientLLM
+
+    LangChain agents need a BaseChatModel, so this adapter gives them one while their
+    reasoning and tool-call round trips still go through the scheduler, rate limiter,
+    retries, provider routing and usage metrics, under the agent's session.
+    """
+
+    llm: Any
+    session_id: Optional[str] = None
+
+    @property
+    def _llm_type(self):
+        return "resilient"
+
+    @property
+    def _identifying_params(self):
+        return {"model": self.llm.model_name}
+
+    def _kwargs(self, stop, kwargs):
+        return {**kwargs, "stop": stop} if stop else kwargs
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        response = self.llm.invoke(messages, self.session_id, **self._kwargs(stop, kwargs))
+        return ChatResult(generations=[ChatGeneration(message=response)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        response = await self.llm.ainvoke(messages, self.session_id, **self._kwargs(stop, kwargs))
+        return ChatResult(generations=[ChatGeneration(message=response)])
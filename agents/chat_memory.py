@@ -0,0 +1,17 @@
+from langchain.memory import ConversationBufferWindowMemory
+
+class BoundedChatMemory(ConversationBufferWindowMemory):
+    """Window memory that also drops the oldest exchanges once the history exceeds a token budget
+    
+    Tokens are estimated at four characters each, so no tokenizer or API call is needed.
+    The latest exchange is always kept.
+    """
+    max_token_limit: int = 4000
+
+    def save_context(self, inputs, outputs):
+        super().save_context(inputs, outputs)
+        messages = self.chat_memory.messages
+        if len(messages) > 2 * self.k:
+            del messages[:len(messages) - 2 * self.k]
+        while len(messages) > 2 and sum(len(str(m.content)) for m in messages) // 4 > self.max_token_limit:
+            del messages[:2]
@@ -0,0 +1,237 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from config.settings import settings
+from utils.metrics import instrumented
+
+JOB_STATES = ("queued", "running", "done", "failed", "cancelled")
+
+# A job whose worker died this many times is left alone rather than crash another worker
+MAX_ATTEMPTS = 3
+
+_local_workers = []
+_local_workers_lock = threading.Lock()
+
+def _db_path():
+    return os.path.join(settings.CACHE_FOLDER, "jobs.sqlite3")
+
+def _connect():
+    settings.ensure_folders()
+    conn = sqlite3.connect(_db_path(), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            session_id TEXT,
+            status TEXT NOT NULL,
+            result_filename TEXT,
+            error TEXT,
+            worker_id TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            heartbeat_at REAL
+        )"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_session ON jobs(session_id, created_at)")
+    return conn
+
+def _row_to_job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    return job
+
+def submit_job(kind, payload, session_id=None):
+    """Queue a generation job and return its id
+    
+    kind is "topic" (payload: topic, language) or "pdf" (payload: file_path, upload_name).
+    Both accept an optional "regenerate" flag. The note filename is fixed at submit time
+    and stored as result_filename, so callers can find the note once the job is done.
+    """
+    if kind not in ("topic", "pdf"):
+        raise ValueError(f"Unknown job kind: {kind}")
+    
+    # Imported here so workers started without Streamlit do not pay for it at import time
+    from utils.file_handler import topic_note_filename, pdf_note_filename
+    if kind == "topic":
+        filename = topic_note_filename(payload["language"], payload["topic"])
+    else:
+        filename = pdf_note_filename(payload["upload_name"])
+    
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute(
+            """INSERT INTO jobs (id, kind, payload, session_id, status, result_filename, created_at, updated_at)
+               VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)""",
+            (job_id, kind, json.dumps(payload), session_id, filename, now, now),
+        )
+    finally:
+        conn.close()
+    return job_id
+
+def get_job(job_id):
+    """Return a job as a dict, or None if it does not exist"""
+    conn = _connect()
+    try:
+        return _row_to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+    finally:
+        conn.close()
+
+def list_jobs(session_id=None, limit=20):
+    """Return the most recent jobs, optionally only those submitted by one session"""
+    conn = _connect()
+    try:
+        if session_id is None:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+        else:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE session_id = ? ORDER BY created_at DESC LIMIT ?", (session_id, limit)
+            )
+        return [_row_to_job(row) for row in rows]
+    finally:
+        conn.close()
+
+def cancel_job(job_id):
+    """Cancel a job that has not started yet; returns True if it was cancelled"""
+    conn = _connect()
+    try:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id),
+        )
+        return cursor.rowcount == 1
+    finally:
+        conn.close()
+
+def claim_next_job(worker_id):
+    """Atomically move the oldest runnable job to running and return it
+    
+    Running jobs whose heartbeat is older than JOB_STALE_AFTER seconds belonged to a
+    worker that died, and are picked up again; after MAX_ATTEMPTS such restarts they
+    are marked failed instead.
+    """
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            """UPDATE jobs SET status = 'failed', error = ?, updated_at = ?
+               WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?""",
+            (f"Worker stopped responding {MAX_ATTEMPTS} times; giving up", now, now - settings.JOB_STALE_AFTER, MAX_ATTEMPTS),
+        )
+        row = conn.execute(
+            """SELECT * FROM jobs
+               WHERE status = 'queued' OR (status = 'running' AND heartbeat_at < ? AND attempts < ?)
+               ORDER BY created_at LIMIT 1""",
+            (now - settings.JOB_STALE_AFTER, MAX_ATTEMPTS),
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            """UPDATE jobs SET status = 'running', worker_id = ?, attempts = attempts + 1,
+               heartbeat_at = ?, updated_at = ? WHERE id = ?""",
+            (worker_id, now, now, row["id"]),
+        )
+        conn.execute("COMMIT")
+        return get_job(row["id"])
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+def _update_job(job_id, **fields):
+    fields["updated_at"] = time.time()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    conn = _connect()
+    try:
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+    finally:
+        conn.close()
+
+def _heartbeat(job_id, stop_event):
+    while not stop_event.wait(settings.JOB_STALE_AFTER / 4):
+        try:
+            _update_job(job_id, heartbeat_at=time.time())
+        except sqlite3.Error as e:
+            # A missed beat is fine; the next one is due well before the job counts as stale
+            print(f"Job {job_id} heartbeat failed: {e}")
+
+@instrumented("job.run")
+def run_job(job):
+    """Generate the notes for a claimed job and save them under its result_filename"""
+    from agents.note_agent import generate_notes_from_topic, generate_sectioned_notes, generate_notes_from_pdf, remember_pdf_content
+    from utils.file_handler import save_note_content
+    from utils.pdf_extractor import extract_pdf_text
+    
+    payload = job["payload"]
+    regenerate = payload.get("regenerate", False)
+    if job["kind"] == "topic":
+        generate = generate_sectioned_notes if payload.get("sectioned") else generate_notes_from_topic
+        notes = generate(payload["topic"], payload["language"], regenerate=regenerate, session_id=job["session_id"])
+        save_note_content(notes, job["result_filename"], payload["language"], payload["topic"], "topic")
+    else:
+        content = extract_pdf_text(payload["file_path"])
+        remember_pdf_content(content, payload["upload_name"])
+        notes = generate_notes_from_pdf(
+            content, topic=payload.get("topic"), regenerate=regenerate, session_id=job["session_id"])
+        save_note_content(notes, job["result_filename"], topic=payload["upload_name"], source_type="pdf")
+
+def process_job(job):
+    """Run a claimed job, keeping its heartbeat fresh and recording the outcome"""
+    stop_event = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job["id"], stop_event), daemon=True)
+    heartbeat.start()
+    try:
+        run_job(job)
+        _update_job(job["id"], status="done", error=None)
+    except Exception as e:
+        _update_job(job["id"], status="failed", error=str(e))
+    finally:
+        stop_event.set()
+
+def run_worker(worker_id=None, stop_event=None):
+    """Claim and run jobs until stop_event is set
+    
+    Database errors (such as "database is locked") are logged and retried with
+    exponential backoff instead of ending the worker.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    stop_event = stop_event or threading.Event()
+    failures = 0
+    while not stop_event.is_set():
+        try:
+            job = claim_next_job(worker_id)
+            if job is not None:
+                process_job(job)
+            failures = 0
+        except sqlite3.Error as e:
+            failures += 1
+            delay = min(settings.JOB_POLL_INTERVAL * 2 ** failures, 60)
+            print(f"Job worker {worker_id}: {e}; retrying in {delay:.1f}s")
+            stop_event.wait(delay)
+            continue
+        if job is None:
+            stop_event.wait(settings.JOB_POLL_INTERVAL)
+
+def start_local_workers(count=None):
+    """Start background worker threads in this process once; later calls are no-ops"""
+    count = settings.JOB_LOCAL_WORKERS if count is None else count
+    with _local_workers_lock:
+        while len(_local_workers) < count:
+            worker = threading.Thread(target=run_worker, name=f"note-job-worker-{len(_local_workers)}", daemon=True)
+            worker.start()
+            _local_workers.append(worker)
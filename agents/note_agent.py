@@ -1,102 +1,306 @@
-from langchain.agents import AgentType, initialize_agent, Tool
-from langchain.memory import ConversationBufferMemory
-from tools.note_generator import NoteGeneratorTool
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tools.note_template import get_note_sections, fill_note_template, split_note_sections
 from config.settings import settings
+from agents.rate_limit import ResilientLLM, TokenBucket
+from agents.scheduler import DEFAULT_SESSION
+from agents.providers import Provider, ProviderRouter, configured_providers, provider_model, create_openai_compatible_model
+from utils.response_cache import get_response_cache, make_cache_key, content_hash
+from utils.text_processor import split_into_chunks
+from utils.pdf_retriever import retrieve_relevant_chunks
+from utils.metrics import instrumented, record_cache, log_event, timed
 
-# Import Google Gemini only
-from langchain_google_genai import ChatGoogleGenerativeAI
-from google.generativeai import list_models
-import google.generativeai as genai
+# LangChain, the provider SDKs and the agent tools are imported on first use: together
+# they take over a second to load, which every cold start of the app would otherwise pay
+
+# Look for free models in order of preference
+PREFERRED_MODELS = [
+    "models/gemini-2.5-flash",  # Most recent free model
+    "models/gemini-1.0-pro",    # Older free model
+    "models/gemini-pro"         # Older free model
+]
+
+# Process-wide client state shared by every session
+_genai_configured = False
+_resolved_model = None
+_resolved_at = 0.0
+_llm_registry = {}
+_registry_lock = threading.RLock()
+# The Gemini request quota is per project, so every Gemini model shares one bucket
+_token_bucket = TokenBucket(settings.LLM_REQUESTS_PER_MINUTE, settings.LLM_BURST or None)
+# Rate limits are applied per provider by the router, not around it
+_unlimited_bucket = TokenBucket(0)
+# Chat agents are kept per session, least recently used first
+_agent_cache = OrderedDict()
+_agent_cache_lock = threading.Lock()
+
+def _configure_genai():
+    """Configure the Google client once per process"""
+    global _genai_configured
+    if not _genai_configured:
+        import google.generativeai as genai
+        genai.configure(api_key=settings.GOOGLE_API_KEY)
+        _genai_configured = True
 
 def get_available_models():
     """Get available models in the Google AI Studio project"""
-    genai.configure(api_key=settings.GOOGLE_API_KEY)
+    import google.generativeai as genai
+    _configure_genai()
     models = []
     for model in genai.list_models():
         if 'generateContent' in model.supported_generation_methods:
             models.append(model.name)
     return models
 
-def get_llm():
-    """Get Google Gemini LLM with the most suitable available model"""
-    genai.configure(api_key=settings.GOOGLE_API_KEY)
+def resolve_model_name():
+    """Return the model to use, reusing the last discovery until MODEL_CACHE_TTL expires"""
+    global _resolved_model, _resolved_at
     
-    # Get available models
-    available_models = get_available_models()
+    if settings.GEMINI_MODEL:
+        return settings.GEMINI_MODEL
     
-    # Look for free models in order of preference
-    preferred_models = [
-        "models/gemini-2.5-flash",  # Most recent free model
-        "models/gemini-1.0-pro",    # Older free model
-        "models/gemini-pro"         # Older free model
-    ]
+    with _registry_lock:
+        if _resolved_model and time.monotonic() - _resolved_at < settings.MODEL_CACHE_TTL:
+            return _resolved_model
+        
+        # Get available models
+        with timed("llm.list_models"):
+            available_models = get_available_models()
+        
+        # Find the first available preferred model
+        model_to_use = None
+        for preferred_model in PREFERRED_MODELS:
+            if preferred_model in available_models:
+                model_to_use = preferred_model
+                break
+        
+        # If none of the preferred models are available, use the first available one
+        if model_to_use is None and available_models:
+            model_to_use = available_models[0]
+            print(f"Using available model: {model_to_use}")
+        elif model_to_use is None:
+            raise ValueError("No suitable models found for generateContent in your Google AI Studio project")
+        
+        print(f"Using model: {model_to_use}")
+        log_event("model_resolved", model=model_to_use, candidates=len(available_models))
+        
+        _resolved_model = model_to_use
+        _resolved_at = time.monotonic()
+        return model_to_use
+
+def current_model_label():
+    """Identify the configured models, e.g. for cache keys; just the Gemini model when it is the only provider"""
+    names = configured_providers()
+    if names == ["google"]:
+        return resolve_model_name()
+    return ",".join(
+        f"{name}:{resolve_model_name() if name == 'google' else provider_model(name)}" for name in names
+    )
+
+def _create_provider(name, temperature):
+    if name == "google":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        _configure_genai()
+        model = resolve_model_name()
+        chat_model = ChatGoogleGenerativeAI(
+            google_api_key=settings.GOOGLE_API_KEY,
+            model=model,
+            temperature=temperature,
+            timeout=settings.LLM_PROVIDER_TIMEOUT
+        )
+        return Provider(name, model, chat_model, _token_bucket)
+    model = provider_model(name)
+    return Provider(name, model, create_openai_compatible_model(name, model, temperature))
+
+def get_llm(temperature=None):
+    """Get a shared LLM client that routes between the configured providers
     
-    # Find the first available preferred model
-    model_to_use = None
-    for preferred_model in preferred_models:
-        if preferred_model in available_models:
-            model_to_use = preferred_model
-            break
+    Calls go to the fastest healthy provider and fall back to the others on errors
+    (see ProviderRouter). The router is wrapped in ResilientLLM, so calls are also
+    scheduled, retried on transient errors and coalesced when identical prompts overlap.
+    """
+    if temperature is None:
+        temperature = settings.LLM_TEMPERATURE
     
-    # If none of the preferred models are available, use the first available one
-    if model_to_use is None and available_models:
-        model_to_use = available_models[0]
-        print(f"Using available model: {model_to_use}")
-    elif model_to_use is None:
-        raise ValueError("No suitable models found for generateContent in your Google AI Studio project")
+    key = (current_model_label(), temperature)
     
-    print(f"Using model: {model_to_use}")
+    with _registry_lock:
+        llm = _llm_registry.get(key)
+        if llm is None:
+            llm = ResilientLLM(
+                ProviderRouter([_create_provider(name, temperature) for name in configured_providers()]),
+                _unlimited_bucket,
+                max_retries=settings.LLM_MAX_RETRIES,
+                backoff_base=settings.LLM_BACKOFF_BASE,
+                backoff_max=settings.LLM_BACKOFF_MAX,
+                coalesce=settings.LLM_COALESCE_REQUESTS
+            )
+            _llm_registry[key] = llm
     
-    return ChatGoogleGenerativeAI(
-        google_api_key=settings.GOOGLE_API_KEY,
-        model=model_to_use,
-        temperature=0.7  # Good for note generation
-    )
+    return llm
 
-def create_note_agent():
-    """Create the note-taking agent"""
+def invalidate_llm_cache():
+    """Forget the discovered model and drop cached clients so the next call re-resolves"""
+    global _resolved_model, _resolved_at
+    with _registry_lock:
+        _resolved_model = None
+        _resolved_at = 0.0
+        _llm_registry.clear()
+    with _agent_cache_lock:
+        _agent_cache.clear()
+
+@instrumented("agent.create")
+def create_note_agent(session_id=None):
+    """Create the note-taking chat agent, wired to the real generation and extraction tools"""
+    from langchain.agents import AgentType, initialize_agent
+    from langchain_core.prompts import MessagesPlaceholder
+    from agents.agent_model import ResilientChatModel
+    from agents.chat_memory import BoundedChatMemory
+    from tools.note_generator import NoteGeneratorTool
+    from tools.pdf_processor import PDFProcessorTool, PDFNoteGeneratorTool
     
-    # Initialize LLM
-    llm = get_llm()
+    # LangChain agents need a chat model; the adapter keeps their calls on the scheduler and rate limits
+    llm = ResilientChatModel(llm=get_llm(), session_id=session_id)
     
-    # Create tools
     tools = [
-        Tool(
-            name="note_generator",
-            func=lambda x: f"Generating notes for: {x}",
-            description="Use this to generate comprehensive notes for any programming language or subject"
-        ),
-        Tool(
-            name="pdf_processor",
-            func=lambda x: f"Processing PDF: {x}",
-            description="Use this to process PDF files and extract content for note generation"
-        )
+        NoteGeneratorTool(session_id=session_id),
+        PDFNoteGeneratorTool(session_id=session_id),
+        PDFProcessorTool(session_id=session_id),
     ]
     
-    # Add custom tools
-    tools.append(NoteGeneratorTool())
-    
-    # Initialize memory
-    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+    # Only the last few turns, within a token budget, are sent with each request
+    memory = BoundedChatMemory(
+        memory_key="chat_history",
+        return_messages=True,
+        k=settings.AGENT_MEMORY_TURNS,
+        max_token_limit=settings.AGENT_MEMORY_TOKENS
+    )
     
-    # Create agent
+    # Structured chat works with any chat model and supports multi-input tools
     agent = initialize_agent(
         tools=tools,
         llm=llm,
-        agent=AgentType.OPENAI_FUNCTIONS,
+        agent=AgentType.STRUCTURED_CHAT_ZERO_SHOT_REACT_DESCRIPTION,
         verbose=True,
         memory=memory,
-        handle_parsing_errors=True
+        handle_parsing_errors=True,
+        max_iterations=settings.AGENT_MAX_ITERATIONS,
+        agent_kwargs={
+            "memory_prompts": [MessagesPlaceholder(variable_name="chat_history")],
+            "input_variables": ["input", "agent_scratchpad", "chat_history"],
+        }
     )
     
     return agent
 
-def generate_notes_from_topic(topic, language):
-    """Generate comprehensive notes for a specific topic and language"""
+def get_note_agent(session_id=None):
+    """Return the session's chat agent, creating it on first use
+    
+    At most AGENT_CACHE_SIZE agents are kept; the least recently used one is dropped first.
+    """
+    key = session_id or DEFAULT_SESSION
+    with _agent_cache_lock:
+        agent = _agent_cache.get(key)
+        if agent is not None:
+            _agent_cache.move_to_end(key)
+            return agent
+    
+    agent = create_note_agent(session_id)
+    with _agent_cache_lock:
+        agent = _agent_cache.setdefault(key, agent)
+        _agent_cache.move_to_end(key)
+        while len(_agent_cache) > settings.AGENT_CACHE_SIZE:
+            _agent_cache.popitem(last=False)
+    return agent
+
+def reset_note_agent(session_id=None):
+    """Forget a session's chat agent and its conversation"""
+    with _agent_cache_lock:
+        _agent_cache.pop(session_id or DEFAULT_SESSION, None)
+
+@instrumented("agent.turn")
+def chat_with_agent(message, session_id=None):
+    """Send one chat turn to the session's agent and return its answer"""
+    return get_note_agent(session_id).invoke({"input": message})["output"]
+
+@instrumented("agent.turn")
+async def achat_with_agent(message, session_id=None):
+    """Async counterpart of chat_with_agent"""
+    agent = await asyncio.to_thread(get_note_agent, session_id)
+    result = await agent.ainvoke({"input": message})
+    return result["output"]
+
+def _topic_cache_key(topic, language):
+    return make_cache_key("topic", current_model_label(), settings.LLM_TEMPERATURE, topic=topic, language=language)
+
+def _pdf_cache_key(pdf_content, topic=None):
+    return make_cache_key("pdf", current_model_label(), settings.LLM_TEMPERATURE, content=content_hash(pdf_content), topic=topic)
+
+def _chunk_cache_key(chunk, topic=None):
+    return make_cache_key("pdf_chunk", current_model_label(), settings.LLM_TEMPERATURE, content=content_hash(chunk), topic=topic)
+
+def _section_cache_key(topic, language, section):
+    return make_cache_key("note_section", current_model_label(), settings.LLM_TEMPERATURE, topic=topic, language=language, section=section)
+
+def _cache_lookup(cache_key, regenerate=False):
+    """Return a cached response, or None on a miss, when regenerating or with caching disabled"""
+    if not settings.RESPONSE_CACHE_ENABLED or regenerate:
+        return None
+    cached = get_response_cache().get(cache_key)
+    record_cache("response", cached is not None)
+    return cached
+
+def _cache_store(cache_key, content):
+    if settings.RESPONSE_CACHE_ENABLED:
+        get_response_cache().set(cache_key, content)
+
+def _cached_invoke(cache_key, prompt, regenerate=False, session_id=None):
+    """Invoke the LLM unless an identical request is already cached"""
+    cached = _cache_lookup(cache_key, regenerate)
+    if cached is not None:
+        return cached
+    
+    llm = get_llm()
+    response = llm.invoke(prompt, session_id=session_id)
+    
+    _cache_store(cache_key, response.content)
+    return response.content
+
+async def _acached_invoke(cache_key, prompt, regenerate=False, session_id=None):
+    """Async counterpart of _cached_invoke"""
+    cached = _cache_lookup(cache_key, regenerate)
+    if cached is not None:
+        return cached
+    
+    llm = await asyncio.to_thread(get_llm)
+    response = await llm.ainvoke(prompt, session_id=session_id)
+    
+    _cache_store(cache_key, response.content)
+    return response.content
+
+def _cached_stream(cache_key, prompt, regenerate=False, session_id=None):
+    """Stream the LLM response chunk by chunk, caching the full text once the stream completes"""
+    cached = _cache_lookup(cache_key, regenerate)
+    if cached is not None:
+        yield cached
+        return
     
     llm = get_llm()
+    parts = []
+    for chunk in llm.stream(prompt, session_id=session_id):
+        if chunk.content:
+            parts.append(chunk.content)
+            yield chunk.content
     
-    prompt = f"""
+    # Only a fully received response is worth caching
+    _cache_store(cache_key, "".join(parts))
+
+def build_topic_prompt(topic, language):
+    """Build the note-generation prompt for a topic"""
+    return f"""
     Create comprehensive notes for {language} covering the topic: {topic}.
     Include:
     - Introduction and basic concepts
@@ -110,20 +314,26 @@ def generate_notes_from_topic(topic, language):
     
     Format the notes in markdown with proper headings and structure.
     """
-    
-    response = llm.invoke(prompt)
-    return response.content
 
-def generate_notes_from_pdf(pdf_content, topic=None):
-    """Generate notes from PDF content"""
+def build_section_prompt(topic, language, heading):
+    """Build the prompt for one section of the note template"""
+    return f"""
+    You are writing the "{heading}" section of comprehensive study notes on "{topic}" in {language}.
+    Write only the body of this section; the other sections are written separately, so do not
+    repeat their material and do not add the section heading, an introduction to the whole note or a conclusion.
+    Use ### or smaller headings, bullet points and code examples where helpful.
+    If the section does not apply to this topic, say so in one sentence.
     
-    llm = get_llm()
-    
-    prompt = f"""
+    Format the section in markdown.
+    """
+
+def build_pdf_prompt(pdf_content, topic=None):
+    """Build the note-generation prompt for extracted PDF content"""
+    return f"""
     Create comprehensive notes from the following PDF content:
     {pdf_content}
     
-    If a specific topic is mentioned, focus on that topic. Otherwise, create general notes covering the main concepts.
+    {f"Focus on this topic: {topic}." if topic else "Create general notes covering the main concepts."}
     Include:
     - Main concepts and theories
     - Key definitions
@@ -133,6 +343,295 @@ def generate_notes_from_pdf(pdf_content, topic=None):
     
     Format the notes in markdown with proper headings and structure.
     """
+
+def build_chunk_prompt(chunk, index, total, topic=None):
+    """Build the map-step prompt that condenses one chunk of a large PDF"""
+    focus = f"Pay particular attention to anything about: {topic}.\n" if topic else ""
+    return f"""
+    The following is part {index} of {total} of a larger document.
+    Summarize it into concise markdown study notes that keep:
+    - Main concepts and theories
+    - Key definitions
+    - Important examples
+    {focus}
+    Do not add an introduction or conclusion; these notes will be merged with the other parts.
+    
+    Content:
+    {chunk}
+    """
+
+def build_reduce_prompt(chunk_summaries, topic=None):
+    """Build the reduce-step prompt that merges chunk summaries into one note"""
+    sections = "\n\n".join(
+        f"### Part {i}\n{summary}" for i, summary in enumerate(chunk_summaries, 1)
+    )
+    return build_pdf_prompt(sections, topic)
+
+def build_retrieval_prompt(sections, topic):
+    """Build the prompt for topic-focused notes from the PDF excerpts most relevant to the topic"""
+    excerpts = "\n\n".join(f"### Excerpt {position + 1}\n{text}" for position, text in sections)
+    return f"""
+    The following excerpts were selected from a larger document because they relate to: {topic}
+    {excerpts}
+    
+    Create comprehensive notes on "{topic}" using only these excerpts.
+    Include:
+    - Main concepts and theories
+    - Key definitions
+    - Important examples
+    - Key takeaways
+    
+    Format the notes in markdown with proper headings and structure.
+    """
+
+@instrumented("pdf.map")
+def summarize_pdf_chunks(chunks, topic=None, regenerate=False, progress_callback=None, session_id=None):
+    """Summarize chunks concurrently, keeping at most PDF_MAP_CONCURRENCY requests in flight
+    
+    progress_callback, if given, is called as progress_callback(completed, total) on the
+    calling thread after each chunk finishes. Summaries are returned in document order.
+    """
+    total = len(chunks)
+    summaries = [None] * total
+    
+    with ThreadPoolExecutor(max_workers=max(1, settings.PDF_MAP_CONCURRENCY)) as executor:
+        futures = {}
+        for i, chunk in enumerate(chunks):
+            prompt = build_chunk_prompt(chunk, i + 1, total, topic)
+            future = executor.submit(_cached_invoke, _chunk_cache_key(chunk, topic), prompt, regenerate, session_id)
+            futures[future] = i
+        
+        completed = 0
+        for future in as_completed(futures):
+            summaries[futures[future]] = future.result()
+            completed += 1
+            if progress_callback:
+                progress_callback(completed, total)
+    
+    return summaries
+
+@instrumented("pdf.map")
+async def asummarize_pdf_chunks(chunks, topic=None, regenerate=False, progress_callback=None, session_id=None):
+    """Async counterpart of summarize_pdf_chunks"""
+    total = len(chunks)
+    limit = asyncio.Semaphore(max(1, settings.PDF_MAP_CONCURRENCY))
+    completed = 0
+    
+    async def summarize(i, chunk):
+        nonlocal completed
+        async with limit:
+            prompt = build_chunk_prompt(chunk, i + 1, total, topic)
+            summary = await _acached_invoke(_chunk_cache_key(chunk, topic), prompt, regenerate, session_id)
+        completed += 1
+        if progress_callback:
+            progress_callback(completed, total)
+        return summary
+    
+    return list(await asyncio.gather(*(summarize(i, chunk) for i, chunk in enumerate(chunks))))
+
+def _needs_another_reduce(summaries):
+    """Very large documents can produce more summary text than fits in one prompt"""
+    return len(summaries) > 1 and sum(len(summary) for summary in summaries) > settings.PDF_CHUNK_SIZE
+
+def _regroup_summaries(summaries):
+    return split_into_chunks("\n\n".join(summaries), settings.PDF_CHUNK_SIZE, 0)
+
+def _reduce_pdf_content(pdf_content, topic=None, regenerate=False, progress_callback=None, session_id=None):
+    """Condense a PDF too large for one prompt into a reduce prompt built from chunk summaries"""
+    chunks = split_into_chunks(pdf_content, settings.PDF_CHUNK_SIZE, settings.PDF_CHUNK_OVERLAP)
+    summaries = summarize_pdf_chunks(chunks, topic, regenerate, progress_callback, session_id)
+    
+    while _needs_another_reduce(summaries):
+        merged = _regroup_summaries(summaries)
+        if len(merged) >= len(summaries):
+            break
+        summaries = summarize_pdf_chunks(merged, topic, regenerate, session_id=session_id)
+    
+    return build_reduce_prompt(summaries, topic)
+
+async def _areduce_pdf_content(pdf_content, topic=None, regenerate=False, progress_callback=None, session_id=None):
+    """Async counterpart of _reduce_pdf_content"""
+    chunks = split_into_chunks(pdf_content, settings.PDF_CHUNK_SIZE, settings.PDF_CHUNK_OVERLAP)
+    summaries = await asummarize_pdf_chunks(chunks, topic, regenerate, progress_callback, session_id)
+    
+    while _needs_another_reduce(summaries):
+        merged = _regroup_summaries(summaries)
+        if len(merged) >= len(summaries):
+            break
+        summaries = await asummarize_pdf_chunks(merged, topic, regenerate, session_id=session_id)
+    
+    return build_reduce_prompt(summaries, topic)
+
+@instrumented("pdf.retrieve")
+def _focused_pdf_prompt(pdf_content, topic):
+    """Prompt built from only the chunks relevant to topic, or None when there is nothing to focus on"""
+    if not topic:
+        return None
+    try:
+        sections = retrieve_relevant_chunks(pdf_content, topic)
+    except Exception as e:
+        print(f"Warning: PDF retrieval failed: {e}")
+        return None
+    return build_retrieval_prompt(sections, topic) if sections else None
+
+def find_existing_notes(topic, language, k=3):
+    """Existing notes that already cover a topic, to check before paying for a generation"""
+    if not settings.SEMANTIC_INDEX_ENABLED:
+        return []
+    try:
+        from utils.semantic_index import find_similar_notes
+        return find_similar_notes(f"{language} {topic}", k)
+    except Exception as e:
+        print(f"Similar note lookup skipped: {e}")
+        return []
+
+def remember_pdf_content(pdf_content, title=None):
+    """Add a processed PDF's chunks to the semantic index so related notes can point at it"""
+    if not settings.SEMANTIC_INDEX_ENABLED:
+        return
+    try:
+        from utils.semantic_index import index_pdf_chunks
+        chunks = split_into_chunks(pdf_content, settings.PDF_CHUNK_SIZE, settings.PDF_CHUNK_OVERLAP)
+        index_pdf_chunks(content_hash(pdf_content), chunks, title)
+    except Exception as e:
+        print(f"Semantic index not updated: {e}")
+
+@instrumented("generate.topic")
+def generate_notes_from_topic(topic, language, regenerate=False, session_id=None):
+    """Generate comprehensive notes for a specific topic and language
+    
+    Identical requests are answered from the response cache unless regenerate is True.
+    """
+    prompt = build_topic_prompt(topic, language)
+    return _cached_invoke(_topic_cache_key(topic, language), prompt, regenerate, session_id)
+
+@instrumented("generate.topic")
+async def agenerate_notes_from_topic(topic, language, regenerate=False, session_id=None):
+    """Async counterpart of generate_notes_from_topic"""
+    prompt = build_topic_prompt(topic, language)
+    return await _acached_invoke(_topic_cache_key(topic, language), prompt, regenerate, session_id)
+
+@instrumented("generate.pdf")
+def generate_notes_from_pdf(pdf_content, topic=None, regenerate=False, progress_callback=None, session_id=None):
+    """Generate notes from PDF content
+    
+    Content longer than PDF_CHUNK_SIZE is either narrowed down to the chunks most relevant
+    to topic, or, without a topic (or a match), summarized chunk by chunk and the summaries
+    merged into one note. Identical requests are answered from the response cache unless
+    regenerate is True.
+    """
+    cache_key = _pdf_cache_key(pdf_content, topic)
+    if len(pdf_content) <= settings.PDF_CHUNK_SIZE:
+        return _cached_invoke(cache_key, build_pdf_prompt(pdf_content, topic), regenerate, session_id)
+    
+    cached = _cache_lookup(cache_key, regenerate)
+    if cached is not None:
+        return cached
+    
+    prompt = _focused_pdf_prompt(pdf_content, topic)
+    if prompt is None:
+        prompt = _reduce_pdf_content(pdf_content, topic, regenerate, progress_callback, session_id)
+    return _cached_invoke(cache_key, prompt, True, session_id)
+
+@instrumented("generate.pdf")
+async def agenerate_notes_from_pdf(pdf_content, topic=None, regenerate=False, progress_callback=None, session_id=None):
+    """Async counterpart of generate_notes_from_pdf"""
+    cache_key = _pdf_cache_key(pdf_content, topic)
+    if len(pdf_content) <= settings.PDF_CHUNK_SIZE:
+        return await _acached_invoke(cache_key, build_pdf_prompt(pdf_content, topic), regenerate, session_id)
+    
+    cached = _cache_lookup(cache_key, regenerate)
+    if cached is not None:
+        return cached
+    
+    prompt = await asyncio.to_thread(_focused_pdf_prompt, pdf_content, topic)
+    if prompt is None:
+        prompt = await _areduce_pdf_content(pdf_content, topic, regenerate, progress_callback, session_id)
+    return await _acached_invoke(cache_key, prompt, True, session_id)
+
+def _note_title(topic, language):
+    return f"{topic} ({language})"
+
+def generate_note_section(topic, language, section, regenerate=False, session_id=None):
+    """Generate the body of one template section, cached independently of the other sections"""
+    heading = dict(get_note_sections())[section]
+    prompt = build_section_prompt(topic, language, heading)
+    return _cached_invoke(_section_cache_key(topic, language, section), prompt, regenerate, session_id)
+
+@instrumented("generate.sections")
+def generate_sectioned_notes(topic, language, regenerate=False, progress_callback=None, session_id=None):
+    """Generate notes by filling every template section with its own concurrent LLM call
+    
+    Wall-clock time is bounded by the slowest section rather than the sum of all of them.
+    progress_callback, if given, is called as progress_callback(completed, total) on the
+    calling thread after each section finishes.
+    """
+    sections = get_note_sections()
+    bodies = {}
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(len(sections), settings.NOTE_SECTION_CONCURRENCY))) as executor:
+        futures = {
+            executor.submit(generate_note_section, topic, language, key, regenerate, session_id): key
+            for key, _ in sections
+        }
+        for completed, future in enumerate(as_completed(futures), 1):
+            bodies[futures[future]] = future.result()
+            if progress_callback:
+                progress_callback(completed, len(sections))
+    
+    return fill_note_template(_note_title(topic, language), bodies)
+
+@instrumented("generate.sections")
+async def agenerate_sectioned_notes(topic, language, regenerate=False, progress_callback=None, session_id=None):
+    """Async counterpart of generate_sectioned_notes"""
+    sections = get_note_sections()
+    limit = asyncio.Semaphore(max(1, settings.NOTE_SECTION_CONCURRENCY))
+    completed = 0
+    
+    async def generate(key, heading):
+        nonlocal completed
+        async with limit:
+            prompt = build_section_prompt(topic, language, heading)
+            body = await _acached_invoke(_section_cache_key(topic, language, key), prompt, regenerate, session_id)
+        completed += 1
+        if progress_callback:
+            progress_callback(completed, len(sections))
+        return key, body
+    
+    bodies = dict(await asyncio.gather(*(generate(key, heading) for key, heading in sections)))
+    return fill_note_template(_note_title(topic, language), bodies)
+
+@instrumented("generate.section")
+def regenerate_note_section(note, topic, language, section, session_id=None):
+    """Regenerate one section of a sectioned note, keeping the other sections (including edits) as they are"""
+    bodies = split_note_sections(note)
+    bodies[section] = generate_note_section(topic, language, section, regenerate=True, session_id=session_id)
+    return fill_note_template(_note_title(topic, language), bodies)
+
+@instrumented("generate.topic")
+def stream_notes_from_topic(topic, language, regenerate=False, session_id=None):
+    """Stream notes for a topic and language as they are generated"""
+    prompt = build_topic_prompt(topic, language)
+    yield from _cached_stream(_topic_cache_key(topic, language), prompt, regenerate, session_id)
+
+@instrumented("generate.pdf")
+def stream_notes_from_pdf(pdf_content, topic=None, regenerate=False, progress_callback=None, session_id=None):
+    """Stream notes from PDF content as they are generated
+    
+    For large PDFs the relevant chunks are retrieved, or the chunk summaries produced, first
+    and only the final generation is streamed.
+    """
+    cache_key = _pdf_cache_key(pdf_content, topic)
+    if len(pdf_content) <= settings.PDF_CHUNK_SIZE:
+        yield from _cached_stream(cache_key, build_pdf_prompt(pdf_content, topic), regenerate, session_id)
+        return
+    
+    cached = _cache_lookup(cache_key, regenerate)
+    if cached is not None:
+        yield cached
+        return
     
-    response = llm.invoke(prompt)
-    return response.content
\ No newline at end of file
+    prompt = _focused_pdf_prompt(pdf_content, topic)
+    if prompt is None:
+        prompt = _reduce_pdf_content(pdf_content, topic, regenerate, progress_callback, session_id)
+    yield from _cached_stream(cache_key, prompt, True, session_id)
@@ -0,0 +1,271 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from config.settings import settings
+from agents.rate_limit import is_retryable
+from utils.metrics import timed
+
+PROVIDER_NAMES = ("google", "openai", "ollama")
+
+def configured_providers():
+    """Provider names from LLM_PROVIDERS, in preference order, without duplicates"""
+    names = [name.strip().lower() for name in settings.LLM_PROVIDERS.split(",") if name.strip()]
+    unknown = [name for name in names if name not in PROVIDER_NAMES]
+    if unknown:
+        raise ValueError(f"Unknown LLM provider(s): {', '.join(unknown)}; expected {', '.join(PROVIDER_NAMES)}")
+    return list(dict.fromkeys(names)) or ["google"]
+
+def provider_model(name):
+    """Model configured for an HTTP provider; Gemini's model is discovered by agents.note_agent"""
+    return {"openai": settings.OPENAI_MODEL, "ollama": settings.OLLAMA_MODEL}[name]
+
+def create_openai_compatible_model(name, model, temperature):
+    """Chat model for an OpenAI-compatible endpoint; Ollama and llama.cpp's server expose the same API"""
+    # Imported lazily so langchain-openai is only needed when one of these providers is enabled
+    from langchain_openai import ChatOpenAI
+    if name == "openai":
+        base_url, api_key = settings.OPENAI_BASE_URL, settings.OPENAI_API_KEY
+    else:
+        # Local servers ignore the key, but the client insists on one
+        base_url, api_key = settings.OLLAMA_BASE_URL, "ollama"
+    return ChatOpenAI(
+        base_url=base_url,
+        api_key=api_key,
+        model=model,
+        temperature=temperature,
+        timeout=settings.LLM_PROVIDER_TIMEOUT,
+        max_retries=0
+    )
+
+class ProviderStats:
+    """Latency history, health and in-flight count of one provider, shared by all its clients"""
+
+    def __init__(self, name, max_concurrency):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.in_flight = 0
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self._latencies = deque(maxlen=settings.LLM_PROVIDER_LATENCY_WINDOW)
+
+    def p50(self):
+        """Median latency of recent successful calls, or None before the first one"""
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[len(ordered) // 2]
+
+    def healthy(self, now):
+        return now >= self.cooldown_until
+
+    def record_success(self, seconds=None):
+        self.failures = 0
+        if seconds is not None:
+            self._latencies.append(seconds)
+
+    def record_failure(self):
+        self.failures += 1
+        # Back off longer from a provider that keeps failing
+        cooldown = settings.LLM_PROVIDER_COOLDOWN * min(2 ** (self.failures - 1), 16)
+        self.cooldown_until = time.monotonic() + cooldown
+
+    def snapshot(self):
+        return {
+            "provider": self.name,
+            "p50_seconds": self.p50(),
+            "samples": len(self._latencies),
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "failures": self.failures,
+            "cooling_down": not self.healthy(time.monotonic()),
+        }
+
+_stats = {}
+# Guards every ProviderStats; waiters are woken whenever a slot is released
+_stats_condition = threading.Condition()
+
+def get_provider_stats(name):
+    with _stats_condition:
+        stats = _stats.get(name)
+        if stats is None:
+            limit = getattr(settings, f"{name.upper()}_MAX_CONCURRENCY")
+            stats = _stats[name] = ProviderStats(name, limit)
+        return stats
+
+def provider_status():
+    """Snapshot of every provider used so far in this process"""
+    with _stats_condition:
+        return [stats.snapshot() for stats in _stats.values()]
+
+class Provider:
+    """A chat model for one backend, with its stats and optional client-side rate limiter"""
+
+    def __init__(self, name, model, chat_model, bucket=None):
+        self.name = name
+        self.model = model
+        self.chat_model = chat_model
+        self.bucket = bucket
+        self.stats = get_provider_stats(name)
+
+class ProviderRouter:
+    """Send each call to the healthy provider with the lowest observed p50 latency
+
+    Providers without latency samples yet are tried first so every provider gets
+    measured, and a small share of calls (LLM_PROVIDER_EXPLORE) goes to a random
+    healthy provider to keep the measurements fresh. A provider at its concurrency
+    limit is skipped while another one has room. Errors and timeouts put the provider
+    into a cooldown and the call falls back to the next one; streams fall back only
+    until the first chunk has been delivered.
+    """
+
+    def __init__(self, providers):
+        self.providers = providers
+
+    @property
+    def model(self):
+        return ",".join(f"{provider.name}:{provider.model}" for provider in self.providers)
+
+    def _ranked(self):
+        now = time.monotonic()
+        healthy = [provider for provider in self.providers if provider.stats.healthy(now)]
+        # With every provider cooling down, trying them anyway beats failing outright
+        candidates = healthy or list(self.providers)
+        ranked = sorted(
+            candidates,
+            key=lambda provider: -1.0 if provider.stats.p50() is None else provider.stats.p50()
+        )
+        if len(ranked) > 1 and random.random() < settings.LLM_PROVIDER_EXPLORE:
+            ranked.insert(0, ranked.pop(random.randrange(1, len(ranked))))
+        return ranked
+
+    def _acquire(self, ranked):
+        """Take a concurrency slot on the best provider with room, waiting if all are full
+        
+        Waiting is bounded by LLM_PROVIDER_TIMEOUT, so a leaked slot cannot hang callers forever.
+        """
+        deadline = time.monotonic() + settings.LLM_PROVIDER_TIMEOUT
+        with _stats_condition:
+            while True:
+                for provider in ranked:
+                    if provider.stats.in_flight < provider.stats.max_concurrency:
+                        provider.stats.in_flight += 1
+                        return provider
+                wait_for = deadline - time.monotonic()
+                if wait_for <= 0:
+                    raise TimeoutError(f"No LLM provider had a free slot within {settings.LLM_PROVIDER_TIMEOUT:.0f}s")
+                _stats_condition.wait(wait_for)
+
+    def _release(self, provider, seconds=None, error=None, record=True):
+        """Give a slot back; only transient errors and timeouts put the provider into cooldown
+        
+        A bad request or an auth error says nothing about the provider's health, and a
+        cancelled call (record=False) says nothing either way.
+        """
+        with _stats_condition:
+            provider.stats.in_flight -= 1
+            if not record:
+                pass
+            elif error is None:
+                provider.stats.record_success(seconds)
+            elif isinstance(error, TimeoutError) or is_retryable(error):
+                provider.stats.record_failure()
+            _stats_condition.notify_all()
+
+    def _release_abandoned(self, acquiring):
+        """Hand back a slot taken by a worker thread after its caller was cancelled"""
+        if not acquiring.cancelled() and acquiring.exception() is None:
+            self._release(acquiring.result(), record=False)
+
+    def _tag(self, response, provider):
+        """Record which model answered so usage is counted against it"""
+        metadata = getattr(response, "response_metadata", None)
+        if isinstance(metadata, dict):
+            metadata.setdefault("model_name", provider.model)
+        return response
+
+    def _attempts(self):
+        """Yield providers in the order they should be tried, each holding a concurrency slot"""
+        remaining = self._ranked()
+        while remaining:
+            provider = self._acquire(remaining)
+            remaining.remove(provider)
+            yield provider
+
+    def invoke(self, prompt, **kwargs):
+        last_error = None
+        for provider in self._attempts():
+            response = seconds = error = None
+            try:
+                if provider.bucket is not None:
+                    provider.bucket.acquire()
+                started = time.perf_counter()
+                with timed("llm.provider", provider=provider.name):
+                    response = provider.chat_model.invoke(prompt, **kwargs)
+                seconds = time.perf_counter() - started
+            except Exception as e:
+                error = last_error = e
+            finally:
+                # Also reached on KeyboardInterrupt, which is recorded as neither outcome
+                self._release(provider, seconds, error, record=seconds is not None or error is not None)
+            if error is None:
+                return self._tag(response, provider)
+        raise last_error
+
+    async def ainvoke(self, prompt, **kwargs):
+        last_error = None
+        remaining = self._ranked()
+        while remaining:
+            # Waiting for a slot blocks, so it happens off the event loop
+            acquiring = asyncio.ensure_future(asyncio.to_thread(self._acquire, remaining))
+            try:
+                provider = await asyncio.shield(acquiring)
+            except asyncio.CancelledError:
+                # The thread keeps waiting and may still get a slot, which nobody would release
+                acquiring.add_done_callback(self._release_abandoned)
+                raise
+            remaining.remove(provider)
+            response = seconds = error = None
+            try:
+                if provider.bucket is not None:
+                    await provider.bucket.aacquire()
+                started = time.perf_counter()
+                with timed("llm.provider", provider=provider.name):
+                    response = await provider.chat_model.ainvoke(prompt, **kwargs)
+                seconds = time.perf_counter() - started
+            except Exception as e:
+                error = last_error = e
+            finally:
+                # Also reached when the call is cancelled, which is recorded as neither outcome
+                self._release(provider, seconds, error, record=seconds is not None or error is not None)
+            if error is None:
+                return self._tag(response, provider)
+        raise last_error
+
+    def stream(self, prompt, **kwargs):
+        last_error = None
+        for provider in self._attempts():
+            first_chunk = error = None
+            finished = False
+            try:
+                if provider.bucket is not None:
+                    provider.bucket.acquire()
+                started = time.perf_counter()
+                with timed("llm.provider", provider=provider.name):
+                    for chunk in provider.chat_model.stream(prompt, **kwargs):
+                        if first_chunk is None:
+                            # Time to first chunk is what a streaming user waits for
+                            first_chunk = time.perf_counter() - started
+                        yield chunk
+                finished = True
+            except Exception as e:
+                error = last_error = e
+                if first_chunk is not None:
+                    raise
+            finally:
+                # A consumer that stops reading early still measured the time to first chunk
+                self._release(provider, first_chunk, error, record=finished or error is not None or first_chunk is not None)
+            if error is None:
+                return
+        raise last_error
@@ -0,0 +1,254 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future
+from agents.scheduler import get_scheduler
+from utils.metrics import observe, record_llm_usage, timed
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# google.api_core and httpx exception names that indicate a transient failure
+RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted",
+    "TooManyRequests",
+    "ServiceUnavailable",
+    "InternalServerError",
+    "DeadlineExceeded",
+    "GatewayTimeout",
+    "ConnectError",
+    "ReadTimeout",
+    "TimeoutError",
+}
+
+RETRYABLE_MESSAGES = ("429", "rate limit", "quota", "resource exhausted", "unavailable", "deadline exceeded", "timed out")
+
+_RETRY_DELAY_PATTERN = re.compile(r"retry[_ ]delay\D*?(\d+(?:\.\d+)?)", re.IGNORECASE)
+
+def is_retryable(error):
+    """Return True for rate-limit and transient server or network errors"""
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(code, int) and code in RETRYABLE_STATUS_CODES:
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in RETRYABLE_MESSAGES)
+
+def backoff_delay(attempt, error=None, base=1.0, cap=60.0):
+    """Exponential backoff with full jitter, never shorter than a server-provided retry delay"""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    match = _RETRY_DELAY_PATTERN.search(str(error)) if error is not None else None
+    if match:
+        delay = max(delay, min(cap, float(match.group(1))))
+    return delay
+
+class TokenBucket:
+    """Client-side request rate limiter
+    
+    Refills at rate_per_minute tokens per minute up to capacity. Each request takes one
+    token; callers that find the bucket empty reserve the next token and sleep until it
+    is due, so waiting callers are served in arrival order.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(1, int(rate_per_minute))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take a token and return how long the caller must wait before using it"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+class SingleFlight:
+    """Coalesce identical concurrent calls so only one of them reaches the backend"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def _join(self, key):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def _finish(self, key):
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def do(self, key, fn):
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._finish(key)
+
+    async def ado(self, key, coro_fn):
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await coro_fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._finish(key)
+
+class ResilientLLM:
+    """Wrap a LangChain chat model with scheduling, rate limiting, retries and coalescing
+    
+    Every call takes a slot from the request scheduler and a token from the shared
+    bucket, and is retried with jittered exponential backoff on retryable errors.
+    Identical concurrent invoke/ainvoke calls share one upstream request. stream() is
+    retried only until the first chunk arrives. Other attributes are passed through to
+    the wrapped model.
+    """
+
+    def __init__(self, llm, bucket, max_retries=5, backoff_base=1.0, backoff_max=60.0, coalesce=True):
+        self.llm = llm
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.coalesce = coalesce
+        self._flight = SingleFlight()
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    @property
+    def model_name(self):
+        return getattr(self.llm, "model", None) or type(self.llm).__name__
+
+    def _response_model(self, response):
+        """Model that actually answered, which behind a router may be any of several"""
+        metadata = getattr(response, "response_metadata", None) or {}
+        return metadata.get("model_name") or self.model_name
+
+    def _flight_key(self, prompt, kwargs):
+        if not self.coalesce or kwargs or not isinstance(prompt, str):
+            return None
+        return prompt
+
+    def _should_retry(self, attempt, error):
+        return attempt < self.max_retries and is_retryable(error)
+
+    def _delay(self, attempt, error):
+        return backoff_delay(attempt, error, self.backoff_base, self.backoff_max)
+
+    def _invoke_with_retry(self, prompt, session_id=None, **kwargs):
+        attempt = 0
+        queued_at = time.perf_counter()
+        with get_scheduler().slot_sync(session_id):
+            while True:
+                self.bucket.acquire()
+                if attempt == 0:
+                    observe("llm.wait", time.perf_counter() - queued_at)
+                try:
+                    started = time.perf_counter()
+                    with timed("llm.invoke", model=self.model_name):
+                        response = self.llm.invoke(prompt, **kwargs)
+                    record_llm_usage(self._response_model(response), response, prompt, time.perf_counter() - started)
+                    return response
+                except Exception as e:
+                    if not self._should_retry(attempt, e):
+                        raise
+                    time.sleep(self._delay(attempt, e))
+                    attempt += 1
+
+    async def _ainvoke_with_retry(self, prompt, session_id=None, **kwargs):
+        attempt = 0
+        queued_at = time.perf_counter()
+        async with get_scheduler().slot(session_id):
+            while True:
+                await self.bucket.aacquire()
+                if attempt == 0:
+                    observe("llm.wait", time.perf_counter() - queued_at)
+                try:
+                    started = time.perf_counter()
+                    with timed("llm.invoke", model=self.model_name):
+                        response = await self.llm.ainvoke(prompt, **kwargs)
+                    record_llm_usage(self._response_model(response), response, prompt, time.perf_counter() - started)
+                    return response
+                except Exception as e:
+                    if not self._should_retry(attempt, e):
+                        raise
+                    await asyncio.sleep(self._delay(attempt, e))
+                    attempt += 1
+
+    def invoke(self, prompt, session_id=None, **kwargs):
+        key = self._flight_key(prompt, kwargs)
+        if key is None:
+            return self._invoke_with_retry(prompt, session_id, **kwargs)
+        return self._flight.do(key, lambda: self._invoke_with_retry(prompt, session_id))
+
+    async def ainvoke(self, prompt, session_id=None, **kwargs):
+        key = self._flight_key(prompt, kwargs)
+        if key is None:
+            return await self._ainvoke_with_retry(prompt, session_id, **kwargs)
+        return await self._flight.ado(key, lambda: self._ainvoke_with_retry(prompt, session_id))
+
+    def stream(self, prompt, session_id=None, **kwargs):
+        attempt = 0
+        queued_at = time.perf_counter()
+        with get_scheduler().slot_sync(session_id):
+            while True:
+                self.bucket.acquire()
+                if attempt == 0:
+                    observe("llm.wait", time.perf_counter() - queued_at)
+                started = False
+                try:
+                    begun_at = time.perf_counter()
+                    aggregate = None
+                    with timed("llm.stream", model=self.model_name):
+                        for chunk in self.llm.stream(prompt, **kwargs):
+                            if not started:
+                                observe("llm.first_chunk", time.perf_counter() - begun_at)
+                            started = True
+                            # Chunks add up to one message carrying the total usage
+                            aggregate = chunk if aggregate is None else aggregate + chunk
+                            yield chunk
+                    record_llm_usage(self._response_model(aggregate), aggregate, prompt, time.perf_counter() - begun_at, "stream")
+                    return
+                except Exception as e:
+                    # Chunks already handed to the caller cannot be taken back
+                    if started or not self._should_retry(attempt, e):
+                        raise
+                    time.sleep(self._delay(attempt, e))
+                    attempt += 1
@@ -0,0 +1,148 @@
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from config.settings import settings
+
+DEFAULT_SESSION = "default"
+
+class SchedulerBusyError(RuntimeError):
+    """Raised when a request cannot be queued or waited too long for a free slot"""
+
+class _Waiter:
+    """A queued request, woken either on an asyncio loop or through a threading.Event"""
+
+    def __init__(self, session_id, loop=None):
+        self.session_id = session_id
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        self.granted = False
+
+    def wake(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._resolve)
+        else:
+            self.event.set()
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+class RequestScheduler:
+    """Bound the number of in-flight LLM requests across all sessions
+    
+    Requests beyond max_in_flight wait in one FIFO queue per session and freed slots are
+    handed out round-robin across sessions, so one session submitting many requests (for
+    example the chunks of a large PDF) cannot starve the others. At most max_queued
+    requests may wait at once; further requests fail fast with SchedulerBusyError.
+    Slots can be awaited from any event loop or acquired from plain threads.
+    """
+
+    def __init__(self, max_in_flight=4, max_queued=100, queue_timeout=None):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queued = 0
+        self._queues = OrderedDict()
+
+    def _try_acquire(self, waiter):
+        """Grant a slot immediately or queue the waiter; returns True if granted"""
+        with self._lock:
+            if self._in_flight < self.max_in_flight and not self._queued:
+                self._in_flight += 1
+                waiter.granted = True
+                return True
+            if self._queued >= self.max_queued:
+                raise SchedulerBusyError("Too many generation requests are waiting; please retry shortly")
+            self._queues.setdefault(waiter.session_id, deque()).append(waiter)
+            self._queued += 1
+            return False
+
+    def _abandon(self, waiter):
+        """Withdraw a waiter that stopped waiting; returns True if it already owns a slot"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            queue = self._queues.get(waiter.session_id)
+            if queue is not None and waiter in queue:
+                queue.remove(waiter)
+                self._queued -= 1
+                if not queue:
+                    del self._queues[waiter.session_id]
+            return False
+
+    def _release(self):
+        with self._lock:
+            if not self._queues:
+                self._in_flight -= 1
+                return
+            session_id, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+            # The slot passes straight to the next waiter, so _in_flight is unchanged
+            waiter.granted = True
+        waiter.wake()
+
+    @asynccontextmanager
+    async def slot(self, session_id=None):
+        """Async context manager holding one in-flight slot"""
+        waiter = _Waiter(session_id or DEFAULT_SESSION, asyncio.get_running_loop())
+        if not self._try_acquire(waiter):
+            try:
+                await asyncio.wait_for(waiter.future, self.queue_timeout)
+            except (asyncio.CancelledError, asyncio.TimeoutError) as e:
+                if self._abandon(waiter):
+                    self._release()
+                if isinstance(e, asyncio.TimeoutError):
+                    raise SchedulerBusyError("Timed out waiting for a free generation slot") from e
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    @contextmanager
+    def slot_sync(self, session_id=None):
+        """Blocking context manager holding one in-flight slot"""
+        waiter = _Waiter(session_id or DEFAULT_SESSION)
+        if not self._try_acquire(waiter):
+            if not waiter.event.wait(self.queue_timeout):
+                if self._abandon(waiter):
+                    self._release()
+                raise SchedulerBusyError("Timed out waiting for a free generation slot")
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self):
+        """Current load, for display and monitoring"""
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "queued": self._queued,
+                "waiting_sessions": len(self._queues),
+                "max_in_flight": self.max_in_flight,
+            }
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Return the process-wide request scheduler"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler(
+                max_in_flight=settings.LLM_MAX_IN_FLIGHT,
+                max_queued=settings.LLM_MAX_QUEUED,
+                queue_timeout=settings.LLM_QUEUE_TIMEOUT or None,
+            )
+        return _scheduler
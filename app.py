@@ -1,15 +1,20 @@
 import streamlit as st
-from agents.note_agent import generate_notes_from_topic, generate_notes_from_pdf
-from utils.file_handler import save_uploaded_file, save_note_content, list_notes, read_note_content, update_note_content, delete_note_file
+from agents.scheduler import SchedulerBusyError
+from agents.providers import configured_providers, provider_status
+from agents.jobs import submit_job, list_jobs, cancel_job, start_local_workers
+from utils.file_handler import save_uploaded_file, save_note_content, list_notes, count_notes, read_note_content, update_note_content, delete_note_file, topic_note_filename, pdf_note_filename, NoteConflictError, current_note_version, note_versions, read_note_version, rollback_note
+from utils.note_catalog import search_notes
+from tools.note_template import get_note_sections
+from utils.pdf_extractor import extract_pdf_text
+from utils.pdf_exporter import markdown_to_pdf
 from utils.text_processor import extract_key_points, format_as_markdown, generate_summary
+from utils.metrics import get_metrics, start_metrics_server, peak_rss_mb
 from config.settings import settings
+import math
 import os
 import tempfile
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Preformatted, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-import io
+import uuid
+from datetime import datetime
 
 st.set_page_config(
     page_title="Note Maker",
@@ -229,97 +234,36 @@ if 'current_filename' not in st.session_state:
 if 'editing' not in st.session_state:
     st.session_state.editing = False
 if 'notes_list' not in st.session_state:
-    st.session_state.notes_list = list_notes()
+    st.session_state.notes_list = []
 if 'delete_confirmation' not in st.session_state:
     st.session_state.delete_confirmation = {}
+if 'session_id' not in st.session_state:
+    # Kept in the URL so a browser refresh can still find this session's background jobs
+    st.session_state.session_id = st.query_params.get("session") or uuid.uuid4().hex
+    st.query_params["session"] = st.session_state.session_id
 
-def clean_markdown_text(text):
-    """Remove markdown formatting symbols to make text cleaner"""
-    text = text.replace('**', '')
+@st.cache_resource
+def start_background_services():
+    """Start the job workers and metrics endpoint once per server process"""
+    start_local_workers()
+    start_metrics_server()
 
-    text = text.replace('*', '')
-    text = text.replace('`', '')
-    text = text.replace('___', ' ')
-    text = text.replace('__', ' ')
-    text = text.replace('---', ' ')
-    import re
-    text = re.sub(r'\s+', ' ', text)
-    return text.strip()
+@st.cache_resource(show_spinner="Loading the note generator...")
+def load_note_agent():
+    """Import the LLM stack on first use, so browsing notes never waits for it"""
+    from agents import note_agent
+    return note_agent
 
-def markdown_to_pdf(markdown_text, filename):
-    """Convert markdown text to PDF using reportlab (Unicode compatible) with cleaned formatting"""
+start_background_services()
 
-    buffer = io.BytesIO()
-    
-
-    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
-    
-  
-    styles = getSampleStyleSheet()
-    
-    heading1_style = ParagraphStyle(
-        'Heading1',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=12,
-        spaceBefore=12,
-        fontName='Helvetica-Bold'
-    )
-    
-    heading2_style = ParagraphStyle(
-        'Heading2',
-        parent=styles['Heading2'],
-        fontSize=16,
-        spaceAfter=10,
-        spaceBefore=10,
-        fontName='Helvetica-Bold'
-    )
-    
-    heading3_style = ParagraphStyle(
-        'Heading3',
-        parent=styles['Heading3'],
-        fontSize=14,
-        spaceAfter=8,
-        spaceBefore=8,
-        fontName='Helvetica-Bold'
-    )
-    
-    normal_style = ParagraphStyle(
-        'Normal',
-        parent=styles['Normal'],
-        fontSize=12,
-        spaceAfter=6,
-        alignment=0
-    )
-    
-    lines = markdown_text.split('\n')
-    
-    elements = []
-    
-    for line in lines:
-        cleaned_line = clean_markdown_text(line)
-        
-        if line.startswith('# '):  
-            elements.append(Paragraph(cleaned_line.replace('# ', ''), heading1_style))
-        elif line.startswith('## '): 
-            elements.append(Paragraph(cleaned_line.replace('## ', ''), heading2_style))
-        elif line.startswith('### '):  
-            elements.append(Paragraph(cleaned_line.replace('### ', ''), heading3_style))
-        elif line.startswith('- ') or line.startswith('* '): 
-    
-            elements.append(Paragraph(f"• {cleaned_line[2:]}", normal_style))
-        elif line.strip() == '': 
-            elements.append(Spacer(1, 0.2*inch))
-        else:  
-            clean_text = cleaned_line.replace('<', '<').replace('>', '>')
-            elements.append(Paragraph(clean_text, normal_style))
-    
-    doc.build(elements)
-    
-    pdf_data = buffer.getvalue()
-    buffer.close()
-    
-    return pdf_data
+# Labels for the notes list ordering, mapped to (catalog column, descending)
+NOTE_SORT_OPTIONS = {
+    "Name (Z-A)": ("filename", True),
+    "Newest first": ("created_at", True),
+    "Recently edited": ("updated_at", True),
+    "Language/subject": ("language", False),
+    "Largest first": ("size", True),
+}
 
 def main():
     st.markdown('<div class="header">📝Notes Maker</div>', unsafe_allow_html=True)
@@ -359,12 +303,24 @@ def main():
     elif option == "⚙️ Settings":
         settings_section()
 
+def render_note_stream(chunks):
+    """Render streamed note chunks as they arrive and return the complete note"""
+    placeholder = st.empty()
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        placeholder.markdown("".join(parts) + "▌")
+    
+    # The finished note is rendered again by display_note_options
+    placeholder.empty()
+    return "".join(parts)
+
 def create_notes_section():
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.header("📝 Create New Notes")
     
     # Two options: Text input or File upload
-    tab1, tab2 = st.tabs(["📝 Text Input", "📄 File Upload"])
+    tab1, tab2, tab3 = st.tabs(["📝 Text Input", "📄 File Upload", "💬 Assistant"])
     
     with tab1:
         st.subheader("Generate Notes from Text")
@@ -380,17 +336,89 @@ def create_notes_section():
                 help="Select the programming language or subject for your notes"
             )
         
-        if st.button("✨ Generate Notes", key="generate_text", use_container_width=True):
-            if topic and language:
+        regenerate_text = st.checkbox(
+            "🔄 Regenerate (ignore previously generated notes)",
+            key="regenerate_text",
+            help="By default, identical requests reuse earlier results instantly"
+        )
+        background_text = st.checkbox(
+            "⏱️ Run in background",
+            key="background_text",
+            help="Keep generating even if the page is refreshed; pick the note up from Background Jobs below"
+        )
+        sectioned_text = st.checkbox(
+            "🧩 Generate section by section",
+            key="sectioned_text",
+            help="Write every template section in parallel; single sections can be regenerated afterwards"
+        )
+        
+        generate_clicked = st.button("✨ Generate Notes", key="generate_text", use_container_width=True)
+        
+        # Before spending a generation, point out notes that already cover this topic
+        if generate_clicked and topic and language and not regenerate_text:
+            similar = load_note_agent().find_existing_notes(topic, language)
+            if similar:
+                st.session_state.similar_notes = {"request": (topic, language), "notes": similar}
+                generate_clicked = False
+        
+        similar_notes = st.session_state.get("similar_notes")
+        if similar_notes and similar_notes["request"] == (topic, language):
+            st.warning("📚 You already have notes that look like this:")
+            existing_note = st.selectbox(
+                "Similar notes:",
+                [note["ref"] for note in similar_notes["notes"]],
+                format_func=lambda ref: f"{ref} ({next(n['score'] for n in similar_notes['notes'] if n['ref'] == ref):.0%} similar)"
+            )
+            col_open, col_anyway = st.columns(2)
+            with col_open:
+                open_existing = st.button("📖 Open Existing Note", key="open_similar", use_container_width=True)
+            with col_anyway:
+                if st.button("✨ Generate Anyway", key="generate_anyway", use_container_width=True):
+                    st.session_state.similar_notes = None
+                    generate_clicked = True
+            if open_existing:
+                st.session_state.current_note = read_note_content(existing_note)
+                st.session_state.current_filename = existing_note
+                display_note_options(st.session_state.current_note, existing_note)
+        
+        if generate_clicked:
+            if topic and language and background_text:
+                submit_job(
+                    "topic",
+                    {"topic": topic, "language": language, "regenerate": regenerate_text, "sectioned": sectioned_text},
+                    session_id=st.session_state.session_id
+                )
+                st.success("✅ Queued! Track progress under Background Jobs.")
+            elif topic and language:
                 with st.spinner(f"🤖 Generating notes for {language} on '{topic}'..."):
-                    notes = generate_notes_from_topic(topic, language)
+                    try:
+                        if sectioned_text:
+                            progress = st.empty()
+                            
+                            def report_sections(completed, total):
+                                progress.progress(completed / total, text=f"🧩 Wrote {completed} of {total} sections")
+                            
+                            notes = load_note_agent().generate_sectioned_notes(
+                                topic, language, regenerate=regenerate_text, progress_callback=report_sections,
+                                session_id=st.session_state.session_id
+                            )
+                            progress.empty()
+                        else:
+                            notes = render_note_stream(load_note_agent().stream_notes_from_topic(
+                                topic, language, regenerate=regenerate_text, session_id=st.session_state.session_id
+                            ))
+                    except SchedulerBusyError as e:
+                        st.error(f"⏳ {e}")
+                        st.stop()
                     st.session_state.current_note = notes
-                    import datetime
-                    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                    st.session_state.current_filename = f"{language}_{topic.replace(' ', '_')}_{timestamp}.md"
+                    st.session_state.current_filename = topic_note_filename(language, topic)
+                    st.session_state.sectioned_note = (
+                        {"filename": st.session_state.current_filename, "topic": topic, "language": language}
+                        if sectioned_text else None
+                    )
                     
                     # Save note
-                    file_path = save_note_content(notes, st.session_state.current_filename)
+                    file_path = save_note_content(notes, st.session_state.current_filename, language, topic, "topic")
                     
                     st.success("✅ Notes generated successfully!")
                     
@@ -411,6 +439,11 @@ def create_notes_section():
                     display_note_options(notes, st.session_state.current_filename)
             else:
                 st.warning("⚠️ Please enter both topic and select a language.")
+        
+        # Sectioned notes can have a single section rewritten without redoing the rest
+        sectioned_note = st.session_state.get("sectioned_note")
+        if sectioned_note and sectioned_note["filename"] == st.session_state.current_filename:
+            regenerate_section_panel(sectioned_note)
     
     with tab2:
         st.subheader("Upload File for Note Generation")
@@ -423,57 +456,186 @@ def create_notes_section():
         if uploaded_file is not None:
             st.success(f"✅ File uploaded: {uploaded_file.name}")
             
+            focus_topic = st.text_input(
+                "Focus topic (optional):",
+                placeholder="e.g., Recursion",
+                key="pdf_focus_topic",
+                help="Only the parts of the PDF most relevant to this topic are used, which is much faster for large files"
+            ).strip()
+            
+            regenerate_pdf = st.checkbox(
+                "🔄 Regenerate (ignore previously generated notes)",
+                key="regenerate_pdf",
+                help="By default, re-processing the same PDF reuses earlier results instantly"
+            )
+            background_pdf = st.checkbox(
+                "⏱️ Run in background",
+                key="background_pdf",
+                help="Large PDFs can take a while; the job keeps running even if the page is refreshed"
+            )
+            
             if st.button("🚀 Process File and Generate Notes", key="process_file", use_container_width=True):
-                with st.spinner(f"🤖 Processing {uploaded_file.name} and generating notes..."):
-                    # Save uploaded file
-                    file_path = save_uploaded_file(uploaded_file)
-                    
-                    # Process PDF
-                    with open(file_path, 'rb') as f:
-                        import pdfplumber
-                        content = ""
-                        with pdfplumber.open(f) as pdf:
-                            for page in pdf.pages:
-                                text = page.extract_text()
-                                if text:
-                                    content += text + "\n"
-                    
-                    # Generate notes from PDF content
-                    notes = generate_notes_from_pdf(content)
-                    st.session_state.current_note = notes
-                    import datetime
-                    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                    st.session_state.current_filename = f"PDF_Notes_{uploaded_file.name.replace('.pdf', '')}_{timestamp}.md"
-                    
-                    # Save note
-                    note_file_path = save_note_content(notes, st.session_state.current_filename)
-                    
-                    st.success("✅ Notes generated from PDF successfully!")
-                    
-                    # Option to automatically download after PDF generation
-                    auto_download = st.checkbox("📥 Download PDF notes automatically after generation", key="auto_download_pdf")
-                    
-                    if auto_download:
-                        # Create PDF version for download
-                        pdf_bytes = markdown_to_pdf(notes, st.session_state.current_filename.replace('.md', '.pdf'))
-                        st.download_button(
-                            label="📥 Download PDF Notes (PDF)",
-                            data=pdf_bytes,
-                            file_name=st.session_state.current_filename.replace('.md', '.pdf'),
-                            mime="application/pdf",
-                            key=f"auto_download_pdf_{st.session_state.current_filename}"
+                if background_pdf:
+                    submit_job(
+                        "pdf",
+                        {"file_path": save_uploaded_file(uploaded_file), "upload_name": uploaded_file.name,
+                         "topic": focus_topic or None, "regenerate": regenerate_pdf},
+                        session_id=st.session_state.session_id
+                    )
+                    st.success("✅ Queued! Track progress under Background Jobs.")
+                else:
+                    with st.spinner(f"🤖 Processing {uploaded_file.name} and generating notes..."):
+                        # Save uploaded file
+                        file_path = save_uploaded_file(uploaded_file)
+                        
+                        # Process PDF
+                        content = extract_pdf_text(file_path)
+                        memory = peak_rss_mb()
+                        if memory:
+                            st.caption(f"📄 Extracted {len(content):,} characters · peak memory {memory['self']:.0f} MB, "
+                                       f"extraction workers {memory['children']:.0f} MB")
+                        load_note_agent().remember_pdf_content(content, uploaded_file.name)
+                        
+                        # Large PDFs are summarized in chunks before the final note is streamed
+                        progress = st.empty()
+                        
+                        def report_progress(completed, total):
+                            progress.progress(completed / total, text=f"📑 Summarized {completed} of {total} sections")
+                        
+                        # Generate notes from PDF content
+                        try:
+                            notes = render_note_stream(load_note_agent().stream_notes_from_pdf(
+                                content, topic=focus_topic or None, regenerate=regenerate_pdf, progress_callback=report_progress,
+                                session_id=st.session_state.session_id
+                            ))
+                        except SchedulerBusyError as e:
+                            st.error(f"⏳ {e}")
+                            st.stop()
+                        progress.empty()
+                        st.session_state.current_note = notes
+                        st.session_state.current_filename = pdf_note_filename(uploaded_file.name)
+                        
+                        # Save note
+                        save_note_content(
+                            notes, st.session_state.current_filename, topic=uploaded_file.name, source_type="pdf"
                         )
-                    
-                    display_note_options(notes, st.session_state.current_filename)
+                        
+                        st.success("✅ Notes generated from PDF successfully!")
+                        
+                        # Option to automatically download after PDF generation
+                        auto_download = st.checkbox("📥 Download PDF notes automatically after generation", key="auto_download_pdf")
+                        
+                        if auto_download:
+                            # Create PDF version for download
+                            pdf_bytes = markdown_to_pdf(notes, st.session_state.current_filename.replace('.md', '.pdf'))
+                            st.download_button(
+                                label="📥 Download PDF Notes (PDF)",
+                                data=pdf_bytes,
+                                file_name=st.session_state.current_filename.replace('.md', '.pdf'),
+                                mime="application/pdf",
+                                key=f"auto_download_pdf_{st.session_state.current_filename}"
+                            )
+                        
+                        display_note_options(notes, st.session_state.current_filename)
+    
+    with tab3:
+        assistant_chat()
+    
+    background_jobs_panel()
     
     st.markdown('</div>', unsafe_allow_html=True)
 
+def assistant_chat():
+    """Chat with the note agent to generate and refine notes turn by turn"""
+    st.subheader("Refine Notes with the Assistant")
+    st.caption("Ask for notes on a topic or from an uploaded PDF path, then refine them in follow-up messages.")
+    
+    history = st.session_state.setdefault("agent_chat", [])
+    for role, text in history:
+        with st.chat_message(role):
+            st.markdown(text)
+    
+    message = st.text_area("Your message:", key="agent_message", placeholder="e.g., Write notes on Python decorators")
+    col_send, col_reset = st.columns(2)
+    with col_send:
+        send = st.button("📨 Send", key="agent_send", use_container_width=True)
+    with col_reset:
+        if st.button("🧹 New Conversation", key="agent_reset", use_container_width=True):
+            load_note_agent().reset_note_agent(st.session_state.session_id)
+            st.session_state.agent_chat = []
+            st.rerun()
+    
+    if send and message.strip():
+        with st.spinner("🤖 Thinking..."):
+            try:
+                answer = load_note_agent().chat_with_agent(message, session_id=st.session_state.session_id)
+            except SchedulerBusyError as e:
+                st.error(f"⏳ {e}")
+                return
+            except Exception as e:
+                st.error(f"❌ The assistant failed: {e}")
+                return
+        history.extend([("user", message), ("assistant", answer)])
+        # Only recent messages are shown; the agent itself keeps an even smaller window
+        del history[:-20]
+        st.rerun()
+
+def background_jobs_panel():
+    """List this session's background jobs and open their notes once done"""
+    jobs = list_jobs(st.session_state.session_id, limit=10)
+    if not jobs:
+        return
+    
+    st.markdown("### ⏱️ Background Jobs")
+    if st.button("🔄 Refresh Status", key="refresh_jobs"):
+        st.rerun()
+    
+    status_icons = {"queued": "🕒", "running": "⚙️", "done": "✅", "failed": "❌", "cancelled": "🚫"}
+    for job in jobs:
+        label = job["payload"].get("topic") or job["payload"].get("upload_name")
+        with st.expander(f"{status_icons[job['status']]} {label} — {job['status']}"):
+            if job["status"] == "done":
+                if st.button("📖 Open Note", key=f"open_job_{job['id']}"):
+                    st.session_state.current_note = read_note_content(job["result_filename"])
+                    st.session_state.current_filename = job["result_filename"]
+                    display_note_options(st.session_state.current_note, st.session_state.current_filename)
+            elif job["status"] == "failed":
+                st.error(f"❌ {job['error']}")
+            elif job["status"] == "queued":
+                if st.button("🚫 Cancel", key=f"cancel_job_{job['id']}"):
+                    cancel_job(job["id"])
+                    st.rerun()
+            else:
+                st.info("⚙️ Generating... use Refresh Status to check again.")
+
 def view_notes_section():
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.header("📚 View Existing Notes")
     
-    # Refresh notes list
-    st.session_state.notes_list = list_notes()
+    search_query = st.text_input("🔍 Search notes:", placeholder="e.g., python loops", help="Search note titles and contents")
+    
+    if search_query.strip():
+        results = search_notes(search_query, limit=settings.NOTES_PAGE_SIZE)
+        st.session_state.notes_list = [result["filename"] for result in results]
+        if results:
+            with st.expander(f"🔎 {len(results)} matching notes", expanded=True):
+                for result in results:
+                    st.markdown(f"**{result['filename']}**  \n{result['snippet']}")
+    else:
+        # Refresh the current page of the notes list
+        total_notes = count_notes()
+        page_count = max(1, math.ceil(total_notes / settings.NOTES_PAGE_SIZE))
+        
+        col_sort, col_page = st.columns(2)
+        with col_sort:
+            sort_label = st.selectbox("Sort by:", list(NOTE_SORT_OPTIONS), help="Order in which notes are listed")
+        with col_page:
+            page = st.number_input(f"Page (of {page_count}):", min_value=1, max_value=page_count, value=1)
+        
+        sort_by, descending = NOTE_SORT_OPTIONS[sort_label]
+        st.session_state.notes_list = list_notes(
+            (page - 1) * settings.NOTES_PAGE_SIZE, settings.NOTES_PAGE_SIZE, sort_by, descending
+        )
     
     if st.session_state.notes_list:
         selected_note = st.selectbox(
@@ -494,20 +656,15 @@ def view_notes_section():
             st.markdown(content)
             st.markdown('</div>', unsafe_allow_html=True)
             
+            related_notes_panel(selected_note, content)
+            note_history_panel(selected_note, content)
+            
             # Action buttons for existing note
             col1, col2, col3, col4 = st.columns(4)
             
             with col1:
-                # Download as PDF
-                pdf_bytes = markdown_to_pdf(content, selected_note.replace('.md', '.pdf'))
-                st.download_button(
-                    label="📥 Download (PDF)",
-                    data=pdf_bytes,
-                    file_name=selected_note.replace('.md', '.pdf'),
-                    mime="application/pdf",
-                    key=f"download_pdf_view_{selected_note}",
-                    use_container_width=True
-                )
+                # Download as PDF; rendering only happens once the user asks for it
+                pdf_download_button(content, selected_note, "📥 Download (PDF)", f"download_pdf_view_{selected_note}")
             
             with col2:
                 # Download as Markdown
@@ -525,6 +682,7 @@ def view_notes_section():
                     st.session_state.editing = True
                     st.session_state.current_note = content
                     st.session_state.current_filename = selected_note
+                    st.session_state.editing_version = current_note_version(selected_note)
             
             with col4:
                 # Delete button with confirmation
@@ -542,8 +700,7 @@ def view_notes_section():
                             if delete_note_file(selected_note):
                                 st.success(f"✅ Note '{selected_note}' deleted successfully!")
                                 st.session_state.delete_confirmation[selected_note] = False
-                                # Refresh the notes list
-                                st.session_state.notes_list = list_notes()
+                                # The notes list is refreshed on rerun
                                 st.rerun()
                             else:
                                 st.error(f"❌ Failed to delete note '{selected_note}'")
@@ -565,34 +722,123 @@ def view_notes_section():
                 col1, col2 = st.columns(2)
                 with col1:
                     if st.button("💾 Save Changes", use_container_width=True):
-                        update_note_content(st.session_state.current_filename, edited_content)
-                        st.session_state.current_note = edited_content
-                        st.session_state.editing = False
-                        st.success("✅ Changes saved successfully!")
-                        st.rerun()
+                        if save_edited_note(edited_content):
+                            st.rerun()
                 
                 with col2:
                     if st.button("❌ Cancel Edit", use_container_width=True):
                         st.session_state.editing = False
                         st.rerun()
+    elif search_query.strip():
+        st.info("🔍 No notes match your search.")
     else:
         st.info("📚 No notes found. Create some notes first!")
     
     st.markdown('</div>', unsafe_allow_html=True)
 
+def save_edited_note(edited_content):
+    """Save the note being edited unless someone else changed it since editing started"""
+    try:
+        update_note_content(
+            st.session_state.current_filename, edited_content,
+            expected_version=st.session_state.get("editing_version")
+        )
+    except NoteConflictError as e:
+        st.error(f"❌ {e}. Copy your changes, reopen the note and edit it again.")
+        return False
+    st.session_state.current_note = edited_content
+    st.session_state.editing = False
+    st.success("✅ Changes saved successfully!")
+    return True
+
+def note_history_panel(filename, content):
+    """List earlier versions of a note and restore any of them"""
+    versions = note_versions(filename)
+    if len(versions) < 2:
+        return
+    
+    with st.expander(f"🕘 Version history ({len(versions)} versions)"):
+        labels = {
+            entry["version"]: f"v{entry['version']} · {datetime.fromtimestamp(entry['created_at']):%Y-%m-%d %H:%M:%S} · {entry['size']:,} bytes"
+            for entry in versions
+        }
+        version = st.selectbox("Version:", list(labels), format_func=labels.get, key=f"history_{filename}")
+        if version == versions[0]["version"]:
+            st.caption("This is the current version.")
+            return
+        
+        old_content = read_note_version(filename, version)
+        st.text_area("Content of this version:", old_content, height=250, disabled=True, key=f"history_preview_{filename}_{version}")
+        if st.button("⏪ Restore This Version", key=f"restore_{filename}", use_container_width=True):
+            rollback_note(filename, version)
+            st.session_state.editing = False
+            st.success(f"✅ Restored version {version}")
+            st.rerun()
+
+def related_notes_panel(filename, content):
+    """Show notes and uploaded PDF sections that cover similar material
+    
+    The search loads faiss and numpy, so it only runs when asked for; results are kept
+    per note version for the rest of the session.
+    """
+    if not settings.SEMANTIC_INDEX_ENABLED:
+        return
+    
+    with st.expander("🔗 Related Notes"):
+        cache = st.session_state.setdefault("related_notes", {})
+        key = (filename, hash(content))
+        if key not in cache:
+            if not st.button("🔍 Find Related Notes", key=f"related_{filename}", use_container_width=True):
+                return
+            try:
+                from utils.semantic_index import related_items
+                related = related_items(filename, content)
+            except Exception as e:
+                st.caption(f"Related notes unavailable: {e}")
+                return
+            if not related:
+                # Not kept, as the index may still be filling in the background
+                st.caption("No related notes or PDF sections found yet.")
+                return
+            cache[key] = related
+        
+        for item in cache[key]:
+            if item["kind"] == "note":
+                st.write(f"📄 {item['ref']} ({item['score']:.0%} similar)")
+            else:
+                section = int(item["ref"].rsplit("#", 1)[1]) + 1
+                st.write(f"📑 {item.get('title') or 'Uploaded PDF'}, section {section} ({item['score']:.0%} similar)")
+
 def settings_section():
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.header("⚙️ Settings")
     
     st.subheader("Current Configuration")
-    st.write(f"**Provider:** Google Gemini (Free)")
-    st.write("**Model:** Automatically selected")
+    providers = configured_providers()
+    st.write(f"**Providers:** {', '.join(providers)} (fastest healthy one is used first)")
+    if "google" in providers and settings.GEMINI_MODEL:
+        st.write(f"**Gemini model:** {settings.GEMINI_MODEL} (pinned)")
+    elif "google" in providers:
+        st.write("**Gemini model:** Automatically selected")
+        if st.button("🔄 Refresh Model List"):
+            load_note_agent().invalidate_llm_cache()
+            try:
+                st.success(f"✅ Now using {load_note_agent().resolve_model_name()}")
+            except Exception as e:
+                st.error(f"❌ Could not resolve a model: {e}")
     
     st.subheader("API Configuration")
     if settings.GOOGLE_API_KEY:
         st.info(f"✅ Using Google API key (first 6 chars): {settings.GOOGLE_API_KEY[:6]}...")
-    else:
+    elif "google" in providers:
         st.error("❌ Google API Key not found!")
+    if "openai" in providers:
+        st.info(f"✅ OpenAI-compatible endpoint: {settings.OPENAI_BASE_URL or 'api.openai.com'} ({settings.OPENAI_MODEL})")
+    if "ollama" in providers:
+        st.info(f"✅ Local model server: {settings.OLLAMA_BASE_URL} ({settings.OLLAMA_MODEL})")
+    
+    provider_panel()
+    metrics_panel()
     
     st.subheader("About This App")
     st.markdown("""
@@ -606,6 +852,127 @@ def settings_section():
     
     st.markdown('</div>', unsafe_allow_html=True)
 
+def provider_panel():
+    """Show the latency and health the router has observed for each provider"""
+    status = provider_status()
+    if not status:
+        return
+    st.subheader("🔀 Provider Routing")
+    st.dataframe(
+        [
+            {
+                "Provider": stats["provider"],
+                "p50 (s)": round(stats["p50_seconds"], 2) if stats["p50_seconds"] is not None else None,
+                "Samples": stats["samples"],
+                "In flight": f"{stats['in_flight']}/{stats['max_concurrency']}",
+                "Failures": stats["failures"],
+                "Status": "cooling down" if stats["cooling_down"] else "healthy",
+            }
+            for stats in status
+        ],
+        use_container_width=True
+    )
+
+def metrics_panel():
+    """Show where time, tokens and cache hits go in this app process"""
+    st.subheader("📊 Performance Metrics")
+    metrics = get_metrics()
+    snapshot = metrics.snapshot()
+    
+    if not snapshot["stages"]:
+        st.info("No activity recorded yet. Generate or open some notes first.")
+        return
+    
+    # Slowest stages in total first: those are the hot spots
+    st.dataframe(
+        [
+            {
+                "Stage": stage,
+                "Calls": stats["count"],
+                "Errors": stats["errors"],
+                "Mean (ms)": round(stats["mean_seconds"] * 1000, 1),
+                "p50 (ms)": round(stats["p50_seconds"] * 1000, 1),
+                "p95 (ms)": round(stats["p95_seconds"] * 1000, 1),
+                "Max (ms)": round(stats["max_seconds"] * 1000, 1),
+                "Total (s)": round(stats["total_seconds"], 2),
+            }
+            for stage, stats in sorted(snapshot["stages"].items(), key=lambda item: -item[1]["total_seconds"])
+        ],
+        use_container_width=True,
+        hide_index=True
+    )
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**LLM usage**")
+        for model, usage in snapshot["llm"].items():
+            st.write(
+                f"{model}: {usage['requests']} calls, {usage['prompt_tokens']:,} prompt / "
+                f"{usage['completion_tokens']:,} completion tokens, ${usage['cost']:.4f}"
+            )
+    with col2:
+        st.markdown("**Cache hit rates**")
+        for cache, counts in sorted(snapshot["caches"].items()):
+            total = counts["hits"] + counts["misses"]
+            st.write(f"{cache}: {counts['hits'] / total:.0%} of {total}")
+    
+    col_export, col_reset = st.columns(2)
+    with col_export:
+        st.download_button(
+            "📥 Export (Prometheus)",
+            data=metrics.prometheus_text(),
+            file_name="notemaker_metrics.prom",
+            mime="text/plain",
+            use_container_width=True
+        )
+    with col_reset:
+        if st.button("🧹 Reset Metrics", use_container_width=True):
+            metrics.reset()
+            st.rerun()
+
+def pdf_download_button(content, filename, label, key):
+    """Offer a PDF download, building the PDF only after the user asks for it"""
+    ready_key = f"pdf_ready_{key}"
+    pdf_filename = filename.replace('.md', '.pdf')
+    
+    if st.session_state.get(ready_key):
+        st.download_button(
+            label=label,
+            data=markdown_to_pdf(content, pdf_filename),
+            file_name=pdf_filename,
+            mime="application/pdf",
+            key=key,
+            use_container_width=True
+        )
+    elif st.button("📄 Prepare PDF", key=f"prepare_{key}", use_container_width=True):
+        st.session_state[ready_key] = True
+        st.rerun()
+
+def regenerate_section_panel(sectioned_note):
+    """Let the user regenerate one section of a note generated section by section"""
+    sections = dict(get_note_sections())
+    with st.expander("🔁 Regenerate a single section"):
+        section = st.selectbox("Section:", list(sections), format_func=sections.get, key="regenerate_section_choice")
+        regenerate_clicked = st.button("🔁 Regenerate Section", key="regenerate_section", use_container_width=True)
+    
+    if regenerate_clicked:
+        filename = sectioned_note["filename"]
+        with st.spinner(f"🤖 Rewriting '{sections[section]}'..."):
+            try:
+                # Other sections, including any edits to them, are kept as they are
+                notes = load_note_agent().regenerate_note_section(
+                    st.session_state.current_note,
+                    sectioned_note["topic"], sectioned_note["language"], section,
+                    session_id=st.session_state.session_id
+                )
+            except SchedulerBusyError as e:
+                st.error(f"⏳ {e}")
+                return
+        update_note_content(filename, notes)
+        st.session_state.current_note = notes
+        st.success(f"✅ Regenerated '{sections[section]}'")
+        display_note_options(notes, filename)
+
 def display_note_options(content, filename):
     """Display note content with download and edit options"""
     
@@ -647,6 +1014,7 @@ def display_note_options(content, filename):
             st.session_state.editing = True
             st.session_state.current_note = content
             st.session_state.current_filename = filename
+            st.session_state.editing_version = current_note_version(filename)
     
     # Edit mode
     if st.session_state.editing:
@@ -660,10 +1028,7 @@ def display_note_options(content, filename):
         col1, col2 = st.columns(2)
         with col1:
             if st.button("💾 Save Changes", use_container_width=True):
-                update_note_content(st.session_state.current_filename, edited_content)
-                st.session_state.current_note = edited_content
-                st.session_state.editing = False
-                st.success("✅ Changes saved successfully!")
+                save_edited_note(edited_content)
         
         with col2:
             if st.button("❌ Cancel Edit", use_container_width=True):
@@ -0,0 +1,216 @@
+"""Generate notes in bulk without the Streamlit UI
+
+    python batch.py curriculum.csv --parallel 8
+    python batch.py topics.jsonl --sectioned
+    python batch.py lectures/ --topic "exam revision"
+
+A CSV manifest needs topic and language columns, a JSONL manifest one object with
+topic and language per line; a directory is scanned for PDFs. Every finished item is
+appended to a progress file, so rerunning the same command after an interruption
+skips what is already done.
+"""
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config.settings import settings
+from utils.metrics import get_metrics, start_metrics_server
+
+# Scheduler session every batch item is queued under, so interactive users keep their fair share
+BATCH_SESSION = "batch"
+
+def _truthy(value):
+    return str(value).strip().lower() in ("1", "true", "yes", "y")
+
+def read_manifest(path, sectioned=False):
+    """Topic items from a CSV or JSONL manifest, in file order, without duplicates"""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    items = {}
+    for number, row in enumerate(rows, 1):
+        topic = (row.get("topic") or "").strip()
+        language = (row.get("language") or "").strip()
+        if not topic or not language:
+            print(f"Skipping manifest entry {number}: topic and language are required")
+            continue
+        item_sectioned = _truthy(row["sectioned"]) if "sectioned" in row else sectioned
+        key = f"topic:{language}:{topic}"
+        items.setdefault(key, {"key": key, "kind": "topic", "topic": topic, "language": language, "sectioned": item_sectioned})
+    return list(items.values())
+
+def find_pdfs(folder, topic=None):
+    """PDF items for every PDF under folder, sorted by path"""
+    items = []
+    for root, _, filenames in os.walk(folder):
+        for filename in filenames:
+            if filename.lower().endswith(".pdf"):
+                path = os.path.join(root, filename)
+                relative = os.path.relpath(path, folder).replace(os.sep, "/")
+                # The note is named after the relative path, so same-named PDFs in different folders do not collide
+                name = relative.replace("/", "_")
+                items.append({"key": f"pdf:{relative}:{topic or ''}", "kind": "pdf", "path": path, "name": name, "topic": topic})
+    return sorted(items, key=lambda item: item["key"])
+
+def load_progress(path):
+    """Keys of the items already finished according to the progress file"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line may be cut short if the previous run was killed mid-write
+                continue
+            if record.get("status") == "done":
+                done.add(record["key"])
+    return done
+
+class ProgressLog:
+    """Append-only JSON-lines record of finished items, shared by the worker threads"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, **fields):
+        line = json.dumps({"ts": round(time.time(), 3), **fields}) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+def generate_item(item, regenerate=False):
+    """Generate and save the notes for one item and return the saved filename"""
+    from agents.note_agent import generate_notes_from_topic, generate_sectioned_notes, generate_notes_from_pdf, remember_pdf_content
+    from utils.file_handler import save_note_content, topic_note_filename, pdf_note_filename
+    from utils.pdf_extractor import extract_pdf_text
+
+    if item["kind"] == "topic":
+        generate = generate_sectioned_notes if item["sectioned"] else generate_notes_from_topic
+        notes = generate(item["topic"], item["language"], regenerate=regenerate, session_id=BATCH_SESSION)
+        filename = topic_note_filename(item["language"], item["topic"])
+        save_note_content(notes, filename, item["language"], item["topic"], "topic")
+    else:
+        content = extract_pdf_text(item["path"])
+        if not content.strip():
+            raise ValueError("no text could be extracted")
+        remember_pdf_content(content, item["name"])
+        notes = generate_notes_from_pdf(content, topic=item["topic"], regenerate=regenerate, session_id=BATCH_SESSION)
+        filename = pdf_note_filename(item["name"])
+        save_note_content(notes, filename, topic=item["name"], source_type="pdf")
+    return filename
+
+def _label(item):
+    if item["kind"] == "topic":
+        return f"{item['language']}: {item['topic']}"
+    return item["path"]
+
+class BatchRun:
+    """Runs items on a thread pool; each outcome is recorded as soon as the item finishes"""
+
+    def __init__(self, items, progress, parallel, regenerate=False):
+        self.items = items
+        self.progress = progress
+        self.parallel = parallel
+        self.regenerate = regenerate
+        self.done = 0
+        self.failed = 0
+        self.item_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _run(self, item):
+        started = time.perf_counter()
+        try:
+            filename = generate_item(item, self.regenerate)
+        except Exception as e:
+            self.progress.record(key=item["key"], status="failed", error=str(e))
+            with self._lock:
+                self.failed += 1
+                position = self.done + self.failed
+            print(f"[{position}/{len(self.items)}] FAILED {_label(item)}: {e}")
+            return
+        seconds = time.perf_counter() - started
+        self.progress.record(key=item["key"], status="done", filename=filename, seconds=round(seconds, 3))
+        with self._lock:
+            self.done += 1
+            self.item_seconds += seconds
+            position = self.done + self.failed
+        print(f"[{position}/{len(self.items)}] {_label(item)} -> {filename} ({seconds:.1f}s)")
+
+    def run(self):
+        """Process every item; on Ctrl+C, let the items in progress finish and stop"""
+        executor = ThreadPoolExecutor(max_workers=self.parallel, thread_name_prefix="batch")
+        futures = [executor.submit(self._run, item) for item in self.items]
+        try:
+            for future in as_completed(futures):
+                future.result()
+        except KeyboardInterrupt:
+            print("Interrupted: finishing the items in progress. Rerun the same command to resume.")
+            executor.shutdown(wait=True, cancel_futures=True)
+            return False
+        executor.shutdown(wait=True)
+        return True
+
+def print_summary(run, skipped, seconds):
+    """Items, throughput and LLM token usage of the run"""
+    finished = run.done + run.failed
+    print()
+    print(f"Done: {run.done}  Failed: {run.failed}  Skipped (already done): {skipped}  Not started: {len(run.items) - finished}")
+    print(f"Elapsed: {seconds:.1f}s with {run.parallel} in parallel")
+    if run.done and seconds > 0:
+        print(f"Throughput: {run.done / seconds * 60:.1f} notes/min; mean {run.item_seconds / run.done:.1f}s per note")
+    usage = get_metrics().snapshot()["llm"].values()
+    prompt_tokens = sum(model["prompt_tokens"] for model in usage)
+    completion_tokens = sum(model["completion_tokens"] for model in usage)
+    if prompt_tokens or completion_tokens:
+        cost = sum(model["cost"] for model in usage)
+        print(f"LLM: {sum(model['requests'] for model in usage)} requests, {prompt_tokens} prompt + "
+              f"{completion_tokens} completion tokens (est. cost {cost:.4f})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate notes in bulk from a manifest or a folder of PDFs")
+    parser.add_argument("source", help="CSV or JSONL manifest with topic and language, or a directory of PDFs")
+    parser.add_argument("--parallel", type=int, default=4, help="Notes generated concurrently")
+    parser.add_argument("--sectioned", action="store_true", help="Generate topic notes section by section (a manifest 'sectioned' column overrides this)")
+    parser.add_argument("--topic", help="Focus topic for notes from PDFs")
+    parser.add_argument("--regenerate", action="store_true", help="Bypass the response cache")
+    parser.add_argument("--progress", help="Progress file used to resume (default: <source>.progress.jsonl)")
+    parser.add_argument("--limit", type=int, help="Only process this many pending items")
+    parser.add_argument("--metrics-port", type=int, default=settings.METRICS_PORT, help="Serve Prometheus metrics on this port (0 disables)")
+    args = parser.parse_args()
+    
+    if os.path.isdir(args.source):
+        items = find_pdfs(args.source, args.topic)
+    else:
+        items = read_manifest(args.source, args.sectioned)
+    progress_path = args.progress or f"{args.source.rstrip('/' + os.sep)}.progress.jsonl"
+    finished = load_progress(progress_path)
+    pending = [item for item in items if item["key"] not in finished]
+    skipped = len(items) - len(pending)
+    if args.limit is not None:
+        pending = pending[:args.limit]
+    
+    print(f"{len(items)} item(s) in {args.source}: {skipped} already done, {len(pending)} to generate")
+    if not pending:
+        return
+    
+    start_metrics_server(args.metrics_port)
+    run = BatchRun(pending, ProgressLog(progress_path), max(1, args.parallel), args.regenerate)
+    started = time.perf_counter()
+    completed = run.run()
+    print_summary(run, skipped, time.perf_counter() - started)
+    if not completed or run.failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import asyncio
+import hashlib
+import random
+import time
+from typing import Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+WORDS = (
+    "variable function loop condition class object method module package list tuple dictionary "
+    "set string integer float boolean recursion iteration exception scope closure decorator "
+    "generator iterator algorithm structure memory pointer reference value syntax compiler "
+    "interpreter runtime thread process queue stack tree graph array index hash sort search"
+).split()
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic offline stand-in for ChatGoogleGenerativeAI
+
+    Every call sleeps for latency seconds, plus output_tokens / tokens_per_second when
+    a token rate is set, then returns markdown derived from a hash of the prompt, so
+    identical prompts always get identical notes. Usage metadata is reported like a
+    real provider. google_api_key and timeout are accepted so the class can be swapped in directly.
+    """
+
+    model: str = "fake-benchmark"
+    temperature: float = 0.0
+    google_api_key: Optional[str] = None
+    timeout: Optional[float] = None
+    latency: float = 0.05
+    output_tokens: int = 400
+    tokens_per_second: float = 0.0  # 0 returns every token at once
+
+    @property
+    def _llm_type(self):
+        return "fake-benchmark"
+
+    def _prompt(self, messages):
+        return "\n".join(str(message.content) for message in messages)
+
+    def _text(self, prompt):
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+        lines = []
+        words = 0
+        while words < self.output_tokens:
+            if len(lines) % 8 == 0:
+                heading = " ".join(rng.choice(WORDS) for _ in range(3)).title()
+                lines.append(f"\n## {heading}\n")
+                words += 4
+            sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 14)))
+            lines.append(f"- **{sentence.split()[0]}**: {sentence}.")
+            words += len(sentence.split()) + 2
+        return "\n".join(lines).strip()
+
+    def _usage(self, prompt):
+        input_tokens = len(prompt) // 4
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": self.output_tokens,
+            "total_tokens": input_tokens + self.output_tokens,
+        }
+
+    def _generation_time(self):
+        return self.output_tokens / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = self._prompt(messages)
+        time.sleep(self.latency + self._generation_time())
+        message = AIMessage(content=self._text(prompt), usage_metadata=self._usage(prompt))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = self._prompt(messages)
+        await asyncio.sleep(self.latency + self._generation_time())
+        message = AIMessage(content=self._text(prompt), usage_metadata=self._usage(prompt))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = self._prompt(messages)
+        time.sleep(self.latency)
+        lines = self._text(prompt).split("\n")
+        pause = self._generation_time() / len(lines)
+        for i, line in enumerate(lines):
+            if pause:
+                time.sleep(pause)
+            # Usage is reported once, on the final chunk
+            usage = self._usage(prompt) if i == len(lines) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=line + "\n", usage_metadata=usage))
@@ -0,0 +1,52 @@
+import os
+import random
+from datetime import datetime, timedelta
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+from benchmarks.fake_llm import WORDS
+
+LINES_PER_PAGE = 45
+
+def _sentence(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 14))]
+    return " ".join(words).capitalize() + "."
+
+def make_pdf(path, pages, seed=0):
+    """Write a text PDF with one chapter heading and LINES_PER_PAGE lines per page"""
+    rng = random.Random(seed)
+    pdf = canvas.Canvas(path, pagesize=letter)
+    for page in range(pages):
+        pdf.setFont("Helvetica-Bold", 14)
+        pdf.drawString(72, 740, f"Chapter {page + 1}: {rng.choice(WORDS).title()} and {rng.choice(WORDS).title()}")
+        pdf.setFont("Helvetica", 10)
+        y = 716
+        for _ in range(LINES_PER_PAGE):
+            pdf.drawString(72, y, _sentence(rng))
+            y -= 14
+        pdf.showPage()
+    pdf.save()
+    return path
+
+def make_note(rng, sections=6):
+    """Markdown note text shaped like generated notes"""
+    parts = [f"# {rng.choice(WORDS).title()} Notes"]
+    for _ in range(sections):
+        parts.append(f"\n## {rng.choice(WORDS).title()}\n")
+        parts.extend(f"- {_sentence(rng)}" for _ in range(4))
+    return "\n".join(parts)
+
+def make_prose(rng, lines):
+    """Plain sentences, one per line, with no headings or list items"""
+    return "\n".join(_sentence(rng) for _ in range(lines))
+
+def make_notes_folder(folder, count, seed=0):
+    """Fill folder with count small notes named like saved topic notes"""
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    started = datetime(2025, 1, 1)
+    for i in range(count):
+        stamp = (started + timedelta(seconds=i)).strftime("%Y%m%d_%H%M%S")
+        filename = f"Python_{rng.choice(WORDS).title()}_{i}_{stamp}.md"
+        with open(os.path.join(folder, filename), "w", encoding="utf-8") as f:
+            f.write(make_note(rng, sections=2))
+    return folder
@@ -0,0 +1,396 @@
+"""Offline benchmark suite for the note generation pipeline
+
+Runs every stage against a deterministic fake LLM inside a scratch directory and
+writes the results as JSON, so runs can be compared across commits:
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --quick
+    python -m benchmarks.run --compare base.json bench.json
+"""
+import argparse
+import functools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def measure(name, func, repeat=3, params=None, units=None):
+    """Run func repeat times and summarize its wall-clock latency
+
+    units, if given, maps a unit name to the amount of work one call does (e.g.
+    {"pages": 100}); throughput is reported per second for each of them.
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return summarize(name, timings, params, units)
+
+def summarize(name, timings, params=None, units=None):
+    """Benchmark result for a list of already measured durations"""
+    p50 = _percentile(timings, 0.5)
+    result = {
+        "benchmark": name,
+        "params": params or {},
+        "runs": len(timings),
+        "mean_s": sum(timings) / len(timings),
+        "p50_s": p50,
+        "p95_s": _percentile(timings, 0.95),
+        "min_s": min(timings),
+        "max_s": max(timings),
+        "throughput": {f"{unit}_per_s": amount / p50 for unit, amount in (units or {}).items() if p50 > 0},
+    }
+    label = " ".join(f"{key}={value}" for key, value in result["params"].items())
+    print(f"  {name:<28} {label:<18} p50 {p50 * 1000:10.2f} ms", file=sys.stderr)
+    return result
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _prepare_environment(workdir, args):
+    """Point the app at workdir and an offline model before any project module is imported"""
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+    os.environ["GEMINI_MODEL"] = "models/fake-benchmark"
+    os.environ["LLM_REQUESTS_PER_MINUTE"] = "0"
+    os.environ["JOB_LOCAL_WORKERS"] = "0"
+    os.environ["CACHE_FOLDER"] = os.path.join(workdir, "cache")
+
+    import langchain_google_genai
+    from benchmarks.fake_llm import FakeChatModel
+    from agents import note_agent
+    # note_agent imports the class when it first builds a client, so patching the package is enough
+    langchain_google_genai.ChatGoogleGenerativeAI = functools.partial(
+        FakeChatModel, latency=args.latency, output_tokens=args.output_tokens, tokens_per_second=args.tokens_per_second
+    )
+    note_agent.invalidate_llm_cache()
+
+# Modules that should only be loaded once a feature that needs them is used
+HEAVY_MODULES = ("langchain", "langchain_core", "langchain_google_genai", "langchain_openai", "google.generativeai", "reportlab", "faiss")
+
+_IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+print(json.dumps({{"seconds": seconds, "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+def bench_import_time(repeat):
+    """Cold import of the app's entry points, each in a fresh interpreter
+
+    app is what a Streamlit cold start or the first paint of the notes browser pays
+    for; the list of heavy modules it loaded shows which deferred import regressed.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    results = []
+    for module in ("config.settings", "utils.file_handler", "agents.note_agent", "app"):
+        timings = []
+        for _ in range(repeat):
+            probe = _IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)
+            completed = subprocess.run(
+                [sys.executable, "-W", "ignore", "-c", probe], env=env, capture_output=True, text=True
+            )
+            if completed.returncode != 0:
+                print(f"  import {module} failed: {completed.stderr.strip().splitlines()[-1:]}", file=sys.stderr)
+                break
+            probe_result = json.loads(completed.stdout.strip().splitlines()[-1])
+            timings.append(probe_result["seconds"])
+        if timings:
+            result = summarize("import", timings, {"module": module})
+            result["heavy_modules"] = probe_result["heavy"]
+            results.append(result)
+    return results
+
+def bench_fixtures(workdir, pages_list):
+    from benchmarks.fixtures import make_pdf
+    paths = {}
+    for pages in pages_list:
+        path = os.path.join(workdir, f"fixture_{pages}.pdf")
+        started = time.perf_counter()
+        make_pdf(path, pages, seed=pages)
+        print(f"  fixture {pages} pages built in {time.perf_counter() - started:.1f} s", file=sys.stderr)
+        paths[pages] = path
+    return paths
+
+def bench_extraction(pdfs, repeat):
+    from config.settings import settings
+    from utils.pdf_extractor import extract_pdf_text
+    results = []
+    texts = {}
+    for pages, path in pdfs.items():
+        settings.PDF_PAGE_CACHE_ENABLED = False
+        texts[pages] = extract_pdf_text(path)
+        size = len(texts[pages])
+        units = {"pages": pages, "chars": size}
+        results.append(measure("extract.cold", lambda: extract_pdf_text(path), repeat, {"pages": pages}, units))
+        settings.PDF_PAGE_CACHE_ENABLED = True
+        extract_pdf_text(path)
+        results.append(measure("extract.warm", lambda: extract_pdf_text(path), repeat, {"pages": pages}, units))
+    return results, texts
+
+def bench_prompt_build(texts, repeat):
+    from config.settings import settings
+    from agents.note_agent import build_chunk_prompt, build_pdf_prompt
+    from utils.text_processor import split_into_chunks
+
+    def build(text):
+        chunks = split_into_chunks(text, settings.PDF_CHUNK_SIZE, settings.PDF_CHUNK_OVERLAP)
+        prompts = [build_chunk_prompt(chunk, i + 1, len(chunks), None) for i, chunk in enumerate(chunks)]
+        return prompts or [build_pdf_prompt(text)]
+
+    return [
+        measure("prompt.build", lambda text=text: build(text), repeat, {"pages": pages}, {"chars": len(text)})
+        for pages, text in texts.items()
+    ]
+
+def bench_generation(texts, repeat, max_pdf_pages):
+    from agents.note_agent import generate_notes_from_topic, generate_sectioned_notes, generate_notes_from_pdf
+    results = [
+        measure("generate.topic", lambda: generate_notes_from_topic("Recursion", "Python", regenerate=True), repeat),
+        measure("generate.sections", lambda: generate_sectioned_notes("Recursion", "Python", regenerate=True), repeat),
+    ]
+    for pages, text in texts.items():
+        if pages > max_pdf_pages:
+            continue
+        results.append(measure(
+            "generate.pdf", lambda text=text: generate_notes_from_pdf(text, regenerate=True),
+            repeat, {"pages": pages}, {"pages": pages}
+        ))
+        results.append(measure(
+            "generate.pdf_focused", lambda text=text: generate_notes_from_pdf(text, topic="recursion closure", regenerate=True),
+            repeat, {"pages": pages}, {"pages": pages}
+        ))
+    return results
+
+def bench_save_notes(workdir, count):
+    from config.settings import settings
+    from benchmarks.fixtures import make_note
+    from utils.file_handler import save_note_content
+    settings.NOTES_FOLDER = os.path.join(workdir, "notes_save")
+    os.makedirs(settings.NOTES_FOLDER, exist_ok=True)
+    rng = random.Random(0)
+    notes = [make_note(rng) for _ in range(count)]
+    counter = iter(range(10 ** 9))
+
+    def save_batch():
+        for note in notes:
+            i = next(counter)
+            save_note_content(note, f"Python_Bench_{i}_20250101_000000.md", "Python", f"Bench {i}", "topic")
+
+    return [measure("save_note_content", save_batch, 1, {"notes": count}, {"notes": count})]
+
+def bench_markdown_to_pdf(repeat):
+    from benchmarks.fixtures import make_note
+    from utils.pdf_exporter import markdown_to_pdf
+    rng = random.Random(1)
+    results = []
+    for sections in (6, 120):
+        note = make_note(rng, sections)
+        counter = iter(range(10 ** 9))
+        # A unique suffix per call keeps the render cache from answering
+        results.append(measure(
+            "markdown_to_pdf", lambda note=note: markdown_to_pdf(f"{note}\n<!-- {next(counter)} -->"),
+            repeat, {"sections": sections}, {"chars": len(note)}
+        ))
+    return results
+
+def bench_text_processing(sizes_mb, repeat):
+    """Key points, summaries and markdown cleaning on multi-megabyte notes, and in bulk"""
+    from benchmarks.fixtures import make_note, make_prose
+    from utils.pdf_exporter import clean_markdown_lines
+    from utils.text_processor import extract_key_points, generate_summary, extract_key_points_batch
+    rng = random.Random(2)
+    section = make_note(rng, 1)
+    results = []
+    for size_mb in sizes_mb:
+        note = section * (size_mb * 1_000_000 // len(section) + 1)
+        # Prose without headings or list items makes key point extraction scan everything
+        prose = make_prose(rng, 1000) * (size_mb * 1_000_000 // 75_000 + 1)
+        params, units = {"mb": size_mb}, {"mb": len(note) / 1e6}
+        results.append(measure("text.key_points", lambda note=note: extract_key_points(note), repeat, params, units))
+        results.append(measure("text.key_points_prose", lambda prose=prose: extract_key_points(prose), repeat, params, {"mb": len(prose) / 1e6}))
+        results.append(measure("text.summary", lambda note=note: generate_summary(note), repeat, params, units))
+        results.append(measure("text.clean_markdown", lambda note=note: clean_markdown_lines(note), repeat, params, units))
+    notes = [make_note(rng) for _ in range(1000)]
+    results.append(measure("text.key_points_batch", lambda: extract_key_points_batch(notes), repeat, {"notes": len(notes)}, {"notes": len(notes)}))
+    return results
+
+def bench_list_notes(workdir, counts, repeat):
+    from config.settings import settings
+    from benchmarks.fixtures import make_notes_folder
+    from utils import note_catalog
+    from utils.file_handler import list_notes, count_notes
+    results = []
+    for count in counts:
+        settings.NOTES_FOLDER = make_notes_folder(os.path.join(workdir, f"notes_{count}"), count, seed=count)
+        settings.CACHE_FOLDER = os.path.join(workdir, f"catalog_{count}")
+        os.makedirs(settings.CACHE_FOLDER, exist_ok=True)
+        params = {"notes": count}
+        results.append(measure("catalog.rebuild", note_catalog.rebuild_catalog, 1, params, {"notes": count}))
+        results.append(measure("list_notes.first_page", lambda: list_notes(0, settings.NOTES_PAGE_SIZE), repeat, params))
+        results.append(measure("list_notes.last_page", lambda count=count: list_notes(max(0, count - settings.NOTES_PAGE_SIZE), settings.NOTES_PAGE_SIZE), repeat, params))
+        results.append(measure("list_notes.all", list_notes, repeat, params, {"notes": count}))
+        results.append(measure("count_notes", count_notes, repeat, params))
+        results.append(measure("search_notes", lambda: note_catalog.search_notes("recursion closure"), repeat, params))
+    return results
+
+def bench_note_store(workdir, count, repeat):
+    """Reading every note from a flat and a sharded folder, and migrating between the two"""
+    from benchmarks.fixtures import make_notes_folder
+    from utils import note_store
+    folder = make_notes_folder(os.path.join(workdir, "notes_store"), count, seed=count)
+    flat = note_store.open_note_store(folder)
+    names = list(flat.iter_filenames())
+
+    def read_all(store):
+        for name in names:
+            store.read(name)
+
+    results = [measure("note_store.read_all", lambda: read_all(flat), repeat,
+                       {"layout": "flat", "notes": count, "bytes": flat.size_on_disk()}, {"notes": count})]
+    results.append(measure("note_store.migrate", lambda: note_store.migrate(folder, "sharded", train_dictionary=True), 1,
+                           {"notes": count}, {"notes": count}))
+    sharded = note_store.open_note_store(folder)
+    results.append(measure("note_store.read_all", lambda: read_all(sharded), repeat,
+                           {"layout": "sharded", "notes": count, "bytes": sharded.size_on_disk()}, {"notes": count}))
+    results.append(measure("note_store.list", lambda: list(sharded.iter_filenames()), repeat, {"layout": "sharded", "notes": count}))
+    return results
+
+def bench_end_to_end(workdir, pdfs, repeat, max_pages):
+    from config.settings import settings
+    from agents.note_agent import generate_notes_from_pdf
+    from utils.file_handler import save_note_content
+    from utils.pdf_exporter import markdown_to_pdf
+    from utils.pdf_extractor import extract_pdf_text
+    settings.NOTES_FOLDER = os.path.join(workdir, "notes_e2e")
+    os.makedirs(settings.NOTES_FOLDER, exist_ok=True)
+    counter = iter(range(10 ** 9))
+
+    def pipeline(path):
+        settings.PDF_PAGE_CACHE_ENABLED = False
+        notes = generate_notes_from_pdf(extract_pdf_text(path), regenerate=True)
+        save_note_content(notes, f"PDF_Notes_bench_{next(counter)}_20250101_000000.md", topic="bench", source_type="pdf")
+        markdown_to_pdf(notes)
+
+    return [
+        measure("end_to_end.pdf", lambda path=path: pipeline(path), repeat, {"pages": pages}, {"pages": pages})
+        for pages, path in pdfs.items() if pages <= max_pages
+    ]
+
+def compare(base_path, new_path):
+    """Print the p50 change of every benchmark present in both result files"""
+    with open(base_path, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    key = lambda result: (result["benchmark"], json.dumps(result["params"], sort_keys=True))
+    baseline = {key(result): result for result in base["results"]}
+    print(f"{'benchmark':<28} {'params':<18} {'base ms':>10} {'new ms':>10} {'change':>8}")
+    for result in new["results"]:
+        old = baseline.get(key(result))
+        if old is None:
+            continue
+        label = " ".join(f"{k}={v}" for k, v in result["params"].items())
+        change = (result["p50_s"] / old["p50_s"] - 1) if old["p50_s"] else 0.0
+        print(f"{result['benchmark']:<28} {label:<18} {old['p50_s'] * 1000:10.2f} {result['p50_s'] * 1000:10.2f} {change:+8.1%}")
+
+def _int_list(value):
+    return [int(item) for item in value.split(",") if item]
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the note generation pipeline")
+    parser.add_argument("--pages", type=_int_list, default=[1, 10, 100, 1000], help="Synthetic PDF sizes, comma separated")
+    parser.add_argument("--notes", type=_int_list, default=[10, 1000, 100000], help="Note counts for list_notes, comma separated")
+    parser.add_argument("--save-count", type=int, default=100, help="Notes written in the save_note_content benchmark")
+    parser.add_argument("--max-generate-pages", type=int, default=1000, help="Largest PDF sent through generation")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake LLM latency per call in seconds")
+    parser.add_argument("--output-tokens", type=int, default=400, help="Fake LLM tokens per response")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Fake LLM generation rate (0 = instant)")
+    parser.add_argument("--quick", action="store_true", help="Small sizes only: 1,10 pages and 10,1000 notes")
+    parser.add_argument("--workdir", help="Scratch directory (default: a new temporary directory)")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="Compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.quick:
+        args.pages, args.notes, args.repeat, args.save_count = [1, 10], [10, 1000], 2, 20
+
+    output = os.path.abspath(args.output) if args.output else None
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="notemaker-bench-"))
+    print(f"Benchmarking in {workdir}", file=sys.stderr)
+    _prepare_environment(workdir, args)
+
+    from config.settings import settings
+    from utils.metrics import get_metrics, peak_rss_mb
+    get_metrics().reset()
+
+    started = time.perf_counter()
+    results = bench_import_time(args.repeat)
+    pdfs = bench_fixtures(workdir, args.pages)
+    extraction, texts = bench_extraction(pdfs, args.repeat)
+    results += extraction
+    results += bench_prompt_build(texts, args.repeat)
+    results += bench_generation(texts, args.repeat, args.max_generate_pages)
+    results += bench_save_notes(workdir, args.save_count)
+    results += bench_markdown_to_pdf(args.repeat)
+    results += bench_text_processing([1] if args.quick else [1, 8], args.repeat)
+    results += bench_end_to_end(workdir, pdfs, args.repeat, min(100, args.max_generate_pages))
+    results += bench_list_notes(workdir, args.notes, args.repeat)
+    results += bench_note_store(workdir, max(args.notes), args.repeat)
+
+    report = {
+        "schema": 1,
+        "commit": _git_commit(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "fake_llm": {"latency": args.latency, "output_tokens": args.output_tokens, "tokens_per_second": args.tokens_per_second},
+            "repeat": args.repeat,
+            "llm_max_in_flight": settings.LLM_MAX_IN_FLIGHT,
+            "pdf_chunk_size": settings.PDF_CHUNK_SIZE,
+            "pdf_map_concurrency": settings.PDF_MAP_CONCURRENCY,
+        },
+        "duration_s": time.perf_counter() - started,
+        "peak_rss_mb": peak_rss_mb(),
+        "results": results,
+        # Per-stage timings, token counts and cache hit rates from utils.metrics
+        "instrumentation": get_metrics().snapshot(),
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Results written to {output}", file=sys.stderr)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
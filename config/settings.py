@@ -5,18 +5,155 @@ load_dotenv()
 
 class Settings:
     PROVIDER = os.getenv("LLM_PROVIDER", "google")
+    # Providers to route between (google, openai, ollama), in order of preference
+    LLM_PROVIDERS = os.getenv("LLM_PROVIDERS", PROVIDER)
     
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
     
+    # Any OpenAI-compatible chat completions endpoint
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    # A local Ollama or llama.cpp server (both speak the OpenAI API under /v1)
+    OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1")
+    OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1")
+    
+    # Per-provider limits on concurrent calls, so one slow backend cannot hold every slot
+    GOOGLE_MAX_CONCURRENCY = int(os.getenv("GOOGLE_MAX_CONCURRENCY", "4"))
+    OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "4"))
+    OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "1"))
+    # Routing: seconds before a call counts as failed, base cooldown after a failure,
+    # share of calls sent to a random provider to keep latency estimates fresh
+    LLM_PROVIDER_TIMEOUT = float(os.getenv("LLM_PROVIDER_TIMEOUT", "120"))
+    LLM_PROVIDER_COOLDOWN = float(os.getenv("LLM_PROVIDER_COOLDOWN", "30"))
+    LLM_PROVIDER_EXPLORE = float(os.getenv("LLM_PROVIDER_EXPLORE", "0.05"))
+    LLM_PROVIDER_LATENCY_WINDOW = int(os.getenv("LLM_PROVIDER_LATENCY_WINDOW", "50"))
+    
+    # Pin a model (e.g. "models/gemini-2.5-flash") to skip model discovery entirely
+    GEMINI_MODEL = os.getenv("GEMINI_MODEL")
+    # Seconds a discovered model name is reused before list_models() is called again
+    MODEL_CACHE_TTL = int(os.getenv("MODEL_CACHE_TTL", "3600"))
+    LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.7"))
+    
+    # Global limits on concurrent LLM calls; excess requests queue fairly across sessions
+    LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "4"))
+    LLM_MAX_QUEUED = int(os.getenv("LLM_MAX_QUEUED", "100"))
+    LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "300"))  # 0 waits forever
+    
+    # Client-side rate limiting and retries for LLM calls; 0 requests per minute disables the limiter
+    LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "10"))
+    LLM_BURST = int(os.getenv("LLM_BURST", "0"))  # 0 means one minute's worth of requests
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+    LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+    LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "60"))
+    # Identical prompts in flight at the same time share one upstream call
+    LLM_COALESCE_REQUESTS = os.getenv("LLM_COALESCE_REQUESTS", "true").lower() == "true"
+    
     UPLOAD_FOLDER = "uploads"
     NOTES_FOLDER = "generated_notes"
+    CACHE_FOLDER = os.getenv("CACHE_FOLDER", "cache")
+    
+    # Stage timings, token counts and cache hit rates; events are appended to METRICS_LOG_FILE
+    # as JSON lines, and Prometheus text is written to METRICS_PROMETHEUS_FILE and/or served
+    # on METRICS_PORT (at /metrics) when those are set
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    METRICS_LOG_FILE = os.getenv("METRICS_LOG_FILE", os.path.join(CACHE_FOLDER, "metrics.jsonl"))
+    METRICS_PROMETHEUS_FILE = os.getenv("METRICS_PROMETHEUS_FILE", "")
+    METRICS_EXPORT_INTERVAL = float(os.getenv("METRICS_EXPORT_INTERVAL", "15"))
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+    # Price per 1000 tokens for cost accounting; the free tier costs nothing
+    LLM_COST_PER_1K_PROMPT_TOKENS = float(os.getenv("LLM_COST_PER_1K_PROMPT_TOKENS", "0"))
+    LLM_COST_PER_1K_COMPLETION_TOKENS = float(os.getenv("LLM_COST_PER_1K_COMPLETION_TOKENS", "0"))
+    
+    # Generated notes are reused for identical (normalized) requests until they expire
+    RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+    
+    # PDF text extraction: "auto" uses pypdf and falls back to pdfplumber for layout-heavy pages
+    PDF_EXTRACT_ENGINE = os.getenv("PDF_EXTRACT_ENGINE", "auto")
+    PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "0"))  # 0 means one per CPU
+    PDF_PAGES_PER_SHARD = int(os.getenv("PDF_PAGES_PER_SHARD", "25"))
+    PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+    # Cache per-page text in a sidecar next to each PDF so known documents skip extraction
+    PDF_PAGE_CACHE_ENABLED = os.getenv("PDF_PAGE_CACHE_ENABLED", "true").lower() == "true"
+    # Memory bounds for large uploads: bytes copied per read when saving an upload, documents
+    # extracted at once per process (others wait), and characters of text kept per document
+    UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+    PDF_MAX_CONCURRENT_EXTRACTIONS = int(os.getenv("PDF_MAX_CONCURRENT_EXTRACTIONS", "2"))
+    PDF_MAX_TEXT_CHARS = int(os.getenv("PDF_MAX_TEXT_CHARS", "20000000"))  # 0 means unlimited
+    
+    # Large PDFs are summarized chunk by chunk (map) and then merged into one note (reduce)
+    PDF_CHUNK_SIZE = int(os.getenv("PDF_CHUNK_SIZE", "12000"))
+    PDF_CHUNK_OVERLAP = int(os.getenv("PDF_CHUNK_OVERLAP", "500"))
+    PDF_MAP_CONCURRENCY = int(os.getenv("PDF_MAP_CONCURRENCY", "4"))
+    
+    # With a focus topic, only the best-matching chunks of a large PDF are sent to the model
+    PDF_RETRIEVAL_CHUNK_SIZE = int(os.getenv("PDF_RETRIEVAL_CHUNK_SIZE", "2000"))
+    PDF_RETRIEVAL_OVERLAP = int(os.getenv("PDF_RETRIEVAL_OVERLAP", "200"))
+    PDF_RETRIEVAL_TOP_K = int(os.getenv("PDF_RETRIEVAL_TOP_K", "8"))
+    PDF_RETRIEVAL_MAX_DOCUMENTS = int(os.getenv("PDF_RETRIEVAL_MAX_DOCUMENTS", "200"))
+    
+    # Section-by-section topic notes: template sections generated concurrently
+    NOTE_SECTION_CONCURRENCY = int(os.getenv("NOTE_SECTION_CONCURRENCY", "10"))
+    
+    # Chat agent: history is limited to the last AGENT_MEMORY_TURNS exchanges and
+    # roughly AGENT_MEMORY_TOKENS tokens; one agent is cached per session
+    AGENT_MEMORY_TURNS = int(os.getenv("AGENT_MEMORY_TURNS", "5"))
+    AGENT_MEMORY_TOKENS = int(os.getenv("AGENT_MEMORY_TOKENS", "4000"))
+    AGENT_MAX_ITERATIONS = int(os.getenv("AGENT_MAX_ITERATIONS", "4"))
+    AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "32"))
+    
+    NOTES_PAGE_SIZE = int(os.getenv("NOTES_PAGE_SIZE", "50"))
+    # Number of note contents kept in memory by read_note_content
+    NOTE_READ_CACHE_SIZE = int(os.getenv("NOTE_READ_CACHE_SIZE", "64"))
+    # Version history of note edits, stored as deltas with a full snapshot every
+    # NOTE_HISTORY_KEYFRAME_INTERVAL versions; only the newest NOTE_HISTORY_MAX_VERSIONS are kept
+    NOTE_HISTORY_ENABLED = os.getenv("NOTE_HISTORY_ENABLED", "true").lower() == "true"
+    NOTE_HISTORY_KEYFRAME_INTERVAL = int(os.getenv("NOTE_HISTORY_KEYFRAME_INTERVAL", "20"))
+    NOTE_HISTORY_MAX_VERSIONS = int(os.getenv("NOTE_HISTORY_MAX_VERSIONS", "50"))
+    # Layout of new notes folders: "flat" (one file per note) or "sharded" (hash-named
+    # subdirectories, zstd-compressed when zstandard is installed). Existing folders keep
+    # the layout they were written with; convert them with python -m utils.note_store migrate
+    NOTE_STORE = os.getenv("NOTE_STORE", "flat").lower()
+    NOTE_STORE_COMPRESSION = os.getenv("NOTE_STORE_COMPRESSION", "zstd").lower()
+    NOTE_STORE_ZSTD_LEVEL = int(os.getenv("NOTE_STORE_ZSTD_LEVEL", "10"))
+    
+    # Number of rendered note PDFs kept in memory, keyed by note content
+    PDF_RENDER_CACHE_SIZE = int(os.getenv("PDF_RENDER_CACHE_SIZE", "32"))
+    
+    # Semantic index over notes and PDF chunks; EMBEDDING_MODEL names a locally cached
+    # sentence-transformers model, otherwise offline hashing embeddings are used
+    SEMANTIC_INDEX_ENABLED = os.getenv("SEMANTIC_INDEX_ENABLED", "true").lower() == "true"
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "")
+    EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "512"))
+    # Cosine similarity above which an existing note counts as covering a new request
+    SIMILAR_NOTE_THRESHOLD = float(os.getenv("SIMILAR_NOTE_THRESHOLD", "0.6"))
+    # Index changes are journaled; the full index is rewritten after this many journaled entries
+    SEMANTIC_INDEX_COMPACT_AFTER = int(os.getenv("SEMANTIC_INDEX_COMPACT_AFTER", "1000"))
+    
+    # Background generation jobs; set JOB_LOCAL_WORKERS=0 when running worker.py separately
+    JOB_LOCAL_WORKERS = int(os.getenv("JOB_LOCAL_WORKERS", "2"))
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+    JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "120"))
     
     def __init__(self):
-        if self.PROVIDER == "google" and not self.GOOGLE_API_KEY:
+        providers = [name.strip().lower() for name in self.LLM_PROVIDERS.split(",")]
+        if "google" in providers and not self.GOOGLE_API_KEY:
             raise ValueError("GOOGLE_API_KEY is required when using Google provider")
+        if "openai" in providers and not self.OPENAI_API_KEY:
+            raise ValueError("OPENAI_API_KEY is required when using the OpenAI-compatible provider")
     
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    os.makedirs(NOTES_FOLDER, exist_ok=True)
+    # Folders created so far; importing settings has no side effects on disk
+    _ready_folders = None
+    
+    def ensure_folders(self):
+        """Create the upload, notes and cache folders if needed; cheap to call before every use"""
+        folders = (self.UPLOAD_FOLDER, self.NOTES_FOLDER, self.CACHE_FOLDER)
+        if folders != self._ready_folders:
+            for folder in folders:
+                os.makedirs(folder, exist_ok=True)
+            self._ready_folders = folders
 
 try:
     settings = Settings()
@@ -24,5 +161,3 @@ except ValueError as e:
     print(f"Configuration Error: {e}")
     print("Please check your .env file configuration")
     raise
-
-print(f"Using LLM Provider: {settings.PROVIDER}")
\ No newline at end of file
@@ -0,0 +1,78 @@
+import re
+
+def get_note_template():
+    return """
+# {language} - Complete Notes
+
+## Table of Contents
+1. [Introduction](#introduction)
+2. [Basic Concepts](#basic-concepts)
+3. [Syntax and Structure](#syntax-and-structure)
+4. [Data Types and Variables](#data-types-and-variables)
+5. [Control Structures](#control-structures)
+6. [Functions and Methods](#functions-and-methods)
+7. [Advanced Topics](#advanced-topics)
+8. [Best Practices](#best-practices)
+9. [Common Examples](#common-examples)
+10. [FAQ](#faq)
+
+## Introduction
+{introduction}
+
+## Basic Concepts
+{basic_concepts}
+
+## Syntax and Structure
+{syntax_structure}
+
+## Data Types and Variables
+{data_types_variables}
+
+## Control Structures
+{control_structures}
+
+## Functions and Methods
+{functions_methods}
+
+## Advanced Topics
+{advanced_topics}
+
+## Best Practices
+{best_practices}
+
+## Common Examples
+{examples}
+
+## FAQ
+{faq}
+
+## Additional Resources
+- Official Documentation: [Link]
+- Tutorials: [Links]
+- Community: [Links]
+"""
+
+# "## Heading" immediately followed by its "{placeholder}" line
+_TEMPLATE_SECTION = re.compile(r'^## (?P<heading>.+)\n\{(?P<key>\w+)\}', re.MULTILINE)
+_NOTE_HEADING = re.compile(r'^## (?P<heading>.+?)[ \t]*$', re.MULTILINE)
+
+def get_note_sections():
+    """(placeholder, heading) pairs for the fillable sections of the note template, in order"""
+    return [(match["key"], match["heading"].strip()) for match in _TEMPLATE_SECTION.finditer(get_note_template())]
+
+def fill_note_template(title, sections):
+    """Assemble a note from section bodies keyed by placeholder; missing sections are left empty"""
+    bodies = {key: sections.get(key, "").strip() for key, _ in get_note_sections()}
+    return get_note_template().format(language=title, **bodies).strip() + "\n"
+
+def split_note_sections(note):
+    """Recover the section bodies of a note assembled with fill_note_template, keyed by placeholder"""
+    keys = {heading: key for key, heading in get_note_sections()}
+    matches = list(_NOTE_HEADING.finditer(note))
+    sections = {}
+    for i, match in enumerate(matches):
+        key = keys.get(match["heading"])
+        if key:
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(note)
+            sections[key] = note[match.end():end].strip()
+    return sections
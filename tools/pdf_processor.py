@@ -1,8 +1,11 @@
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
-from typing import Type
-import pdfplumber
+from typing import Optional, Type
+import asyncio
 import os
+from config.settings import settings
+from utils.pdf_extractor import extract_pdf_text
+from utils.text_processor import split_into_chunks
 
 class PDFProcessorInput(BaseModel):
     file_path: str = Field(description="Path to the PDF file to process")
@@ -11,25 +14,50 @@ class PDFProcessorTool(BaseTool):
     name: str = "pdf_processor"
     description: str = "Process PDF files and extract content for note generation"
     args_schema: Type[BaseModel] = PDFProcessorInput
+    # Scheduler session the chunk summaries are queued under
+    session_id: Optional[str] = None
 
     def _run(self, file_path: str) -> str:
         try:
-            content = []
-            with pdfplumber.open(file_path) as pdf:
-                for page in pdf.pages:
-                    text = page.extract_text()
-                    if text:
-                        content.append(text)
+            full_content = extract_pdf_text(file_path)
             
-            full_content = "\n".join(content)
-            
-            # Limit content size to avoid token limits
-            if len(full_content) > 10000:
-                full_content = full_content[:10000] + "... (truncated)"
+            # Condense large documents chunk by chunk instead of dropping everything past the limit
+            if len(full_content) > settings.PDF_CHUNK_SIZE:
+                from agents.note_agent import summarize_pdf_chunks
+                chunks = split_into_chunks(full_content, settings.PDF_CHUNK_SIZE, settings.PDF_CHUNK_OVERLAP)
+                full_content = "\n\n".join(summarize_pdf_chunks(chunks, session_id=self.session_id))
             
             return full_content
         except Exception as e:
             return f"Error processing PDF: {str(e)}"
     
-    async def _arun(self, file_path: str):
-        raise NotImplementedError("PDFProcessorTool does not support async")
\ No newline at end of file
+    async def _arun(self, file_path: str) -> str:
+        # Extraction is CPU-bound, so keep it off the event loop
+        return await asyncio.to_thread(self._run, file_path)
+
+class PDFNoteGeneratorInput(BaseModel):
+    file_path: str = Field(description="Path to the PDF file to generate notes from")
+    topic: Optional[str] = Field(default=None, description="Optional topic to focus the notes on")
+
+class PDFNoteGeneratorTool(BaseTool):
+    name: str = "pdf_note_generator"
+    description: str = "Generate study notes from a PDF file, optionally focused on one topic"
+    args_schema: Type[BaseModel] = PDFNoteGeneratorInput
+    return_direct: bool = True
+    session_id: Optional[str] = None
+
+    def _run(self, file_path: str, topic: Optional[str] = None) -> str:
+        from agents.note_agent import generate_notes_from_pdf
+        try:
+            content = extract_pdf_text(file_path)
+        except Exception as e:
+            return f"Error processing PDF: {str(e)}"
+        return generate_notes_from_pdf(content, topic=topic, session_id=self.session_id)
+    
+    async def _arun(self, file_path: str, topic: Optional[str] = None) -> str:
+        from agents.note_agent import agenerate_notes_from_pdf
+        try:
+            content = await asyncio.to_thread(extract_pdf_text, file_path)
+        except Exception as e:
+            return f"Error processing PDF: {str(e)}"
+        return await agenerate_notes_from_pdf(content, topic=topic, session_id=self.session_id)
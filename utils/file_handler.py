@@ -1,58 +1,221 @@
+import hashlib
 import os
+import re
+import threading
 import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 from config.settings import settings
-import streamlit as st
+from utils import note_catalog, note_history
+from utils.file_lock import file_lock
+from utils.note_store import get_note_store, check_filename
+from utils.metrics import instrumented, record_cache
 
+# Recently read notes as {filename: ((mtime_ns, size), content)}
+_read_cache = OrderedDict()
+_read_cache_lock = threading.Lock()
+
+# Writers of a note hold one of a fixed set of locks, picked by a hash of its filename, so
+# neither these nor their lock files grow with the number of notes ever written
+_NOTE_LOCK_STRIPES = 64
+_note_locks = [threading.Lock() for _ in range(_NOTE_LOCK_STRIPES)]
+
+# Characters that cannot appear in a filename on some platform, plus whitespace
+_UNSAFE_FILENAME_CHARS = re.compile(r'[\\/:*?"<>|\s\x00-\x1f]+')
+
+class NoteConflictError(RuntimeError):
+    """Raised when a note was changed by someone else since the caller read it"""
+
+def _safe_filename_part(text):
+    return _UNSAFE_FILENAME_CHARS.sub('_', text).strip('._') or "untitled"
+
+def _unique_suffix():
+    """Timestamp plus a random id, so notes created in the same second never share a name"""
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+def _lock_stripe(note_filename):
+    # hashlib rather than hash(), which differs between processes
+    return int.from_bytes(hashlib.sha1(note_filename.encode("utf-8")).digest()[:4], "big") % _NOTE_LOCK_STRIPES
+
+@contextmanager
+def note_lock(note_filename):
+    """Hold the write lock of one note, across threads and, through a lock file, across processes"""
+    stripe = _lock_stripe(note_filename)
+    lock_path = os.path.join(settings.CACHE_FOLDER, "locks", f"stripe-{stripe}.lock")
+    with _note_locks[stripe], file_lock(lock_path):
+        yield
+
+@instrumented("file.save_upload")
 def save_uploaded_file(uploaded_file):
-    """Save uploaded file to uploads folder"""
-    file_id = str(uuid.uuid4())
-    file_extension = uploaded_file.name.split('.')[-1]
-    file_path = os.path.join(settings.UPLOAD_FOLDER, f"{file_id}.{file_extension}")
+    """Save uploaded file to uploads folder
+    
+    Files are named by the SHA-256 of their content, so uploading the same file again
+    reuses the stored copy (and any extraction cache kept next to it). The upload is
+    copied and hashed UPLOAD_CHUNK_SIZE bytes at a time, so it is never duplicated in memory.
+    """
+    settings.ensure_folders()
+    file_extension = uploaded_file.name.split('.')[-1].lower()
+    tmp_path = os.path.join(settings.UPLOAD_FOLDER, f"{uuid.uuid4().hex}.{file_extension}.tmp")
+    digest = hashlib.sha256()
     
-    with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+    uploaded_file.seek(0)
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in iter(lambda: uploaded_file.read(settings.UPLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                f.write(chunk)
+        file_path = os.path.join(settings.UPLOAD_FOLDER, f"{digest.hexdigest()}.{file_extension}")
+        if not os.path.exists(file_path):
+            os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
     
     return file_path
 
-def save_note_content(content, filename=None):
-    """Save generated notes to file"""
+def topic_note_filename(language, topic):
+    """Build a unique filename for notes generated from a topic"""
+    return f"{_safe_filename_part(language)}_{_safe_filename_part(topic)}_{_unique_suffix()}.md"
+
+def pdf_note_filename(upload_name):
+    """Build a unique filename for notes generated from an uploaded PDF"""
+    stem = re.sub(r'\.pdf$', '', upload_name, flags=re.IGNORECASE)
+    return f"PDF_Notes_{_safe_filename_part(stem)}_{_unique_suffix()}.md"
+
+@instrumented("file.save_note")
+def save_note_content(content, filename=None, language=None, topic=None, source_type=None):
+    """Save generated notes to file and record them in the notes catalog"""
     if not filename:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"note_{timestamp}.md"
-    
-    file_path = os.path.join(settings.NOTES_FOLDER, filename)
+        filename = f"note_{_unique_suffix()}.md"
     
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(content)
+    settings.ensure_folders()
+    check_filename(filename)
     
+    with note_lock(filename):
+        file_path = get_note_store().write(filename, content)
+        if settings.NOTE_HISTORY_ENABLED:
+            note_history.record_version(filename, content)
+        # Still under the lock, so the catalog and index end up with the last write, not the last to finish
+        _invalidate_read_cache(filename)
+        note_catalog.upsert_note(filename, content, language, topic, source_type)
+        _update_semantic_index("index_note", filename, content)
     return file_path
 
-def list_notes():
-    """List all generated notes"""
-    notes = []
-    for filename in os.listdir(settings.NOTES_FOLDER):
-        if filename.endswith(('.md', '.txt')):
-            notes.append(filename)
-    return sorted(notes, reverse=True)
+@instrumented("file.list_notes")
+def list_notes(offset=0, limit=None, sort_by="filename", descending=True):
+    """List generated notes from the catalog, one page at a time
+    
+    With no arguments this returns every note sorted by filename, newest first.
+    """
+    records = note_catalog.list_note_records(offset, limit, sort_by, descending)
+    return [record["filename"] for record in records]
+
+def count_notes():
+    """Number of notes in the catalog"""
+    return note_catalog.count_notes()
+
+def _update_semantic_index(action, *args):
+    """Keep the semantic index in step with note files without ever failing the file operation"""
+    if not settings.SEMANTIC_INDEX_ENABLED:
+        return
+    try:
+        # Imported lazily: numpy and faiss are only needed once notes are being indexed
+        from utils import semantic_index
+        getattr(semantic_index, action)(*args)
+    except Exception as e:
+        print(f"Semantic index not updated: {e}")
 
+def _invalidate_read_cache(note_filename):
+    with _read_cache_lock:
+        _read_cache.pop(note_filename, None)
+
+@instrumented("file.read_note")
 def read_note_content(note_filename):
-    """Read content of a note file"""
-    file_path = os.path.join(settings.NOTES_FOLDER, note_filename)
-    with open(file_path, "r", encoding="utf-8") as f:
-        return f.read()
-
-def update_note_content(note_filename, new_content):
-    """Update content of an existing note"""
-    file_path = os.path.join(settings.NOTES_FOLDER, note_filename)
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(new_content)
+    """Read content of a note file
+    
+    Contents are cached per file and revalidated against its size and mtime, so
+    reselecting a note does not reread it from disk.
+    """
+    store = get_note_store()
+    stat = store.stat(note_filename)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    
+    with _read_cache_lock:
+        cached = _read_cache.get(note_filename)
+        hit = cached is not None and cached[0] == signature
+        if hit:
+            _read_cache.move_to_end(note_filename)
+    record_cache("note_read", hit)
+    if hit:
+        return cached[1]
+    
+    content = store.read(note_filename)
+    
+    with _read_cache_lock:
+        _read_cache[note_filename] = (signature, content)
+        while len(_read_cache) > settings.NOTE_READ_CACHE_SIZE:
+            _read_cache.popitem(last=False)
+    return content
+
+@instrumented("file.update_note")
+def update_note_content(note_filename, new_content, expected_version=None):
+    """Update content of an existing note
+    
+    The write is atomic and serialized with other writers of the note. With
+    expected_version (from current_note_version when the note was read), a note changed
+    by someone else in the meantime raises NoteConflictError instead of being overwritten.
+    """
+    store = get_note_store()
+    check_filename(note_filename)
+    with note_lock(note_filename):
+        if settings.NOTE_HISTORY_ENABLED:
+            current = note_history.latest_version(note_filename)
+            if expected_version is not None and expected_version != current:
+                raise NoteConflictError(f"'{note_filename}' was changed by someone else since it was opened")
+            if current == 0 and store.exists(note_filename):
+                # Notes written before history existed keep their original text as version 1
+                note_history.record_version(note_filename, store.read(note_filename))
+        file_path = store.write(note_filename, new_content)
+        if settings.NOTE_HISTORY_ENABLED:
+            note_history.record_version(note_filename, new_content)
+        _invalidate_read_cache(note_filename)
+        note_catalog.upsert_note(note_filename, new_content)
+        _update_semantic_index("index_note", note_filename, new_content)
     return file_path
 
+def current_note_version(note_filename):
+    """Latest version number of a note, to pass back to update_note_content as expected_version"""
+    if not settings.NOTE_HISTORY_ENABLED:
+        return None
+    return note_history.latest_version(note_filename)
+
+def note_versions(note_filename):
+    """Stored versions of a note, newest first"""
+    return note_history.list_versions(note_filename)
+
+def read_note_version(note_filename, version):
+    """Content of an earlier version of a note"""
+    content = note_history.get_version(note_filename, version)
+    if content is None:
+        raise ValueError(f"Version {version} of '{note_filename}' is not available")
+    return content
+
+@instrumented("file.rollback_note")
+def rollback_note(note_filename, version):
+    """Restore an earlier version; the restore is itself a new version, so it can be undone"""
+    content = read_note_version(note_filename, version)
+    update_note_content(note_filename, content)
+    return content
+
+@instrumented("file.delete_note")
 def delete_note_file(note_filename):
-    """Delete a note file"""
-    file_path = os.path.join(settings.NOTES_FOLDER, note_filename)
-    if os.path.exists(file_path):
-        os.remove(file_path)
-        return True
-    return False
\ No newline at end of file
+    """Delete a note file together with its version history"""
+    check_filename(note_filename)
+    with note_lock(note_filename):
+        _invalidate_read_cache(note_filename)
+        note_catalog.remove_note(note_filename)
+        _update_semantic_index("unindex_note", note_filename)
+        if settings.NOTE_HISTORY_ENABLED:
+            note_history.delete_history(note_filename)
+        return get_note_store().delete(note_filename)
@@ -0,0 +1,304 @@
+import functools
+import inspect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+from config.settings import settings
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak memory is then not reported
+    resource = None
+
+_PREFIX = "notemaker"
+
+def _quantile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+def usage_from_message(message, prompt=None):
+    """(prompt_tokens, completion_tokens, estimated) for a LangChain response message
+
+    Uses the provider's reported usage when present, otherwise estimates both counts
+    at four characters per token from the prompt and response text.
+    """
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0), False
+    usage = (getattr(message, "response_metadata", None) or {}).get("usage_metadata")
+    if usage:
+        return usage.get("prompt_token_count", 0), usage.get("candidates_token_count", 0), False
+    prompt_tokens = len(prompt) // 4 if isinstance(prompt, str) else 0
+    return prompt_tokens, len(str(getattr(message, "content", ""))) // 4, True
+
+class MetricsRegistry:
+    """In-process stage timings, LLM token and cost counters and cache hit rates"""
+
+    def __init__(self, window=512):
+        self.window = window
+        self._lock = threading.Lock()
+        self._last_export = 0.0
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self._stages = {}
+            self._llm = defaultdict(lambda: {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0})
+            self._caches = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+    def observe(self, stage, seconds, error=False):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = {
+                    "count": 0, "errors": 0, "total": 0.0, "max": 0.0, "recent": deque(maxlen=self.window)
+                }
+            stats["count"] += 1
+            stats["errors"] += bool(error)
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            stats["recent"].append(seconds)
+
+    def add_llm_usage(self, model, prompt_tokens, completion_tokens):
+        cost = (prompt_tokens * settings.LLM_COST_PER_1K_PROMPT_TOKENS
+                + completion_tokens * settings.LLM_COST_PER_1K_COMPLETION_TOKENS) / 1000
+        with self._lock:
+            usage = self._llm[model]
+            usage["requests"] += 1
+            usage["prompt_tokens"] += prompt_tokens
+            usage["completion_tokens"] += completion_tokens
+            usage["cost"] += cost
+        return cost
+
+    def add_cache_result(self, cache, hit):
+        with self._lock:
+            self._caches[cache]["hits" if hit else "misses"] += 1
+
+    def snapshot(self):
+        """Plain-dict copy of every metric, with p50/p95 over the recent window per stage"""
+        with self._lock:
+            stages = {
+                stage: {
+                    "count": stats["count"],
+                    "errors": stats["errors"],
+                    "total_seconds": stats["total"],
+                    "mean_seconds": stats["total"] / stats["count"],
+                    "p50_seconds": _quantile(stats["recent"], 0.5),
+                    "p95_seconds": _quantile(stats["recent"], 0.95),
+                    "max_seconds": stats["max"],
+                }
+                for stage, stats in self._stages.items()
+            }
+            return {
+                "started_at": self.started_at,
+                "stages": stages,
+                "llm": {model: dict(usage) for model, usage in self._llm.items()},
+                "caches": {cache: dict(counts) for cache, counts in self._caches.items()},
+            }
+
+    def prometheus_text(self):
+        """Render the current metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = [f"# TYPE {_PREFIX}_stage_duration_seconds summary"]
+        for stage, stats in sorted(snapshot["stages"].items()):
+            labels = f'stage="{_label(stage)}"'
+            lines.append(f'{_PREFIX}_stage_duration_seconds{{{labels},quantile="0.5"}} {stats["p50_seconds"]:.6f}')
+            lines.append(f'{_PREFIX}_stage_duration_seconds{{{labels},quantile="0.95"}} {stats["p95_seconds"]:.6f}')
+            lines.append(f'{_PREFIX}_stage_duration_seconds_sum{{{labels}}} {stats["total_seconds"]:.6f}')
+            lines.append(f'{_PREFIX}_stage_duration_seconds_count{{{labels}}} {stats["count"]}')
+        lines.append(f"# TYPE {_PREFIX}_stage_errors_total counter")
+        for stage, stats in sorted(snapshot["stages"].items()):
+            lines.append(f'{_PREFIX}_stage_errors_total{{stage="{_label(stage)}"}} {stats["errors"]}')
+
+        lines.append(f"# TYPE {_PREFIX}_llm_requests_total counter")
+        lines.append(f"# TYPE {_PREFIX}_llm_tokens_total counter")
+        lines.append(f"# TYPE {_PREFIX}_llm_cost_total counter")
+        for model, usage in sorted(snapshot["llm"].items()):
+            labels = f'model="{_label(model)}"'
+            lines.append(f'{_PREFIX}_llm_requests_total{{{labels}}} {usage["requests"]}')
+            lines.append(f'{_PREFIX}_llm_tokens_total{{{labels},type="prompt"}} {usage["prompt_tokens"]}')
+            lines.append(f'{_PREFIX}_llm_tokens_total{{{labels},type="completion"}} {usage["completion_tokens"]}')
+            lines.append(f'{_PREFIX}_llm_cost_total{{{labels}}} {usage["cost"]:.6f}')
+
+        lines.append(f"# TYPE {_PREFIX}_cache_requests_total counter")
+        for cache, counts in sorted(snapshot["caches"].items()):
+            lines.append(f'{_PREFIX}_cache_requests_total{{cache="{_label(cache)}",result="hit"}} {counts["hits"]}')
+            lines.append(f'{_PREFIX}_cache_requests_total{{cache="{_label(cache)}",result="miss"}} {counts["misses"]}')
+        return "\n".join(lines) + "\n"
+
+    def maybe_export(self):
+        """Rewrite METRICS_PROMETHEUS_FILE at most every METRICS_EXPORT_INTERVAL seconds"""
+        if not settings.METRICS_PROMETHEUS_FILE:
+            return
+        now = time.time()
+        with self._lock:
+            if now - self._last_export < settings.METRICS_EXPORT_INTERVAL:
+                return
+            self._last_export = now
+        write_prometheus_file(settings.METRICS_PROMETHEUS_FILE)
+
+_registry = MetricsRegistry()
+_event_logger = None
+_event_logger_lock = threading.Lock()
+
+def get_metrics():
+    """Process-wide metrics registry"""
+    return _registry
+
+def _get_event_logger():
+    """JSON-lines event logger writing to METRICS_LOG_FILE, rotated by size"""
+    global _event_logger
+    with _event_logger_lock:
+        if _event_logger is None:
+            logger = logging.getLogger("notemaker.metrics")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            if settings.METRICS_LOG_FILE:
+                os.makedirs(os.path.dirname(settings.METRICS_LOG_FILE) or ".", exist_ok=True)
+                handler = RotatingFileHandler(settings.METRICS_LOG_FILE, maxBytes=10 * 1024 * 1024, backupCount=3, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+            _event_logger = logger
+        return _event_logger
+
+def log_event(event, **fields):
+    """Write one structured event as a JSON line"""
+    if not settings.METRICS_ENABLED or not settings.METRICS_LOG_FILE:
+        return
+    record = {"ts": round(time.time(), 3), "event": event, "pid": os.getpid(), **fields}
+    _get_event_logger().info(json.dumps(record, default=str))
+
+@contextmanager
+def timed(stage, **fields):
+    """Time a block as one observation of stage; extra keys set on the yielded dict are logged with it"""
+    if not settings.METRICS_ENABLED:
+        yield fields
+        return
+    started = time.perf_counter()
+    error = None
+    try:
+        yield fields
+    except BaseException as e:
+        # A generator closed early by its consumer is not a failure
+        if not isinstance(e, GeneratorExit):
+            error = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        _registry.observe(stage, seconds, error is not None)
+        log_event("stage", stage=stage, seconds=round(seconds, 6), error=error, **fields)
+        _registry.maybe_export()
+
+def observe(stage, seconds):
+    """Record one externally measured duration for stage"""
+    if settings.METRICS_ENABLED:
+        _registry.observe(stage, seconds)
+
+def instrumented(stage):
+    """Decorator timing every call of a function, coroutine function or generator function as stage"""
+    def decorate(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timed(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                # Timed from the first to the last item the caller consumes
+                with timed(stage):
+                    yield from func(*args, **kwargs)
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def record_cache(cache, hit):
+    """Count a hit or miss for a named cache"""
+    if settings.METRICS_ENABLED:
+        _registry.add_cache_result(cache, hit)
+
+def record_llm_usage(model, message, prompt=None, seconds=None, operation="invoke"):
+    """Count the tokens (and cost) of one LLM response and log the call"""
+    if not settings.METRICS_ENABLED:
+        return
+    prompt_tokens, completion_tokens, estimated = usage_from_message(message, prompt)
+    cost = _registry.add_llm_usage(model, prompt_tokens, completion_tokens)
+    log_event(
+        "llm", model=model, operation=operation, prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens, estimated=estimated, cost=cost,
+        seconds=round(seconds, 6) if seconds is not None else None,
+    )
+
+def peak_rss_mb():
+    """Peak resident memory in MB of this process and of its finished child processes, or None where unsupported"""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux but in bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit, 1),
+    }
+
+def write_prometheus_file(path):
+    """Atomically write the current metrics in Prometheus text format, e.g. for node_exporter's textfile collector"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(_registry.prometheus_text())
+    os.replace(tmp_path, path)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = _registry.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(port=None):
+    """Serve /metrics on METRICS_PORT from a daemon thread; does nothing when the port is 0 or already serving"""
+    global _server
+    port = settings.METRICS_PORT if port is None else port
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            except OSError as e:
+                print(f"Metrics endpoint not started on port {port}: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
@@ -0,0 +1,262 @@
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from config.settings import settings
+from utils.note_store import get_note_store
+
+NOTE_EXTENSIONS = ('.md', '.txt')
+
+SORT_COLUMNS = ("filename", "created_at", "updated_at", "language", "topic", "source_type", "size")
+
+# {language}_{topic}_{YYYYmmdd}_{HHMMSS}_{id}.md and PDF_Notes_{upload}_{YYYYmmdd}_{HHMMSS}_{id}.md;
+# notes saved before the random id was added end with the time
+_FILENAME_PATTERN = re.compile(r'^(?P<stem>.+?)_(?P<date>\d{8})_(?P<time>\d{6})(?:_[0-9a-f]{8})?\.(?:md|txt)$')
+
+_SEARCH_TERM = re.compile(r'\w+', re.UNICODE)
+_SNIPPET_NOISE = re.compile(r'[*`#>|]+')
+
+# Bumped when the layout changes in a way that needs a rebuild; 1 keys notes_fts rows by notes.rowid
+CATALOG_VERSION = 1
+
+_catalog_checked = False
+_catalog_lock = threading.Lock()
+
+def _db_path():
+    return os.path.join(settings.CACHE_FOLDER, "notes_catalog.sqlite3")
+
+def _connect():
+    settings.ensure_folders()
+    conn = sqlite3.connect(_db_path(), timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS notes (
+            filename TEXT PRIMARY KEY,
+            language TEXT,
+            topic TEXT,
+            source_type TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            size INTEGER NOT NULL,
+            content_hash TEXT NOT NULL
+        )"""
+    )
+    for column in SORT_COLUMNS[1:]:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_notes_{column} ON notes({column})")
+    conn.execute(
+        """CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+            filename UNINDEXED, title, content, tokenize = 'porter unicode61'
+        )"""
+    )
+    return conn
+
+def _note_title(filename):
+    """Searchable title derived from the filename, e.g. 'Python Complete 20251110 142153'"""
+    return os.path.splitext(filename)[0].replace("_", " ")
+
+def _index_content(conn, filename, content):
+    # The filename column is UNINDEXED, so rows are addressed by the note's rowid instead
+    rowid = conn.execute("SELECT rowid FROM notes WHERE filename = ?", (filename,)).fetchone()[0]
+    conn.execute("DELETE FROM notes_fts WHERE rowid = ?", (rowid,))
+    conn.execute(
+        "INSERT INTO notes_fts (rowid, filename, title, content) VALUES (?, ?, ?, ?)",
+        (rowid, filename, _note_title(filename), content),
+    )
+
+def parse_note_filename(filename):
+    """Recover (language, topic, source_type, created_at) from a generated note's filename"""
+    match = _FILENAME_PATTERN.match(filename)
+    if not match:
+        return None, None, None, None
+    
+    created_at = datetime.strptime(match.group("date") + match.group("time"), "%Y%m%d%H%M%S").timestamp()
+    stem = match.group("stem")
+    if stem.startswith("PDF_Notes_"):
+        return None, stem[len("PDF_Notes_"):], "pdf", created_at
+    if stem == "note":
+        return None, None, None, created_at
+    language, _, topic = stem.partition("_")
+    return language, topic.replace("_", " ") or None, "topic", created_at
+
+def _upsert(conn, filename, content, language=None, topic=None, source_type=None, mtime=None):
+    parsed_language, parsed_topic, parsed_source, parsed_created = parse_note_filename(filename)
+    now = mtime or datetime.now().timestamp()
+    encoded = content.encode("utf-8")
+    conn.execute(
+        """INSERT INTO notes (filename, language, topic, source_type, created_at, updated_at, size, content_hash)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+           ON CONFLICT(filename) DO UPDATE SET
+               language = COALESCE(excluded.language, notes.language),
+               topic = COALESCE(excluded.topic, notes.topic),
+               source_type = COALESCE(excluded.source_type, notes.source_type),
+               updated_at = excluded.updated_at,
+               size = excluded.size,
+               content_hash = excluded.content_hash""",
+        (
+            filename,
+            language or parsed_language,
+            topic or parsed_topic,
+            source_type or parsed_source,
+            parsed_created or now,
+            now,
+            len(encoded),
+            hashlib.sha256(encoded).hexdigest(),
+        ),
+    )
+    _index_content(conn, filename, content)
+
+def upsert_note(filename, content, language=None, topic=None, source_type=None):
+    """Record a saved or updated note; metadata not given is kept or parsed from the filename"""
+    conn = _connect()
+    try:
+        with conn:
+            _upsert(conn, filename, content, language, topic, source_type)
+    finally:
+        conn.close()
+
+def remove_note(filename):
+    conn = _connect()
+    try:
+        with conn:
+            row = conn.execute("SELECT rowid FROM notes WHERE filename = ?", (filename,)).fetchone()
+            if row:
+                conn.execute("DELETE FROM notes_fts WHERE rowid = ?", (row[0],))
+                conn.execute("DELETE FROM notes WHERE rowid = ?", (row[0],))
+    finally:
+        conn.close()
+
+def get_note_record(filename):
+    """Return the catalog entry for a note as a dict, or None"""
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM notes WHERE filename = ?", (filename,)).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+def list_note_records(offset=0, limit=None, sort_by="filename", descending=True):
+    """Return one page of catalog entries sorted by any catalog column"""
+    if sort_by not in SORT_COLUMNS:
+        raise ValueError(f"Cannot sort notes by {sort_by!r}; choose one of {', '.join(SORT_COLUMNS)}")
+    ensure_catalog()
+    
+    direction = "DESC" if descending else "ASC"
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            f"SELECT * FROM notes ORDER BY {sort_by} {direction}, filename {direction} LIMIT ? OFFSET ?",
+            (-1 if limit is None else limit, offset),
+        )
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+def count_notes():
+    ensure_catalog()
+    conn = _connect()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+    finally:
+        conn.close()
+
+def _format_snippet(raw):
+    """Strip markdown from a raw snippet so only the matched terms end up bold"""
+    text = _SNIPPET_NOISE.sub(" ", raw)
+    text = " ".join(text.split())
+    return text.replace("\x01", "**").replace("\x02", "**")
+
+def _fts_query(query):
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix"""
+    terms = _SEARCH_TERM.findall(query)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+def search_notes(query, limit=20):
+    """Full-text search over note titles and contents, best BM25 matches first
+    
+    Returns dicts with filename, a snippet with matches wrapped in ** for markdown
+    highlighting, and the BM25 score (lower is better).
+    """
+    match = _fts_query(query)
+    if match is None:
+        return []
+    ensure_catalog()
+    
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            """SELECT filename,
+                      snippet(notes_fts, 2, char(1), char(2), ' … ', 16) AS snippet,
+                      bm25(notes_fts, 0.0, 5.0, 1.0) AS score
+               FROM notes_fts
+               WHERE notes_fts MATCH ?
+               ORDER BY score
+               LIMIT ?""",
+            (match, limit),
+        )
+        results = [dict(row) for row in rows]
+    finally:
+        conn.close()
+    
+    for result in results:
+        result["snippet"] = _format_snippet(result["snippet"])
+    return results
+
+def rebuild_catalog():
+    """Reindex every note in the notes folder, dropping entries for files that are gone"""
+    settings.ensure_folders()
+    store = get_note_store()
+    filenames = [name for name in store.iter_filenames() if name.endswith(NOTE_EXTENSIONS)]
+    
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("DELETE FROM notes")
+            conn.execute("DELETE FROM notes_fts")
+            conn.execute(f"PRAGMA user_version = {CATALOG_VERSION}")
+            for filename in filenames:
+                _upsert(conn, filename, store.read(filename), mtime=store.stat(filename).st_mtime)
+    finally:
+        conn.close()
+    return len(filenames)
+
+def ensure_catalog():
+    """Build the catalog on first use in a process if it is empty but notes exist"""
+    global _catalog_checked
+    if _catalog_checked:
+        return
+    with _catalog_lock:
+        if _catalog_checked:
+            return
+        conn = _connect()
+        try:
+            cataloged = conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+            indexed = conn.execute("SELECT COUNT(*) FROM notes_fts").fetchone()[0]
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            conn.close()
+        # An empty catalog, or one created with an older layout, is rebuilt
+        if cataloged != indexed or version < CATALOG_VERSION or (
+            cataloged == 0 and any(name.endswith(NOTE_EXTENSIONS) for name in get_note_store().iter_filenames())
+        ):
+            rebuild_catalog()
+        _catalog_checked = True
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the generated notes catalog")
+    parser.add_argument("command", choices=["rebuild"], help="rebuild: reindex every note in the notes folder")
+    args = parser.parse_args()
+    
+    if args.command == "rebuild":
+        count = rebuild_catalog()
+        print(f"Indexed {count} notes")
+
+if __name__ == "__main__":
+    main()
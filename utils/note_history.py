@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+from difflib import SequenceMatcher
+from config.settings import settings
+
+def _db_path():
+    # Kept with the notes rather than under CACHE_FOLDER: history is not rebuildable
+    return os.path.join(settings.NOTES_FOLDER, ".history.sqlite3")
+
+def _connect():
+    settings.ensure_folders()
+    conn = sqlite3.connect(_db_path(), timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS versions (
+            filename TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            kind TEXT NOT NULL,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            PRIMARY KEY (filename, version)
+        )"""
+    )
+    return conn
+
+def make_delta(old, new):
+    """Line-based delta turning old into new: [start, end] copies old lines, a string inserts text"""
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    ops = []
+    matcher = SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(new_lines[j1:j2]))
+    return ops
+
+def apply_delta(old, ops):
+    old_lines = old.splitlines(keepends=True)
+    return "".join(op if isinstance(op, str) else "".join(old_lines[op[0]:op[1]]) for op in ops)
+
+def _encode(kind, payload):
+    raw = payload if kind == "full" else json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return zlib.compress(raw.encode("utf-8"))
+
+def _decode(kind, data):
+    raw = zlib.decompress(data).decode("utf-8")
+    return raw if kind == "full" else json.loads(raw)
+
+def _content_at(conn, filename, version):
+    """Rebuild a version from the nearest full snapshot at or before it"""
+    rows = conn.execute(
+        """SELECT kind, data FROM versions
+           WHERE filename = ? AND version <= ? AND version >= (
+               SELECT MAX(version) FROM versions WHERE filename = ? AND kind = 'full' AND version <= ?
+           )
+           ORDER BY version""",
+        (filename, version, filename, version),
+    ).fetchall()
+    if not rows:
+        return None
+    content = None
+    for kind, data in rows:
+        payload = _decode(kind, data)
+        content = payload if kind == "full" else apply_delta(content, payload)
+    return content
+
+def record_version(filename, content):
+    """Store content as the note's next version and return its number
+
+    Versions are stored as compressed deltas against the previous one, with a full
+    snapshot every NOTE_HISTORY_KEYFRAME_INTERVAL versions so any version is rebuilt
+    from at most that many deltas. Saving unchanged content returns the latest version.
+    Only the newest NOTE_HISTORY_MAX_VERSIONS versions are kept.
+    """
+    content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    conn = _connect()
+    try:
+        # Taken up front so concurrent writers in other processes cannot pick the same number
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            latest = conn.execute(
+                "SELECT version, content_hash FROM versions WHERE filename = ? ORDER BY version DESC LIMIT 1",
+                (filename,),
+            ).fetchone()
+            if latest and latest[1] == content_hash:
+                conn.execute("COMMIT")
+                return latest[0]
+
+            version = latest[0] + 1 if latest else 1
+            last_full = conn.execute(
+                "SELECT MAX(version) FROM versions WHERE filename = ? AND kind = 'full'", (filename,)
+            ).fetchone()[0]
+            kind, data = "full", _encode("full", content)
+            if latest and last_full and version - last_full < settings.NOTE_HISTORY_KEYFRAME_INTERVAL:
+                delta = _encode("delta", make_delta(_content_at(conn, filename, latest[0]), content))
+                # A rewrite of most of the note is cheaper to store whole
+                if len(delta) < len(data):
+                    kind, data = "delta", delta
+            conn.execute(
+                "INSERT INTO versions (filename, version, created_at, kind, data, size, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (filename, version, time.time(), kind, data, len(content.encode("utf-8")), content_hash),
+            )
+            _prune(conn, filename, version)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return version
+    finally:
+        conn.close()
+
+def _prune(conn, filename, latest):
+    oldest_kept = latest - settings.NOTE_HISTORY_MAX_VERSIONS + 1
+    if settings.NOTE_HISTORY_MAX_VERSIONS <= 0 or oldest_kept <= 1:
+        return
+    row = conn.execute(
+        "SELECT kind FROM versions WHERE filename = ? AND version = ?", (filename, oldest_kept)
+    ).fetchone()
+    if row and row[0] == "delta":
+        # The oldest kept version becomes a snapshot, since the one it was based on goes away
+        content = _content_at(conn, filename, oldest_kept)
+        conn.execute(
+            "UPDATE versions SET kind = 'full', data = ? WHERE filename = ? AND version = ?",
+            (_encode("full", content), filename, oldest_kept),
+        )
+    conn.execute("DELETE FROM versions WHERE filename = ? AND version < ?", (filename, oldest_kept))
+
+def latest_version(filename):
+    """Number of the note's newest version, or 0 if it has no history"""
+    conn = _connect()
+    try:
+        return conn.execute("SELECT COALESCE(MAX(version), 0) FROM versions WHERE filename = ?", (filename,)).fetchone()[0]
+    finally:
+        conn.close()
+
+def list_versions(filename):
+    """Stored versions of a note, newest first"""
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT version, created_at, size, kind FROM versions WHERE filename = ? ORDER BY version DESC",
+            (filename,),
+        ).fetchall()
+    finally:
+        conn.close()
+    return [{"version": version, "created_at": created_at, "size": size, "kind": kind} for version, created_at, size, kind in rows]
+
+def get_version(filename, version):
+    """Content of one version of a note, or None if it is not stored"""
+    conn = _connect()
+    try:
+        return _content_at(conn, filename, version)
+    finally:
+        conn.close()
+
+def delete_history(filename):
+    conn = _connect()
+    try:
+        conn.execute("DELETE FROM versions WHERE filename = ?", (filename,))
+    finally:
+        conn.close()
@@ -0,0 +1,376 @@
+"""Storage layouts for note files
+
+flat: one loose file per note directly in NOTES_FOLDER, the original layout.
+sharded: notes spread over NOTES_FOLDER/ab/cd/ by a hash of their filename, so no
+directory grows past a few dozen entries, and zstd-compressed when the zstandard
+package is installed, optionally with a dictionary trained on existing notes.
+
+A folder that is not flat records its layout in .store.json, so a migrated folder is
+read correctly whatever NOTE_STORE says. Convert an existing folder with
+
+    python -m utils.note_store migrate --to sharded --train-dictionary
+    python -m utils.note_store migrate --to flat
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import uuid
+from config.settings import settings
+
+NOTE_EXTENSIONS = ('.md', '.txt')
+LAYOUT_FILE = ".store.json"
+DICTIONARY_FOLDER = ".dictionaries"
+COMPRESSED_SUFFIX = ".zst"
+LAYOUTS = ("flat", "sharded")
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+def _atomic_write(file_path, data):
+    """Write a file through a temporary file and a rename, so readers never see a partial note"""
+    tmp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def check_filename(filename):
+    """Reject note names that would point outside the notes folder"""
+    if not filename or os.path.basename(filename) != filename or filename in (".", ".."):
+        raise ValueError(f"Invalid note filename: {filename!r}")
+    return filename
+
+def _is_note(name):
+    return name.endswith(NOTE_EXTENSIONS) and not name.startswith(".")
+
+class FlatNoteStore:
+    """Every note is a plain UTF-8 file in the notes folder"""
+
+    layout = "flat"
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def path(self, filename):
+        """Where a note is written"""
+        return os.path.join(self.folder, check_filename(filename))
+
+    def paths(self, filename):
+        """Existing files holding a note; more than one only while a migration is under way"""
+        path = self.path(filename)
+        return [path] if os.path.isfile(path) else []
+
+    def _locate(self, filename):
+        # The usual case costs a single stat
+        path = self.path(filename)
+        if os.path.isfile(path):
+            return path
+        paths = self.paths(filename)
+        if not paths:
+            raise FileNotFoundError(f"Note not found: {filename}")
+        return paths[0]
+
+    def _decode(self, path, data):
+        return data.decode("utf-8")
+
+    def read(self, filename):
+        return self.read_path(self._locate(filename))
+
+    def read_path(self, path):
+        """Content of one specific copy of a note"""
+        with open(path, "rb") as f:
+            return self._decode(path, f.read())
+
+    def write(self, filename, content, keep_stale=False):
+        """Write a note atomically and return its path"""
+        path = self.path(filename)
+        _atomic_write(path, content.encode("utf-8"))
+        return path
+
+    def delete(self, filename):
+        """Remove every copy of a note; False if there was none"""
+        removed = False
+        for path in self.paths(filename):
+            removed = _remove(path) or removed
+        return removed
+
+    def exists(self, filename):
+        return bool(self.paths(filename))
+
+    def stat(self, filename):
+        return os.stat(self._locate(filename))
+
+    def iter_filenames(self):
+        """Names of every note, in no particular order"""
+        if not os.path.isdir(self.folder):
+            return
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if _is_note(entry.name) and entry.is_file():
+                    yield entry.name
+
+    def size_on_disk(self):
+        return sum(os.path.getsize(self.path(name)) for name in self.iter_filenames())
+
+class ShardedNoteStore(FlatNoteStore):
+    """Notes under two levels of hash-named subdirectories, optionally zstd-compressed
+
+    A compressed note is a single zstd frame in <filename>.zst. Frames name the
+    dictionary they were compressed with, and every dictionary is kept, so retraining
+    never makes older notes unreadable. Loose notes left in the top folder by an
+    unfinished migration are still found, and move into their shard on the next write.
+    """
+
+    layout = "sharded"
+
+    def __init__(self, folder, compression="zstd", level=10, dictionary_id=None):
+        super().__init__(folder)
+        if compression == "zstd" and _zstandard() is None:
+            print("zstandard is not installed; notes are stored uncompressed (pip install zstandard)")
+            compression = "none"
+        self.compression = compression
+        self.level = level
+        self.dictionary_id = dictionary_id
+        self._dictionaries = {}
+        # zstandard compressors must not be shared between threads
+        self._local = threading.local()
+
+    def _shard(self, filename):
+        digest = hashlib.sha1(filename.encode("utf-8")).hexdigest()
+        return os.path.join(self.folder, digest[:2], digest[2:4])
+
+    def path(self, filename):
+        shard = self._shard(check_filename(filename))
+        if self.compression == "zstd":
+            return os.path.join(shard, filename + COMPRESSED_SUFFIX)
+        return os.path.join(shard, filename)
+
+    def paths(self, filename):
+        shard = self._shard(check_filename(filename))
+        # The preferred copy first, then one written under another compression setting, then a loose one
+        candidates = [self.path(filename)]
+        for path in (os.path.join(shard, filename + COMPRESSED_SUFFIX), os.path.join(shard, filename), os.path.join(self.folder, filename)):
+            if path not in candidates:
+                candidates.append(path)
+        return [path for path in candidates if os.path.isfile(path)]
+
+    def _dictionary_path(self, dictionary_id):
+        return os.path.join(self.folder, DICTIONARY_FOLDER, f"{dictionary_id}.zdict")
+
+    def _dictionary(self, dictionary_id):
+        dictionary = self._dictionaries.get(dictionary_id)
+        if dictionary is None:
+            with open(self._dictionary_path(dictionary_id), "rb") as f:
+                dictionary = _zstandard().ZstdCompressionDict(f.read())
+            self._dictionaries[dictionary_id] = dictionary
+        return dictionary
+
+    def _compressor(self):
+        zstd = _zstandard()
+        key = (self.level, self.dictionary_id)
+        if getattr(self._local, "compressor_key", None) != key:
+            dictionary = self._dictionary(self.dictionary_id) if self.dictionary_id else None
+            self._local.compressor = zstd.ZstdCompressor(level=self.level, dict_data=dictionary)
+            self._local.compressor_key = key
+        return self._local.compressor
+
+    def _decompressor(self, dictionary_id):
+        decompressors = getattr(self._local, "decompressors", None)
+        if decompressors is None:
+            decompressors = self._local.decompressors = {}
+        if dictionary_id not in decompressors:
+            dictionary = self._dictionary(dictionary_id) if dictionary_id else None
+            decompressors[dictionary_id] = _zstandard().ZstdDecompressor(dict_data=dictionary)
+        return decompressors[dictionary_id]
+
+    def _decode(self, path, data):
+        if not path.endswith(COMPRESSED_SUFFIX):
+            return data.decode("utf-8")
+        zstd = _zstandard()
+        if zstd is None:
+            raise RuntimeError("Compressed notes need the zstandard package (pip install zstandard)")
+        dictionary_id = zstd.get_frame_parameters(data).dict_id
+        return self._decompressor(dictionary_id).decompress(data).decode("utf-8")
+
+    def write(self, filename, content, keep_stale=False):
+        """Write a note atomically and return its path
+
+        Copies elsewhere (loose, or under another compression setting) are removed unless
+        keep_stale is set, which lets a migration check the new copy before dropping the old.
+        """
+        if not os.path.exists(os.path.join(self.folder, LAYOUT_FILE)):
+            self.save_layout()
+        path = self.path(filename)
+        data = content.encode("utf-8")
+        if self.compression == "zstd":
+            data = self._compressor().compress(data)
+            # Checked before the rename, since it may replace the only other copy
+            if self._decode(path, data) != content:
+                raise RuntimeError(f"'{filename}' did not survive compression; nothing was written")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _atomic_write(path, data)
+        if not keep_stale:
+            for stale in self.paths(filename):
+                if stale != path:
+                    _remove(stale)
+        return path
+
+    def iter_filenames(self):
+        if not os.path.isdir(self.folder):
+            return
+        for top in sorted(os.listdir(self.folder)):
+            if len(top) != 2 or not os.path.isdir(os.path.join(self.folder, top)):
+                continue
+            for sub in sorted(os.listdir(os.path.join(self.folder, top))):
+                shard = os.path.join(self.folder, top, sub)
+                # A note stored both ways for a moment is listed once
+                names = {name[:-len(COMPRESSED_SUFFIX)] if name.endswith(COMPRESSED_SUFFIX) else name for name in os.listdir(shard)}
+                yield from (name for name in names if _is_note(name))
+        for name in super().iter_filenames():
+            if len(self.paths(name)) == 1:
+                yield name
+
+    def size_on_disk(self):
+        total = 0
+        for root, _, filenames in os.walk(self.folder):
+            for name in filenames:
+                if name.endswith(NOTE_EXTENSIONS + (COMPRESSED_SUFFIX,)) and not name.startswith("."):
+                    total += os.path.getsize(os.path.join(root, name))
+        return total
+
+    def save_layout(self):
+        os.makedirs(self.folder, exist_ok=True)
+        layout = {"layout": self.layout, "dictionary_id": self.dictionary_id}
+        _atomic_write(os.path.join(self.folder, LAYOUT_FILE), json.dumps(layout).encode("utf-8"))
+
+    def train_dictionary(self, samples, size):
+        """Train a zstd dictionary on sample note texts and compress new writes with it"""
+        zstd = _zstandard()
+        if self.compression != "zstd":
+            raise RuntimeError("Dictionaries need zstd compression (pip install zstandard)")
+        dictionary = zstd.train_dictionary(size, [sample.encode("utf-8") for sample in samples], level=self.level)
+        dictionary_id = dictionary.dict_id()
+        os.makedirs(os.path.join(self.folder, DICTIONARY_FOLDER), exist_ok=True)
+        _atomic_write(self._dictionary_path(dictionary_id), dictionary.as_bytes())
+        self.dictionary_id = dictionary_id
+        self.save_layout()
+        return dictionary_id
+
+def _read_layout(folder):
+    try:
+        with open(os.path.join(folder, LAYOUT_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def open_note_store(folder, layout=None):
+    """Store for a notes folder, in the layout it was written with unless one is given"""
+    recorded = _read_layout(folder) or {}
+    layout = layout or recorded.get("layout") or settings.NOTE_STORE
+    if layout == "flat":
+        return FlatNoteStore(folder)
+    if layout == "sharded":
+        return ShardedNoteStore(
+            folder, settings.NOTE_STORE_COMPRESSION, settings.NOTE_STORE_ZSTD_LEVEL, recorded.get("dictionary_id")
+        )
+    raise ValueError(f"Unknown note store layout: {layout!r}; expected {', '.join(LAYOUTS)}")
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_note_store():
+    """Store for the current NOTES_FOLDER, opened once per folder"""
+    folder = settings.NOTES_FOLDER
+    store = _stores.get(folder)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(folder)
+            if store is None:
+                store = _stores[folder] = open_note_store(folder)
+    return store
+
+def migrate(folder, layout, train_dictionary=False, dictionary_samples=2000, dictionary_size=112640):
+    """Move every note in folder into layout and return (notes, bytes before, bytes after)
+
+    Each note is written to its new place and read back before the old copy is removed,
+    so an interrupted migration loses nothing and can simply be run again. Migrating a
+    sharded folder to sharded recompresses it, with a freshly trained dictionary if asked.
+    """
+    source = open_note_store(folder)
+    target = open_note_store(folder, layout)
+    filenames = list(source.iter_filenames())
+    size_before = source.size_on_disk()
+
+    if isinstance(target, ShardedNoteStore):
+        if train_dictionary and target.compression != "zstd":
+            print("Not training a dictionary: notes are stored uncompressed")
+        elif train_dictionary and filenames:
+            sample_names = random.Random(0).sample(filenames, min(dictionary_samples, len(filenames)))
+            dictionary_id = target.train_dictionary([source.read(name) for name in sample_names], dictionary_size)
+            print(f"Trained dictionary {dictionary_id} on {len(sample_names)} notes")
+        # Recorded up front: while the migration runs, the folder must be read as sharded
+        target.save_layout()
+
+    for number, filename in enumerate(filenames, 1):
+        content = source.read(filename)
+        path = target.write(filename, content, keep_stale=True)
+        if target.read_path(path) != content:
+            raise RuntimeError(f"'{filename}' did not read back identically after migration; the original was kept")
+        for old_path in set(source.paths(filename)) | set(target.paths(filename)):
+            if old_path != path:
+                _remove(old_path)
+        if number % 1000 == 0:
+            print(f"Migrated {number}/{len(filenames)} notes")
+
+    if layout == "flat":
+        _remove(os.path.join(folder, LAYOUT_FILE))
+        # Emptied shard directories go too; dictionaries are kept in case the folder is sharded again
+        for top in os.listdir(folder):
+            top_path = os.path.join(folder, top)
+            if len(top) == 2 and os.path.isdir(top_path):
+                for sub in os.listdir(top_path):
+                    if not os.listdir(os.path.join(top_path, sub)):
+                        os.rmdir(os.path.join(top_path, sub))
+                if not os.listdir(top_path):
+                    os.rmdir(top_path)
+    with _stores_lock:
+        _stores.pop(folder, None)
+    return len(filenames), size_before, target.size_on_disk()
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage how generated notes are stored on disk")
+    parser.add_argument("command", choices=["migrate"], help="migrate: move every note into another layout")
+    parser.add_argument("--to", choices=LAYOUTS, default="sharded", help="Target layout")
+    parser.add_argument("--folder", default=settings.NOTES_FOLDER, help="Notes folder")
+    parser.add_argument("--train-dictionary", action="store_true", help="Train a zstd dictionary on the notes first")
+    parser.add_argument("--dictionary-samples", type=int, default=2000, help="Notes sampled to train the dictionary")
+    parser.add_argument("--dictionary-size", type=int, default=112640, help="Dictionary size in bytes")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        print("Stop the app and any workers before migrating")
+        count, before, after = migrate(args.folder, args.to, args.train_dictionary, args.dictionary_samples, args.dictionary_size)
+        saved = 1 - after / before if before else 0
+        print(f"Migrated {count} notes to {args.to}: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB ({saved:.0%} saved)")
+
+if __name__ == "__main__":
+    main()
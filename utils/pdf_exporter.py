@@ -0,0 +1,127 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from config.settings import settings
+from utils.metrics import instrumented, record_cache
+
+# Paragraph styles, built on the first export; reportlab is only imported then
+_styles = None
+
+def _get_styles():
+    """Heading and body styles, built once per process instead of per export"""
+    global _styles
+    if _styles is None:
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        base = getSampleStyleSheet()
+        _styles = {
+            "heading1": ParagraphStyle(
+                'Heading1',
+                parent=base['Heading1'],
+                fontSize=18,
+                spaceAfter=12,
+                spaceBefore=12,
+                fontName='Helvetica-Bold'
+            ),
+            "heading2": ParagraphStyle(
+                'Heading2',
+                parent=base['Heading2'],
+                fontSize=16,
+                spaceAfter=10,
+                spaceBefore=10,
+                fontName='Helvetica-Bold'
+            ),
+            "heading3": ParagraphStyle(
+                'Heading3',
+                parent=base['Heading3'],
+                fontSize=14,
+                spaceAfter=8,
+                spaceBefore=8,
+                fontName='Helvetica-Bold'
+            ),
+            "normal": ParagraphStyle(
+                'Normal',
+                parent=base['Normal'],
+                fontSize=12,
+                spaceAfter=6,
+                alignment=0
+            ),
+        }
+    return _styles
+
+# Rendered PDFs keyed by the SHA-256 of their markdown, least recently used evicted first
+_pdf_cache = OrderedDict()
+_pdf_cache_lock = threading.Lock()
+
+# Emphasis and code markers, dropped in one translate pass
+_MARKDOWN_DELETIONS = str.maketrans('', '', '*`')
+
+def _strip_markdown_symbols(text):
+    return text.translate(_MARKDOWN_DELETIONS).replace('___', ' ').replace('__', ' ').replace('---', ' ')
+
+def clean_markdown_text(text):
+    """Remove markdown formatting symbols to make text cleaner"""
+    # split() with no separator collapses whitespace runs and trims the ends, like re.sub(r'\s+', ' ') plus strip()
+    return ' '.join(_strip_markdown_symbols(text).split())
+
+def clean_markdown_lines(text):
+    """clean_markdown_text of every line, with the symbols stripped from the whole document at once"""
+    return [' '.join(line.split()) for line in _strip_markdown_symbols(text).split('\n')]
+
+@instrumented("pdf.render")
+def _render_pdf(markdown_text):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+    from reportlab.lib.units import inch
+    styles = _get_styles()
+    buffer = io.BytesIO()
+    
+    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
+    
+    elements = []
+    
+    for line, cleaned_line in zip(markdown_text.split('\n'), clean_markdown_lines(markdown_text)):
+        if line.startswith('# '):
+            elements.append(Paragraph(cleaned_line.replace('# ', ''), styles["heading1"]))
+        elif line.startswith('## '):
+            elements.append(Paragraph(cleaned_line.replace('## ', ''), styles["heading2"]))
+        elif line.startswith('### '):
+            elements.append(Paragraph(cleaned_line.replace('### ', ''), styles["heading3"]))
+        elif line.startswith('- ') or line.startswith('* '):
+            elements.append(Paragraph(f"• {cleaned_line[2:]}", styles["normal"]))
+        elif line.strip() == '':
+            elements.append(Spacer(1, 0.2*inch))
+        else:
+            clean_text = cleaned_line.replace('<', '<').replace('>', '>')
+            elements.append(Paragraph(clean_text, styles["normal"]))
+    
+    doc.build(elements)
+    
+    pdf_data = buffer.getvalue()
+    buffer.close()
+    
+    return pdf_data
+
+def markdown_to_pdf(markdown_text, filename=None):
+    """Convert markdown text to PDF using reportlab (Unicode compatible) with cleaned formatting
+    
+    Results are cached by content hash, so exporting the same note again is free.
+    """
+    key = hashlib.sha256(markdown_text.encode("utf-8")).hexdigest()
+    
+    with _pdf_cache_lock:
+        pdf_data = _pdf_cache.get(key)
+        if pdf_data is not None:
+            _pdf_cache.move_to_end(key)
+    record_cache("pdf_render", pdf_data is not None)
+    if pdf_data is not None:
+        return pdf_data
+    
+    pdf_data = _render_pdf(markdown_text)
+    
+    with _pdf_cache_lock:
+        _pdf_cache[key] = pdf_data
+        while len(_pdf_cache) > settings.PDF_RENDER_CACHE_SIZE:
+            _pdf_cache.popitem(last=False)
+    
+    return pdf_data
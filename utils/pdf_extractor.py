@@ -0,0 +1,203 @@
+import json
+import mmap
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from config.settings import settings
+from utils.metrics import peak_rss_mb, record_cache, timed
+
+# Whole documents being extracted at once in this process; later ones wait for a slot
+_extraction_slots = threading.BoundedSemaphore(max(1, settings.PDF_MAX_CONCURRENT_EXTRACTIONS))
+
+def _needs_layout_fallback(text):
+    """Heuristic for pages where pypdf's fast extraction is empty or garbled"""
+    stripped = text.strip()
+    if not stripped:
+        return True
+    if '\ufffd' in stripped and stripped.count('\ufffd') / len(stripped) > 0.01:
+        return True
+    # Words glued together usually means the page relies on positioned text runs
+    if len(stripped) > 200 and stripped.count(' ') / len(stripped) < 0.05:
+        return True
+    return False
+
+@contextmanager
+def _open_reader(file_path):
+    """pypdf reader over a read-only memory map of the file
+    
+    Given a path, pypdf reads the whole file into memory; a memory map lets the OS page
+    the PDF in on demand and share those pages between the extraction processes.
+    """
+    from pypdf import PdfReader
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        yield PdfReader(data)
+
+def _extract_page_range(file_path, start, end, engine="auto"):
+    """Extract text for pages [start, end); runs inside a worker process"""
+    if engine == "pdfplumber":
+        return _extract_reader_pages(None, file_path, start, end, engine)
+    with _open_reader(file_path) as reader:
+        return _extract_reader_pages(reader, file_path, start, end, engine)
+
+def _extract_reader_pages(reader, file_path, start, end, engine):
+    texts = []
+    plumber = None
+    try:
+        for index in range(start, end):
+            text = ""
+            if reader is not None:
+                try:
+                    text = reader.pages[index].extract_text() or ""
+                except Exception:
+                    text = ""
+            
+            if engine == "pdfplumber" or (engine == "auto" and _needs_layout_fallback(text)):
+                if plumber is None:
+                    import pdfplumber
+                    plumber = pdfplumber.open(file_path)
+                text = plumber.pages[index].extract_text() or text
+            
+            texts.append(text)
+    finally:
+        if plumber is not None:
+            plumber.close()
+    return texts
+
+def count_pages(file_path):
+    """Return the number of pages in a PDF"""
+    with _open_reader(file_path) as reader:
+        return len(reader.pages)
+
+def _page_cache_path(file_path):
+    return f"{file_path}.pages.jsonl"
+
+def _page_cache_header(file_path, engine):
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime": int(stat.st_mtime), "engine": engine}
+
+def _read_page_cache(file_path, engine):
+    """Return cached page texts if the sidecar matches the file, else None"""
+    cache_path = _page_cache_path(file_path)
+    if not os.path.exists(cache_path):
+        return None
+    
+    expected = _page_cache_header(file_path, engine)
+    with open(cache_path, "r", encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        if any(header.get(name) != value for name, value in expected.items()):
+            return None
+        texts = [json.loads(line)["text"] for line in f]
+    
+    if len(texts) != header.get("pages"):
+        return None
+    return texts
+
+def iter_page_texts(file_path, workers=None):
+    """Yield (page_index, text) for every page of a PDF, in page order
+    
+    Results are cached in a JSONL sidecar next to the PDF so a known document is never
+    extracted twice. Everything else is delegated to _extract_pages.
+    """
+    engine = settings.PDF_EXTRACT_ENGINE
+    if not settings.PDF_PAGE_CACHE_ENABLED:
+        yield from _extract_pages(file_path, workers)
+        return
+    
+    cached = _read_page_cache(file_path, engine)
+    record_cache("pdf_pages", cached is not None)
+    if cached is not None:
+        yield from enumerate(cached)
+        return
+    
+    cache_path = _page_cache_path(file_path)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    header = _page_cache_header(file_path, engine)
+    header["pages"] = count_pages(file_path)
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+            for index, text in _extract_pages(file_path, workers):
+                f.write(json.dumps({"text": text}, ensure_ascii=False) + "\n")
+                yield index, text
+        # Only a fully extracted document becomes visible as a cache entry
+        os.replace(tmp_path, cache_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _extract_pages(file_path, workers=None):
+    """Extract (page_index, text) for every page of a PDF, in page order
+    
+    Page ranges of PDF_PAGES_PER_SHARD pages are extracted in a process pool once a
+    document reaches PDF_PARALLEL_MIN_PAGES pages. Only a bounded number of shards are
+    in flight at a time, so pages stream out as soon as their shard is done.
+    """
+    engine = settings.PDF_EXTRACT_ENGINE
+    total = count_pages(file_path)
+    shard_size = max(1, settings.PDF_PAGES_PER_SHARD)
+    shards = [(start, min(start + shard_size, total)) for start in range(0, total, shard_size)]
+    
+    if workers is None:
+        workers = settings.PDF_EXTRACT_WORKERS or os.cpu_count() or 1
+    
+    if workers <= 1 or total < settings.PDF_PARALLEL_MIN_PAGES:
+        for start, end in shards:
+            for offset, text in enumerate(_extract_page_range(file_path, start, end, engine)):
+                yield start + offset, text
+        return
+    
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        pending = deque()
+        remaining = iter(shards)
+        for start, end in remaining:
+            pending.append((start, executor.submit(_extract_page_range, file_path, start, end, engine)))
+            if len(pending) >= workers * 2:
+                break
+        
+        while pending:
+            start, future = pending.popleft()
+            next_shard = next(remaining, None)
+            if next_shard is not None:
+                pending.append((next_shard[0], executor.submit(_extract_page_range, file_path, *next_shard, engine)))
+            for offset, text in enumerate(future.result()):
+                yield start + offset, text
+    finally:
+        # Stop queued shards if the caller abandons the generator early
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def extract_pdf_text(file_path, workers=None, max_chars=None):
+    """Extract the text of a whole PDF, pages separated by blank lines
+    
+    Memory is bounded for large uploads: at most PDF_MAX_CONCURRENT_EXTRACTIONS documents
+    are extracted at once per process, pages are read one at a time from a memory map, and
+    extraction stops once max_chars characters (PDF_MAX_TEXT_CHARS by default) are collected.
+    The peak memory of the process is logged with the pdf.extract timing.
+    """
+    if max_chars is None:
+        max_chars = settings.PDF_MAX_TEXT_CHARS
+    
+    with _extraction_slots, timed("pdf.extract") as fields:
+        texts = []
+        size = 0
+        pages = iter_page_texts(file_path, workers)
+        try:
+            for index, text in pages:
+                if not text:
+                    continue
+                if max_chars and size + len(text) > max_chars:
+                    texts.append(text[:max(0, max_chars - size)])
+                    size = max_chars
+                    fields["truncated_at_page"] = index + 1
+                    print(f"Stopped extracting {file_path} at page {index + 1}: its text exceeds {max_chars} characters")
+                    break
+                texts.append(text)
+                size += len(text) + 2
+        finally:
+            # Stops any extraction shards still queued when the limit is reached
+            pages.close()
+        fields["chars"] = size
+        fields["peak_rss_mb"] = peak_rss_mb()
+    return "\n\n".join(texts)
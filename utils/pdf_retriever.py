@@ -0,0 +1,131 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from config.settings import settings
+from utils.response_cache import content_hash
+from utils.text_processor import split_into_chunks
+
+_QUERY_TERM = re.compile(r'\w+', re.UNICODE)
+
+def _match_query(query):
+    """Turn a topic into an FTS5 query where any word may match; BM25 ranks chunks matching more of them higher"""
+    terms = [term for term in _QUERY_TERM.findall(query) if len(term) > 1]
+    if not terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in dict.fromkeys(terms))
+
+class PdfChunkIndex:
+    """BM25 index over small chunks of extracted PDF text, one document per distinct content"""
+
+    def __init__(self, db_path, chunk_size=2000, overlap=200, max_documents=200):
+        self.db_path = db_path
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.max_documents = max_documents
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS documents (
+                    doc_id TEXT PRIMARY KEY,
+                    chunk_size INTEGER NOT NULL,
+                    overlap INTEGER NOT NULL,
+                    chunk_count INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_last_access ON documents(last_access)")
+            conn.execute(
+                """CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(
+                    doc_id UNINDEXED, position UNINDEXED, body, tokenize = 'porter unicode61'
+                )"""
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _delete(self, conn, doc_id):
+        conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+        conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+
+    def add_document(self, text):
+        """Chunk and index text unless it is already indexed; returns its document id"""
+        doc_id = content_hash(text)
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT chunk_size, overlap FROM documents WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+            if row == (self.chunk_size, self.overlap):
+                conn.execute("UPDATE documents SET last_access = ? WHERE doc_id = ?", (time.time(), doc_id))
+                return doc_id
+
+            self._delete(conn, doc_id)
+            chunks = split_into_chunks(text, self.chunk_size, self.overlap)
+            conn.executemany(
+                "INSERT INTO chunks (doc_id, position, body) VALUES (?, ?, ?)",
+                [(doc_id, position, chunk) for position, chunk in enumerate(chunks)],
+            )
+            conn.execute(
+                "INSERT INTO documents (doc_id, chunk_size, overlap, chunk_count, last_access) VALUES (?, ?, ?, ?, ?)",
+                (doc_id, self.chunk_size, self.overlap, len(chunks), time.time()),
+            )
+
+            # Evict the least recently used documents beyond max_documents
+            stale = conn.execute(
+                "SELECT doc_id FROM documents ORDER BY last_access DESC LIMIT -1 OFFSET ?",
+                (self.max_documents,),
+            ).fetchall()
+            for (stale_id,) in stale:
+                self._delete(conn, stale_id)
+        return doc_id
+
+    def retrieve(self, doc_id, query, k=8):
+        """Return the k chunks of a document that best match query as (position, text) in document order"""
+        match = _match_query(query)
+        if match is None:
+            return []
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                """SELECT position, body FROM chunks
+                   WHERE chunks MATCH ? AND doc_id = ?
+                   ORDER BY bm25(chunks)
+                   LIMIT ?""",
+                (match, doc_id, k),
+            ).fetchall()
+            conn.execute("UPDATE documents SET last_access = ? WHERE doc_id = ?", (time.time(), doc_id))
+        return sorted((int(position), body) for position, body in rows)
+
+    def chunk_count(self, doc_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT chunk_count FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return row[0] if row else 0
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM chunks")
+            conn.execute("DELETE FROM documents")
+
+_chunk_index = None
+_chunk_index_lock = threading.Lock()
+
+def get_chunk_index():
+    """Shared PDF chunk index stored under CACHE_FOLDER"""
+    global _chunk_index
+    with _chunk_index_lock:
+        if _chunk_index is None:
+            settings.ensure_folders()
+            _chunk_index = PdfChunkIndex(
+                os.path.join(settings.CACHE_FOLDER, "pdf_chunks.sqlite3"),
+                chunk_size=settings.PDF_RETRIEVAL_CHUNK_SIZE,
+                overlap=settings.PDF_RETRIEVAL_OVERLAP,
+                max_documents=settings.PDF_RETRIEVAL_MAX_DOCUMENTS,
+            )
+        return _chunk_index
+
+def retrieve_relevant_chunks(pdf_content, topic, k=None):
+    """Index pdf_content (once per distinct content) and return the chunks most relevant to topic"""
+    index = get_chunk_index()
+    doc_id = index.add_document(pdf_content)
+    return index.retrieve(doc_id, topic, k or settings.PDF_RETRIEVAL_TOP_K)
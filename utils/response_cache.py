@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from config.settings import settings
+
+def normalize_text(text):
+    """Lowercase and collapse whitespace so trivially different prompts share a cache entry"""
+    return " ".join(str(text).lower().split())
+
+def content_hash(text):
+    """SHA-256 of a piece of text, used to key cache entries on large inputs like PDF content"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def make_cache_key(kind, model, temperature, **parts):
+    """Build a content-addressed key from the request kind, model, temperature and inputs"""
+    payload = {
+        "kind": kind,
+        "model": model,
+        "temperature": float(temperature),
+        "parts": {name: normalize_text(value) if value is not None else None for name, value in parts.items()},
+    }
+    return content_hash(json.dumps(payload, sort_keys=True))
+
+class ResponseCache:
+    """SQLite-backed LLM response cache with TTL expiry and LRU eviction"""
+
+    def __init__(self, db_path, max_entries=1000, ttl=7 * 24 * 3600):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    content TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def get(self, key):
+        """Return the cached content for key, or None if missing or expired"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT content, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            content, created_at = row
+            if self.ttl and now - created_at > self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            return content
+
+    def set(self, key, content):
+        """Store content under key and evict the least recently used entries beyond max_entries"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, content, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, content, now, now),
+            )
+            if self.ttl:
+                conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            conn.execute(
+                """DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+
+    def delete(self, key):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """Return the process-wide response cache"""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            settings.ensure_folders()
+            _response_cache = ResponseCache(
+                os.path.join(settings.CACHE_FOLDER, "responses.sqlite3"),
+                max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+                ttl=settings.RESPONSE_CACHE_TTL,
+            )
+        return _response_cache
@@ -0,0 +1,423 @@
+import argparse
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+import numpy as np
+import faiss
+from config.settings import settings
+from utils.file_lock import file_lock
+from utils.note_store import get_note_store
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+_TIMESTAMP_SUFFIX = re.compile(r'_\d{8}_\d{6}(?:_[0-9a-f]{8})?$')
+
+# Notes are embedded by what they cover rather than by every word in them
+NOTE_SUMMARY_CHARS = 2000
+
+class HashingEmbedder:
+    """Offline embedder: signed feature hashing of word unigrams and bigrams
+    
+    Needs no model download, so it works without network access. Texts that share
+    vocabulary land close together, which is enough to spot repeated topics.
+    """
+
+    def __init__(self, dim=512):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text):
+        tokens = _TOKEN.findall(text.lower())
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+                vectors[row, digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        # Dampen frequent terms, then normalize so inner product is cosine similarity
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        faiss.normalize_L2(vectors)
+        return vectors
+
+class SentenceTransformerEmbedder:
+    """Embedder backed by a locally available sentence-transformers model"""
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, local_files_only=True)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = f"st-{model_name}"
+
+    def embed(self, texts):
+        vectors = self.model.encode(list(texts), convert_to_numpy=True, normalize_embeddings=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+def get_embedder():
+    """Use EMBEDDING_MODEL when it can be loaded offline, else fall back to feature hashing"""
+    if settings.EMBEDDING_MODEL:
+        try:
+            return SentenceTransformerEmbedder(settings.EMBEDDING_MODEL)
+        except Exception as e:
+            print(f"Could not load embedding model {settings.EMBEDDING_MODEL} ({e}); using hashing embeddings")
+    return HashingEmbedder(settings.EMBEDDING_DIM)
+
+def note_subject(filename):
+    """What a note is about, from its filename without the timestamp: 'Python Complete'"""
+    stem = _TIMESTAMP_SUFFIX.sub("", os.path.splitext(filename)[0])
+    return stem.replace("_", " ").strip()
+
+def note_summary(filename, content):
+    """Text embedded for a note: its title and headings, plus the opening of the body"""
+    title = os.path.splitext(filename)[0].replace("_", " ")
+    headings = [line.lstrip("#").strip() for line in content.splitlines() if line.startswith("#")]
+    return "\n".join([title, *headings, content[:NOTE_SUMMARY_CHARS]])
+
+class SemanticIndex:
+    """FAISS inner-product index over notes and PDF chunks, persisted under CACHE_FOLDER
+    
+    Items are addressed by (kind, ref), e.g. ("note", filename) or ("pdf_chunk",
+    "<sha256>#3"). Re-adding an unchanged item is a no-op, so callers can upsert freely.
+    
+    Changes are appended to a journal rather than rewriting the whole index on every
+    save; the snapshot is rewritten once the journal holds SEMANTIC_INDEX_COMPACT_AFTER
+    entries. A lock file serializes access between processes (the app, worker.py and
+    batch.py), and each one replays what the others appended before using the index.
+    """
+
+    def __init__(self, folder, embedder):
+        self.folder = folder
+        self.embedder = embedder
+        self.meta_path = os.path.join(folder, "meta.json")
+        self.journal_path = os.path.join(folder, "journal.jsonl")
+        self.lock_path = os.path.join(folder, "index.lock")
+        self._lock = threading.RLock()
+        self._depth = 0
+        # Snapshot generation loaded, and how far into its journal this process has read
+        self.generation = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+        os.makedirs(folder, exist_ok=True)
+        self._empty()
+        with self._locked():
+            pass
+
+    def _empty(self):
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.embedder.dim))
+        self.items = {}
+        self.keys = {}
+        self.next_id = 1
+
+    @contextmanager
+    def _locked(self):
+        """Hold the index across threads and processes, up to date with every other process"""
+        with self._lock:
+            if self._depth == 0:
+                # The file lock is not reentrant, so only the outermost caller takes it
+                with file_lock(self.lock_path):
+                    self._depth += 1
+                    try:
+                        self._refresh()
+                        yield
+                    finally:
+                        self._depth -= 1
+            else:
+                yield
+
+    def _journal_header(self):
+        try:
+            with open(self.journal_path, "rb") as f:
+                return json.loads(f.readline())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _refresh(self):
+        """Pick up changes written by other processes"""
+        header = self._journal_header()
+        if header is None or header.get("generation") != self.generation or header.get("embedder") != self.embedder.name:
+            self._load()
+        else:
+            self._replay()
+
+    def _load(self):
+        self._empty()
+        self.generation = 0
+        meta = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.generation = meta.get("generation", 0)
+        # Vectors from a different embedder are not comparable; start over
+        if meta is not None and meta.get("embedder") == self.embedder.name:
+            self.index = faiss.read_index(os.path.join(self.folder, meta.get("index_file", "index.faiss")))
+            self.items = {int(item_id): item for item_id, item in meta["items"].items()}
+            self.keys = {(item["kind"], item["ref"]): item_id for item_id, item in self.items.items()}
+            self.next_id = meta["next_id"]
+        header = self._journal_header()
+        if header == self._header():
+            self._journal_offset = 0
+            self._journal_entries = 0
+            self._replay()
+        else:
+            # Left over from an older snapshot, whose changes that snapshot already holds
+            self._start_journal()
+
+    def _header(self):
+        return {"generation": self.generation, "embedder": self.embedder.name}
+
+    def _start_journal(self):
+        header = (json.dumps(self._header()) + "\n").encode("utf-8")
+        tmp_path = f"{self.journal_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+        os.replace(tmp_path, self.journal_path)
+        self._journal_offset = len(header)
+        self._journal_entries = 0
+
+    def _replay(self):
+        with open(self.journal_path, "rb") as f:
+            if self._journal_offset == 0:
+                self._journal_offset = len(f.readline())
+            f.seek(self._journal_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Cut short by a crash mid-write
+                    break
+                self._apply(json.loads(line))
+                self._journal_offset += len(line)
+
+    def _apply(self, record):
+        if record["op"] == "remove":
+            for item_id in record["ids"]:
+                if item_id in self.items:
+                    self._remove_id(item_id)
+            self._journal_entries += len(record["ids"])
+            return
+        entries = record["items"]
+        for entry in entries:
+            # An upsert of an existing item replaces it
+            existing = self.keys.get((entry["item"]["kind"], entry["item"]["ref"]))
+            if existing is not None:
+                self._remove_id(existing)
+        vectors = np.frombuffer(b"".join(base64.b64decode(entry["vector"]) for entry in entries), dtype=np.float32)
+        ids = np.array([entry["id"] for entry in entries], dtype=np.int64)
+        self.index.add_with_ids(vectors.reshape(len(entries), self.embedder.dim), ids)
+        for entry in entries:
+            self.items[entry["id"]] = entry["item"]
+            self.keys[(entry["item"]["kind"], entry["item"]["ref"])] = entry["id"]
+            self.next_id = max(self.next_id, entry["id"] + 1)
+        self._journal_entries += len(entries)
+
+    def _commit(self, record):
+        """Apply a change here and append it to the journal for the other processes"""
+        self._apply(record)
+        with open(self.journal_path, "ab") as f:
+            f.write((json.dumps(record) + "\n").encode("utf-8"))
+            self._journal_offset = f.tell()
+        if self._journal_entries >= settings.SEMANTIC_INDEX_COMPACT_AFTER:
+            self.save()
+
+    def save(self):
+        """Write a new snapshot of the whole index and start an empty journal"""
+        with self._locked():
+            old_index_file = None
+            if os.path.exists(self.meta_path):
+                with open(self.meta_path, "r", encoding="utf-8") as f:
+                    old_index_file = json.load(f).get("index_file", "index.faiss")
+            self.generation += 1
+            index_file = f"index-{self.generation}.faiss"
+            tmp_index = os.path.join(self.folder, f"{index_file}.{os.getpid()}.tmp")
+            tmp_meta = f"{self.meta_path}.{os.getpid()}.tmp"
+            faiss.write_index(self.index, tmp_index)
+            os.replace(tmp_index, os.path.join(self.folder, index_file))
+            with open(tmp_meta, "w", encoding="utf-8") as f:
+                json.dump({
+                    "embedder": self.embedder.name, "generation": self.generation, "index_file": index_file,
+                    "next_id": self.next_id, "items": self.items
+                }, f)
+            # The snapshot takes effect here; a crash before the journal is replaced leaves a journal it already covers
+            os.replace(tmp_meta, self.meta_path)
+            self._start_journal()
+            if old_index_file and old_index_file != index_file and os.path.exists(os.path.join(self.folder, old_index_file)):
+                os.remove(os.path.join(self.folder, old_index_file))
+
+    def __len__(self):
+        with self._locked():
+            return len(self.items)
+
+    def upsert_many(self, entries, only_missing=False):
+        """Add or replace (kind, ref, text, extra) entries; extra is a dict stored as metadata
+        
+        With only_missing, entries already in the index are left as they are.
+        """
+        with self._locked():
+            pending = {}
+            for kind, ref, text, extra in entries:
+                digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                existing = self.keys.get((kind, ref))
+                if existing is not None and (only_missing or self.items[existing]["hash"] == digest):
+                    continue
+                pending[(kind, ref)] = (kind, ref, text, digest, extra or {})
+            
+            if not pending:
+                return
+            pending = list(pending.values())
+            vectors = self.embedder.embed([text for _, _, text, _, _ in pending])
+            record = {"op": "upsert", "items": []}
+            for offset, (kind, ref, _, digest, extra) in enumerate(pending):
+                record["items"].append({
+                    "id": self.next_id + offset,
+                    "item": {"kind": kind, "ref": ref, "hash": digest, **extra},
+                    "vector": base64.b64encode(vectors[offset].tobytes()).decode("ascii"),
+                })
+            self._commit(record)
+
+    def upsert(self, kind, ref, text, **extra):
+        self.upsert_many([(kind, ref, text, extra)])
+
+    def _remove_id(self, item_id):
+        self.index.remove_ids(np.array([item_id], dtype=np.int64))
+        item = self.items.pop(item_id)
+        self.keys.pop((item["kind"], item["ref"]), None)
+
+    def remove_many(self, keys):
+        """Remove (kind, ref) items; unknown ones are ignored"""
+        with self._locked():
+            ids = [self.keys[key] for key in keys if key in self.keys]
+            if ids:
+                self._commit({"op": "remove", "ids": ids})
+
+    def remove(self, kind, ref):
+        self.remove_many([(kind, ref)])
+
+    def clear(self):
+        with self._locked():
+            self._empty()
+            self.save()
+
+    def search(self, text, k=5, kinds=None, threshold=0.0, exclude=()):
+        """Return up to k items most similar to text as dicts with kind, ref and score"""
+        with self._locked():
+            params = None
+            candidates = len(self.items)
+            if kinds or exclude:
+                # Filtered inside the index: filtering afterwards loses matches of one kind
+                # whenever more than a fixed number of items of other kinds score higher
+                allowed = [item_id for key, item_id in self.keys.items()
+                           if (not kinds or key[0] in kinds) and key not in exclude]
+                params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(np.array(allowed, dtype=np.int64)))
+                candidates = len(allowed)
+            if not candidates:
+                return []
+            scores, ids = self.index.search(self.embedder.embed([text]), min(k, candidates), params=params)
+            results = []
+            for score, item_id in zip(scores[0].tolist(), ids[0].tolist()):
+                item = self.items.get(item_id)
+                if item is None or score < threshold:
+                    continue
+                results.append({**item, "score": score})
+            return results
+
+_semantic_index = None
+_semantic_index_lock = threading.Lock()
+
+# Entries embedded per locked batch while filling an empty index
+BACKFILL_BATCH = 256
+
+def get_semantic_index(backfill=True):
+    """Return the process-wide semantic index
+    
+    An empty index is filled from the notes folder on a background thread, so the first
+    note saved or searched in a process never waits for every note to be embedded.
+    """
+    global _semantic_index
+    with _semantic_index_lock:
+        if _semantic_index is None:
+            settings.ensure_folders()
+            _semantic_index = SemanticIndex(os.path.join(settings.CACHE_FOLDER, "semantic"), get_embedder())
+            if backfill and not len(_semantic_index):
+                threading.Thread(
+                    target=_backfill, args=(_semantic_index,), name="semantic-index-backfill", daemon=True
+                ).start()
+        return _semantic_index
+
+def _note_store_entries():
+    store = get_note_store()
+    for filename in store.iter_filenames():
+        if filename.endswith(('.md', '.txt')):
+            try:
+                content = store.read(filename)
+            except FileNotFoundError:
+                # Deleted since the folder was listed
+                continue
+            yield from _note_entries(filename, content)
+
+def _backfill(index):
+    """Index notes missing from the index, a batch at a time so other writers are not held up"""
+    try:
+        batch = []
+        for entry in _note_store_entries():
+            batch.append(entry)
+            if len(batch) >= BACKFILL_BATCH:
+                index.upsert_many(batch, only_missing=True)
+                batch = []
+        if batch:
+            index.upsert_many(batch, only_missing=True)
+    except Exception as e:
+        print(f"Semantic index backfill failed: {e}")
+
+def rebuild_semantic_index(index=None):
+    """Re-embed every note in the notes folder; PDF chunks are re-added as PDFs are processed"""
+    if index is None:
+        index = get_semantic_index(backfill=False)
+    index.clear()
+    entries = list(_note_store_entries())
+    index.upsert_many(entries)
+    return len(entries)
+
+def _note_entries(filename, content):
+    # Titles are embedded on their own so short requests can be compared like for like
+    return [
+        ("note", filename, note_summary(filename, content), None),
+        ("note_title", filename, note_subject(filename), None),
+    ]
+
+def index_note(filename, content):
+    get_semantic_index().upsert_many(_note_entries(filename, content))
+
+def unindex_note(filename):
+    get_semantic_index().remove_many([("note", filename), ("note_title", filename)])
+
+def index_pdf_chunks(doc_id, chunks, title=None):
+    """Add the chunks of a processed PDF, addressed as '<doc_id>#<chunk number>'"""
+    get_semantic_index().upsert_many(
+        [("pdf_chunk", f"{doc_id}#{i}", chunk, {"title": title}) for i, chunk in enumerate(chunks)]
+    )
+
+def find_similar_notes(subject, k=5, threshold=None):
+    """Notes whose subject is similar to a requested one, most similar first"""
+    threshold = settings.SIMILAR_NOTE_THRESHOLD if threshold is None else threshold
+    return get_semantic_index().search(subject, k, kinds=("note_title",), threshold=threshold)
+
+def related_items(filename, content, k=5):
+    """Notes and PDF sections related to a note, for the related notes panel"""
+    return get_semantic_index().search(
+        note_summary(filename, content), k, kinds=("note", "pdf_chunk"), exclude={("note", filename)}
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the semantic notes index")
+    parser.add_argument("command", choices=["rebuild"], help="rebuild: re-embed every note in the notes folder")
+    args = parser.parse_args()
+    
+    if args.command == "rebuild":
+        count = rebuild_semantic_index()
+        print(f"Embedded {count} notes")
+
+if __name__ == "__main__":
+    main()
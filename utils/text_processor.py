@@ -1,16 +1,42 @@
+import re
+
+_KEY_POINT_PREFIXES = ('#', '- ', '* ', '1. ', '2. ')
+# A line that may be a key point once stripped; the prefix is rechecked because
+# stripping can remove the space after a bare "-" or "1."
+_KEY_POINT = r'[^\S\n]*(?:#|[-*] |[12]\. )[^\n]*'
+_FIRST_KEY_POINT_LINE = re.compile(_KEY_POINT)
+# Starting with a literal newline lets the regex engine skip from line to line
+_KEY_POINT_LINE = re.compile(r'\n' + _KEY_POINT)
+
+def _key_point_candidates(text):
+    first = _FIRST_KEY_POINT_LINE.match(text)
+    if first:
+        yield first.group()
+    for match in _KEY_POINT_LINE.finditer(text):
+        yield match.group()
+
 def extract_key_points(text, max_points=10):
-    """Extract key points from text"""
-    lines = text.split('\n')
-    key_points = []
+    """Extract key points from text
     
-    for line in lines:
-        line = line.strip()
-        if line.startswith(('#', '##', '###', '- ', '* ', '1. ', '2. ')):
-            if len(key_points) < max_points:
-                key_points.append(line)
+    Headings and list items are found with one regex scan that stops at the
+    max_points-th, so long notes are not split into lines first.
+    """
+    if max_points <= 0:
+        return ''
+    key_points = []
+    for candidate in _key_point_candidates(text):
+        line = candidate.strip()
+        if line.startswith(_KEY_POINT_PREFIXES):
+            key_points.append(line)
+            if len(key_points) == max_points:
+                break
     
     return '\n'.join(key_points)
 
+def extract_key_points_batch(texts, max_points=10):
+    """Key points of many texts, in order"""
+    return [extract_key_points(text, max_points) for text in texts]
+
 def format_as_markdown(content):
     """Format content as markdown"""
 
@@ -19,7 +45,72 @@ def format_as_markdown(content):
 
 def generate_summary(text, max_length=500):
     """Generate a summary of the text"""
-    words = text.split()
+    # With maxsplit only the first max_length words are split off; anything left over
+    # comes back as one final item, which is how a longer text is recognized
+    words = text.split(None, max_length)
     if len(words) > max_length:
         return ' '.join(words[:max_length]) + '...'
-    return text
\ No newline at end of file
+    return text
+
+def generate_summaries(texts, max_length=500):
+    """Summaries of many texts, in order"""
+    return [generate_summary(text, max_length) for text in texts]
+
+# Paragraph breaks, page breaks and the start of markdown headings are natural chunk boundaries
+_BLOCK_BOUNDARY = re.compile(r'\n\s*\n|\f|\n(?=#{1,6} )')
+
+def _split_oversized(block, chunk_size):
+    """Break a block longer than chunk_size on line boundaries, slicing single overlong lines"""
+    pieces = []
+    current = ""
+    for line in block.split('\n'):
+        while len(line) > chunk_size:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:chunk_size])
+            line = line[chunk_size:]
+        if current and len(current) + len(line) + 1 > chunk_size:
+            pieces.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        pieces.append(current)
+    return pieces
+
+def split_into_chunks(text, chunk_size=12000, overlap=500):
+    """Split text into chunks of about chunk_size characters on page, heading or paragraph boundaries
+    
+    Each chunk after the first starts with the last `overlap` characters of the previous one
+    so content that straddles a boundary is seen in context.
+    """
+    if len(text) <= chunk_size:
+        return [text] if text.strip() else []
+    
+    blocks = []
+    for block in _BLOCK_BOUNDARY.split(text):
+        block = block.strip()
+        if not block:
+            continue
+        if len(block) > chunk_size:
+            blocks.extend(_split_oversized(block, chunk_size))
+        else:
+            blocks.append(block)
+    
+    chunks = []
+    current = []
+    current_len = 0
+    for block in blocks:
+        if current and current_len + len(block) > chunk_size:
+            chunk = '\n\n'.join(current)
+            chunks.append(chunk)
+            tail = chunk[-overlap:] if overlap else ""
+            current = [tail] if tail else []
+            current_len = len(tail)
+        current.append(block)
+        current_len += len(block) + 2
+    
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
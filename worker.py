@@ -0,0 +1,35 @@
+import argparse
+import threading
+from agents.jobs import run_worker
+from config.settings import settings
+from utils.metrics import start_metrics_server
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background note generation workers")
+    parser.add_argument("--threads", type=int, default=2, help="Number of jobs to run concurrently")
+    parser.add_argument("--metrics-port", type=int, default=settings.METRICS_PORT, help="Serve Prometheus metrics on this port (0 disables)")
+    args = parser.parse_args()
+    
+    start_metrics_server(args.metrics_port)
+    
+    stop_event = threading.Event()
+    workers = [
+        threading.Thread(target=run_worker, kwargs={"stop_event": stop_event}, daemon=True)
+        for _ in range(args.threads)
+    ]
+    for worker in workers:
+        worker.start()
+    
+    print(f"Running {args.threads} note generation worker(s). Press Ctrl+C to stop.")
+    try:
+        while any(worker.is_alive() for worker in workers):
+            for worker in workers:
+                worker.join(timeout=1)
+    except KeyboardInterrupt:
+        print("Stopping workers after their current jobs...")
+        stop_event.set()
+        for worker in workers:
+            worker.join()
+
+if __name__ == "__main__":
+    main()